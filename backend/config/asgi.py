@@ -13,4 +13,19 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Importar después de inicializar Django (usa modelos y settings)
+from envios.sse import PREFIJO as PREFIJO_EVENTOS  # noqa: E402
+from envios.sse import aplicacion_sse  # noqa: E402
+
+
+async def application(scope, receive, send):
+    """
+    Los streams SSE (/api/eventos/...) se sirven directamente en ASGI; el
+    resto de rutas pasan por Django.
+    """
+    if scope["type"] == "http" and scope["path"].startswith(PREFIJO_EVENTOS):
+        await aplicacion_sse(scope, receive, send)
+        return
+    await django_application(scope, receive, send)
@@ -31,7 +31,16 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Request ID y resumen estructurado de cada petición (el primero, para
+    # medir la petición completa)
+    "core.registro.RegistroPeticionesMiddleware",
+    # Métricas Prometheus por ruta y tenant (se desactiva sin
+    # prometheus_client)
+    "core.instrumentacion.InstrumentacionMiddleware",
     "django.middleware.security.SecurityMiddleware",
+    # Compresión brotli/gzip según Accept-Encoding (antes que el resto para
+    # comprimir la respuesta ya terminada)
+    "core.middleware.CompresionMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -123,6 +132,107 @@ STATIC_ROOT = os.path.join(BASE_DIR, "static")
 MEDIA_URL = "media/"
 MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 
+# Multi-tenancy: caché compartida del registro de empresas, que guarda la
+# versión con la que cada worker invalida su copia en memoria.
+# None = solo memoria del proceso: una empresa desactivada se sigue
+# sirviendo en los demás workers hasta el TTL (solo desarrollo, un proceso)
+TENANT_CACHE_ALIAS = "default"
+TENANT_CACHE_TIMEOUT = 300  # segundos
+# Perfiles de usuario resueltos por (usuario, empresa), TTL corto
+PERFIL_CACHE_ALIAS = "default"
+PERFIL_CACHE_TIMEOUT = 60  # segundos
+
+# Notificaciones por email (bandeja de salida)
+NOTIFICACIONES_DESPACHO_EN_COMMIT = True  # despachar en un hilo tras el commit
+NOTIFICACIONES_MAX_INTENTOS = 5
+NOTIFICACIONES_BACKOFF_SEGUNDOS = 60  # 60s, 120s, 240s...
+NOTIFICACIONES_RESERVA_SEGUNDOS = 300
+
+# Importación masiva de envíos
+ENVIOS_IMPORTACION_MAX_FILAS = 10000
+ENVIOS_IMPORTACION_TAMANO_LOTE = 500
+
+# Exportación por streaming: filas leídas del cursor por bloque
+EXPORTACION_CHUNK_SIZE = 2000
+
+# Etiquetas y QR: resolución de impresión y caché de etiquetas renderizadas
+# (la clave incluye ultima_actualizacion, así que no hace falta invalidar)
+ETIQUETAS_DPI = 150
+ETIQUETAS_CACHE_ALIAS = "default"
+ETIQUETAS_CACHE_TIMEOUT = 86400
+
+# Sincronización incremental de la PWA (envios.sincronizacion): filas por
+# flujo y respuesta, antigüedad mínima de los cambios (transacciones sin
+# commit) y días que se conservan las marcas de envíos borrados
+SINCRONIZACION_MAX_FILAS = 500
+SINCRONIZACION_MARGEN_SEGUNDOS = 10
+SINCRONIZACION_RETENCION_DIAS = 30
+
+# Nivel de compresión brotli de core.middleware (0-11; 5 equilibra tamaño y
+# CPU para respuestas dinámicas)
+COMPRESION_BROTLI_CALIDAD = 5
+
+# Registro estructurado (core.registro): JSON por línea a stdout desde un
+# hilo aparte. Los resúmenes de peticiones correctas se muestrean; los
+# errores y las peticiones lentas se registran siempre
+REGISTRO_PETICIONES_MUESTREO = float(
+    os.getenv("REGISTRO_PETICIONES_MUESTREO", "1.0")
+)
+REGISTRO_PETICIONES_LENTAS_MS = 1000
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {
+        "cola": {"()": "core.registro.ManejadorEnCola"},
+    },
+    "root": {"handlers": ["cola"], "level": os.getenv("LOG_LEVEL", "INFO")},
+    "loggers": {
+        "django": {"handlers": ["cola"], "level": "INFO", "propagate": False},
+        # Los 4xx ya quedan en el resumen de la petición
+        "django.request": {"level": "ERROR"},
+        "peticiones": {
+            "level": os.getenv("LOG_PETICIONES_LEVEL", "INFO"),
+        },
+    },
+}
+
+# Métricas Prometheus en /api/metrics (core.instrumentacion). Se exige
+# 'Authorization: Bearer <token>'; sin token definido el endpoint responde
+# 401 salvo con DEBUG activo
+INSTRUMENTACION_TOKEN = os.getenv("INSTRUMENTACION_TOKEN")
+
+# Caché usada por los throttles de core.throttling
+THROTTLE_CACHE_ALIAS = "default"
+
+# Rastreo público: snapshots cacheados y max-age para nginx/clientes
+RASTREO_CACHE_ALIAS = "default"
+RASTREO_SNAPSHOT_TIMEOUT = 300
+# Guías inexistentes recordadas en caché (segundos)
+RASTREO_NO_ENCONTRADO_TIMEOUT = 30
+RASTREO_CACHE_MAX_AGE = 30
+# Guías por petición en el rastreo en lote (cada una cuenta como una
+# consulta en los límites públicos)
+RASTREO_LOTE_MAX_GUIAS = 20
+
+# Eventos en tiempo real (SSE): broker en memoria o Redis Streams
+EVENTOS_BROKER = "envios.eventos.MemoriaBroker"
+EVENTOS_REDIS_URL = "redis://redis:6379/2"
+EVENTOS_HISTORIAL = 100
+EVENTOS_KEEPALIVE_SEGUNDOS = 15
+# Streams SSE abiertos a la vez por proceso y por IP (envios.sse)
+EVENTOS_MAX_CONEXIONES = 1000
+EVENTOS_MAX_CONEXIONES_IP = 10
+# Vigencia de los tickets de un solo uso del stream de la empresa
+EVENTOS_TICKET_SEGUNDOS = 30
+
+# Rollups de métricas (manage.py agregar_metricas): antigüedad mínima del
+# historial para agregarlo, así no se saltan transacciones sin commit
+METRICAS_MARGEN_SEGUNDOS = 60
+
+# Paginación por keyset (core.pagination.KeysetPagination)
+PAGINACION_MAX_PAGE_SIZE = 100
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
@@ -138,6 +248,23 @@ REST_FRAMEWORK = {
     "DEFAULT_PERMISSION_CLASSES": [
         "rest_framework.permissions.IsAuthenticated",
     ],
+    # JSON por defecto; MessagePack con Accept: application/msgpack
+    "DEFAULT_RENDERER_CLASSES": [
+        "rest_framework.renderers.JSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+        "core.renderers.MessagePackRenderer",
+    ],
+    # Proxies de confianza delante de Django (nginx en producción = 1).
+    # Con 0 la IP de los throttles es REMOTE_ADDR; sin fijarlo, DRF usaría
+    # el X-Forwarded-For que envía el cliente y bastaría con cambiarlo
+    # para saltarse los límites por IP
+    "NUM_PROXIES": int(os.getenv("NUM_PROXIES", "0")),
+    # Tasas de core.throttling para los endpoints públicos
+    "DEFAULT_THROTTLE_RATES": {
+        "publico_ip": "300/hour",
+        "publico_ip_rafaga": "30/min",
+        "rastreo_guia": "60/min",
+    },
 }
 
 # Simple JWT settings
@@ -53,6 +53,12 @@ CACHES = {
     }
 }
 
+# Registro de empresas compartido entre workers
+TENANT_CACHE_ALIAS = 'default'
+
+# Eventos SSE compartidos entre workers
+EVENTOS_BROKER = 'envios.eventos.RedisBroker'
+
 # Session engine
 SESSION_ENGINE = 'django.contrib.sessions.backends.cache'
 SESSION_CACHE_ALIAS = 'default'
@@ -65,38 +71,7 @@ EMAIL_USE_TLS = True
 EMAIL_HOST_USER = os.environ.get('EMAIL_HOST_USER')
 EMAIL_HOST_PASSWORD = os.environ.get('EMAIL_HOST_PASSWORD')
 
-# Logging para producción
-LOGGING = {
-    'version': 1,
-    'disable_existing_loggers': False,
-    'formatters': {
-        'verbose': {
-            'format': '{levelname} {asctime} {module} {process:d} {thread:d} {message}',
-            'style': '{',
-        },
-    },
-    'handlers': {
-        'file': {
-            'level': 'INFO',
-            'class': 'logging.FileHandler',
-            'filename': '/app/logs/django.log',
-            'formatter': 'verbose',
-        },
-        'console': {
-            'level': 'INFO',
-            'class': 'logging.StreamHandler',
-            'formatter': 'verbose',
-        },
-    },
-    'root': {
-        'handlers': ['file', 'console'],
-        'level': 'INFO',
-    },
-    'loggers': {
-        'django': {
-            'handlers': ['file', 'console'],
-            'level': 'INFO',
-            'propagate': False,
-        },
-    },
-}
+# Logging: se usa el de config.settings (una línea JSON por registro en
+# stdout, escrita desde un hilo aparte por core.registro.ManejadorEnCola,
+# con request_id y los niveles de 'peticiones' y 'django.request').
+# Docker recoge stdout; LOG_LEVEL y LOG_PETICIONES_LEVEL ajustan los niveles
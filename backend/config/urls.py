@@ -15,6 +15,7 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 
+from core.instrumentacion import vista_metricas
 from django.conf import settings
 from django.conf.urls.static import static
 from django.contrib import admin
@@ -73,6 +74,8 @@ urlpatterns = [
     # API endpoints
     path("api/", include(router.urls)),
     path("api/health/", health_check, name="health_check"),
+    # Métricas Prometheus (latencia, consultas, caché y tamaño por ruta)
+    path("api/metrics", vista_metricas, name="metricas"),
     path(
         "api/auth/login/",
         TokenObtainPairView.as_view(),
@@ -0,0 +1,107 @@
+"""
+Selección de campos en las respuestas de la API (sparse fieldsets).
+
+Parámetros de consulta, con nombres separados por comas:
+- fields: devolver solo estos campos
+- omit: quitar estos campos
+- expand: añadir campos que la vista no incluye por defecto (los
+  `expandibles` del serializer, p. ej. el historial en el listado de envíos)
+
+Solo afectan a la representación del serializer raíz: la validación de las
+escrituras no cambia y los serializers anidados que no se piden no llegan
+a evaluarse. Las vistas usan campo_incluido para no precargar relaciones
+que no se van a serializar.
+"""
+
+from rest_framework import serializers
+
+PARAMETRO_CAMPOS = "fields"
+PARAMETRO_OMITIR = "omit"
+PARAMETRO_EXPANDIR = "expand"
+
+
+def _lista(request, parametro):
+    valor = request.query_params.get(parametro)
+    if valor is None:
+        return None
+    return {nombre.strip() for nombre in valor.split(",") if nombre.strip()}
+
+
+def parametros_campos(request):
+    """
+    (campos, omitidos, expandidos) pedidos en la petición. campos es None
+    si no se indicó ?fields=.
+    """
+    if request is None or not hasattr(request, "query_params"):
+        return None, set(), set()
+    return (
+        _lista(request, PARAMETRO_CAMPOS),
+        _lista(request, PARAMETRO_OMITIR) or set(),
+        _lista(request, PARAMETRO_EXPANDIR) or set(),
+    )
+
+
+def campo_incluido(request, nombre, por_defecto=True):
+    """
+    Indica si la respuesta incluirá el campo `nombre`. por_defecto=False
+    para los campos expandibles, que solo se incluyen si se piden.
+    """
+    campos, omitidos, expandidos = parametros_campos(request)
+    if nombre in expandidos:
+        return True
+    if nombre in omitidos:
+        return False
+    if campos is not None:
+        return nombre in campos
+    return por_defecto
+
+
+class CamposDinamicosMixin:
+    """
+    Mixin para ModelSerializer que aplica ?fields=, ?omit= y ?expand= de la
+    petición del contexto. Los campos expandibles se declaran en
+    Meta.expandibles y deben estar declarados en el serializer (o en uno
+    padre) aunque no figuren en Meta.fields.
+    """
+
+    def _es_raiz(self):
+        padre = self.parent
+        if isinstance(padre, serializers.ListSerializer):
+            padre = padre.parent
+        return padre is None
+
+    def _parametros(self):
+        # Con many=True el mismo serializer hijo representa cada elemento:
+        # los parámetros se leen una sola vez
+        if not hasattr(self, "_parametros_campos"):
+            if self._es_raiz():
+                self._parametros_campos = parametros_campos(
+                    self.context.get("request")
+                )
+            else:
+                self._parametros_campos = None, set(), set()
+        return self._parametros_campos
+
+    def get_field_names(self, declared_fields, info):
+        nombres = list(super().get_field_names(declared_fields, info))
+        campos, _, expandidos = self._parametros()
+        for nombre in getattr(self.Meta, "expandibles", ()):
+            pedido = nombre in expandidos or (campos and nombre in campos)
+            if pedido and nombre not in nombres:
+                nombres.append(nombre)
+        return nombres
+
+    @property
+    def _readable_fields(self):
+        campos, omitidos, expandidos = self._parametros()
+        for campo in super()._readable_fields:
+            nombre = campo.field_name
+            if nombre in omitidos and nombre not in expandidos:
+                continue
+            if (
+                campos is not None
+                and nombre not in campos
+                and nombre not in expandidos
+            ):
+                continue
+            yield campo
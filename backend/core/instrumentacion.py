@@ -0,0 +1,189 @@
+"""
+Métricas de rendimiento en formato Prometheus (/api/metrics).
+
+InstrumentacionMiddleware registra, por ruta de DRF (el patrón de la URL,
+no la ruta con IDs) y tenant:
+
+- packfy_peticion_duracion_segundos: latencia de la petición
+- packfy_peticion_consultas: consultas a la BD por petición
+- packfy_peticion_consultas_duracion_segundos: tiempo en la BD por petición
+- packfy_respuesta_bytes: tamaño de las respuestas no streaming
+- packfy_cache_operaciones_total: aciertos y fallos de las cachés de la
+  aplicación (rastreo, etiquetas, perfiles, tenants), que se anotan con
+  registrar_cache
+
+Con gunicorn cada worker tiene sus propios contadores: si la variable
+PROMETHEUS_MULTIPROC_DIR está definida al arrancar (gunicorn.conf.py lo
+hace), prometheus_client los guarda en ficheros de ese directorio y
+/api/metrics agrega los de todos los workers.
+
+prometheus_client es opcional: sin él el middleware se desactiva y
+/api/metrics responde 503.
+"""
+
+import contextvars
+import os
+import time
+from collections import Counter
+from hmac import compare_digest
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from django.http import HttpResponse, JsonResponse
+
+from .registro import ruta_peticion
+
+try:
+    import prometheus_client
+    from prometheus_client import multiprocess
+except ImportError:
+    prometheus_client = None
+
+BUCKETS_CONSULTAS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+BUCKETS_BYTES = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+# Ruta de las peticiones que no resuelven ninguna URL (404): una sola serie
+SIN_RUTA = "<sin_ruta>"
+
+# Operaciones de caché de la petición en curso: {(uso, resultado): n}
+_cache_actual = contextvars.ContextVar("cache_actual", default=None)
+
+if prometheus_client is not None:
+    ETIQUETAS = ("metodo", "ruta", "tenant")
+
+    DURACION = prometheus_client.Histogram(
+        "packfy_peticion_duracion_segundos",
+        "Latencia de las peticiones HTTP",
+        ETIQUETAS + ("estado",),
+    )
+    CONSULTAS = prometheus_client.Histogram(
+        "packfy_peticion_consultas",
+        "Consultas a la base de datos por petición",
+        ETIQUETAS,
+        buckets=BUCKETS_CONSULTAS,
+    )
+    DURACION_CONSULTAS = prometheus_client.Histogram(
+        "packfy_peticion_consultas_duracion_segundos",
+        "Tiempo en la base de datos por petición",
+        ETIQUETAS,
+    )
+    TAMANO = prometheus_client.Histogram(
+        "packfy_respuesta_bytes",
+        "Tamaño de las respuestas (sin streaming)",
+        ETIQUETAS,
+        buckets=BUCKETS_BYTES,
+    )
+    CACHE = prometheus_client.Counter(
+        "packfy_cache_operaciones",
+        "Lecturas de las cachés de la aplicación",
+        ("ruta", "tenant", "uso", "resultado"),
+    )
+
+
+def registrar_cache(uso, aciertos=0, fallos=0):
+    """
+    Anota lecturas de caché (`uso`: rastreo, etiquetas, perfiles...). Dentro
+    de una petición se atribuyen a su ruta y tenant al terminar; fuera de
+    ellas (comandos, hilos) se cuentan sin ruta.
+    """
+    if prometheus_client is None:
+        return
+    operaciones = _cache_actual.get()
+    if operaciones is None:
+        if aciertos:
+            CACHE.labels("", "", uso, "acierto").inc(aciertos)
+        if fallos:
+            CACHE.labels("", "", uso, "fallo").inc(fallos)
+        return
+    operaciones[(uso, "acierto")] += aciertos
+    operaciones[(uso, "fallo")] += fallos
+
+
+class InstrumentacionMiddleware:
+    """
+    Va justo después de RegistroPeticionesMiddleware para medir la
+    petición completa.
+    """
+
+    def __init__(self, get_response):
+        if prometheus_client is None:
+            raise MiddlewareNotUsed("prometheus_client no está instalado")
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if request.path == "/api/metrics":
+            return self.get_response(request)
+
+        consultas = [0, 0.0]
+
+        def medir(execute, sql, params, many, context):
+            inicio = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                consultas[0] += 1
+                consultas[1] += time.perf_counter() - inicio
+
+        operaciones = Counter()
+        token = _cache_actual.set(operaciones)
+        inicio = time.perf_counter()
+        try:
+            with connection.execute_wrapper(medir):
+                response = self.get_response(request)
+        finally:
+            _cache_actual.reset(token)
+        duracion = time.perf_counter() - inicio
+
+        tenant = getattr(request, "tenant", None)
+        ruta = ruta_peticion(request) or SIN_RUTA
+        slug = tenant.slug if tenant else ""
+        etiquetas = (request.method, ruta, slug)
+
+        DURACION.labels(*etiquetas, str(response.status_code)).observe(
+            duracion
+        )
+        CONSULTAS.labels(*etiquetas).observe(consultas[0])
+        DURACION_CONSULTAS.labels(*etiquetas).observe(consultas[1])
+        if not response.streaming:
+            TAMANO.labels(*etiquetas).observe(len(response.content))
+        for (uso, resultado), total in operaciones.items():
+            if total:
+                CACHE.labels(ruta, slug, uso, resultado).inc(total)
+        return response
+
+
+def _registro():
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registro = prometheus_client.CollectorRegistry()
+        multiprocess.MultiProcessCollector(registro)
+        return registro
+    return prometheus_client.REGISTRY
+
+
+def vista_metricas(request):
+    """
+    Métricas en formato de texto de Prometheus. Se exige
+    'Authorization: Bearer <INSTRUMENTACION_TOKEN>'; sin token configurado
+    solo se sirven con DEBUG activo.
+    """
+    if prometheus_client is None:
+        return JsonResponse(
+            {"error": "prometheus_client no está instalado"}, status=503
+        )
+
+    token = getattr(settings, "INSTRUMENTACION_TOKEN", None)
+    if token:
+        autorizado = compare_digest(
+            request.META.get("HTTP_AUTHORIZATION", "").encode("utf-8"),
+            f"Bearer {token}".encode("utf-8"),
+        )
+    else:
+        autorizado = settings.DEBUG
+    if not autorizado:
+        return JsonResponse({"error": "No autorizado"}, status=401)
+
+    return HttpResponse(
+        prometheus_client.generate_latest(_registro()),
+        content_type=prometheus_client.CONTENT_TYPE_LATEST,
+    )
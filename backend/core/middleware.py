@@ -0,0 +1,55 @@
+"""
+Compresión de respuestas negociada con Accept-Encoding.
+
+Brotli cuando el cliente lo acepta y el paquete 'brotli' está instalado
+(comprime JSON bastante mejor que gzip); gzip con GZipMiddleware de Django
+en cualquier otro caso, incluidas las respuestas por streaming.
+"""
+
+import re
+
+from django.conf import settings
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+
+ACEPTA_BROTLI = re.compile(r"\bbr\b")
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+class CompresionMiddleware(GZipMiddleware):
+    def process_response(self, request, response):
+        if (
+            brotli is None
+            or response.streaming
+            or response.has_header("Content-Encoding")
+            or not ACEPTA_BROTLI.search(
+                request.META.get("HTTP_ACCEPT_ENCODING", "")
+            )
+        ):
+            return super().process_response(request, response)
+
+        # Mismo umbral que GZipMiddleware: no compensa por debajo
+        if len(response.content) < 200:
+            return response
+
+        patch_vary_headers(response, ("Accept-Encoding",))
+        comprimido = brotli.compress(
+            response.content,
+            quality=getattr(settings, "COMPRESION_BROTLI_CALIDAD", 5),
+        )
+        if len(comprimido) >= len(response.content):
+            return response
+
+        response.content = comprimido
+        response["Content-Length"] = str(len(comprimido))
+        if response.has_header("ETag"):
+            # Igual que GZipMiddleware: el ETag pasa a ser débil
+            response["ETag"] = re.sub(
+                r"^(W/)?", "W/", response["ETag"], count=1
+            )
+        response["Content-Encoding"] = "br"
+        return response
@@ -0,0 +1,273 @@
+"""
+Paginación por keyset (cursor) para listados grandes.
+
+A diferencia de PageNumberPagination, no usa OFFSET ni COUNT(*): cada página
+continúa a partir de la clave (p. ej. fecha_creacion, id) del último
+elemento de la anterior, así que el coste es constante a cualquier
+profundidad si existe un índice sobre esa clave.
+"""
+
+import json
+from base64 import b64decode, b64encode
+from binascii import Error as BinasciiError
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db import connection
+from django.db.models import Q
+from rest_framework import filters
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+def contar_aproximado(queryset):
+    """
+    Estimación del número de filas de un queryset.
+
+    En PostgreSQL usa la estimación del planificador (EXPLAIN), que no
+    recorre la tabla; en otros motores hace un COUNT(*) normal.
+    """
+    if connection.vendor != "postgresql":
+        return queryset.count()
+
+    plan = json.loads(queryset.order_by().explain(format="json"))
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+class KeysetPagination(PageNumberPagination):
+    """
+    Paginación por cursor sobre una clave de ordenación única.
+
+    Parámetros:
+    - cursor: posición opaca devuelta en 'next'/'previous'
+    - page_size: tamaño de página (máximo PAGINACION_MAX_PAGE_SIZE)
+    - count: 'aprox' (estimación del planificador) o 'exacto'; sin él la
+      respuesta no incluye 'count'
+
+    La ordenación por defecto la fija `ordering` (el último campo debe ser
+    único, p. ej. el id). Si la vista usa OrderingFilter, un ?ordering= con
+    un único campo no nulo de sus ordering_fields se pagina por keyset sobre
+    (campo, id) en ese sentido.
+
+    Se usa la paginación por número de página de siempre, con su 'count':
+    - si el cliente envía ?page= (para no romper a los clientes existentes)
+    - con ?search= (el orden por relevancia no admite cursor)
+    - con un ?ordering= que no se puede expresar como keyset (varios campos
+      o un campo que admite NULL)
+    """
+
+    ordering = ("-fecha_creacion", "-id")
+    page_size_query_param = "page_size"
+    cursor_query_param = "cursor"
+    count_query_param = "count"
+
+    @property
+    def max_page_size(self):
+        return getattr(settings, "PAGINACION_MAX_PAGE_SIZE", 100)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        ordenacion = self.get_ordenacion(request, queryset, view)
+        self.por_paginas = (
+            ordenacion is None or self.page_query_param in request.query_params
+        )
+        if self.por_paginas:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.count = self.get_count(queryset, request)
+
+        cursor = self.decode_cursor(request)
+        hacia_atras = bool(cursor and cursor.get("p"))
+        campos = self.get_campos(queryset.model, ordenacion)
+
+        if cursor is not None:
+            queryset = queryset.filter(
+                self.filtro_posicion(campos, cursor["v"], hacia_atras)
+            )
+        queryset = queryset.order_by(*self.orden(campos, invertir=hacia_atras))
+
+        resultados = list(queryset[: self.page_size + 1])
+        hay_mas = len(resultados) > self.page_size
+        resultados = resultados[: self.page_size]
+        if hacia_atras:
+            resultados.reverse()
+
+        self.next_position = self.previous_position = None
+        if resultados:
+            primero, ultimo = resultados[0], resultados[-1]
+            if hacia_atras:
+                self.next_position = self.posicion(ultimo, campos)
+                if hay_mas:
+                    self.previous_position = self.posicion(primero, campos)
+            else:
+                if hay_mas:
+                    self.next_position = self.posicion(ultimo, campos)
+                if cursor is not None:
+                    self.previous_position = self.posicion(primero, campos)
+
+        return resultados
+
+    def get_count(self, queryset, request):
+        modo = request.query_params.get(self.count_query_param)
+        if modo == "exacto":
+            return queryset.count()
+        if modo == "aprox":
+            return contar_aproximado(queryset)
+        return None
+
+    def get_ordenacion(self, request, queryset, view):
+        """
+        Ordenación del keyset para la petición, o None si hay que paginar
+        por número de página (búsqueda u ordenación sin keyset posible).
+        """
+        backends = getattr(view, "filter_backends", ())
+        for backend in backends:
+            if issubclass(backend, filters.SearchFilter) and (
+                request.query_params.get(backend.search_param, "").strip()
+            ):
+                return None
+
+        for backend in backends:
+            if not issubclass(backend, filters.OrderingFilter):
+                continue
+            if backend.ordering_param not in request.query_params:
+                break
+            pedida = backend().get_ordering(request, queryset, view)
+            if not pedida:
+                break
+            if len(pedida) != 1:
+                return None
+            nombre = pedida[0].lstrip("-")
+            try:
+                campo = queryset.model._meta.get_field(nombre)
+            except FieldDoesNotExist:
+                return None
+            if campo.null:
+                return None
+            descendente = "-" if pedida[0].startswith("-") else ""
+            return (pedida[0], f"{descendente}id")
+        return self.ordering
+
+    def get_campos(self, model, ordenacion=None):
+        """
+        Devuelve [(campo, descendente), ...] a partir de `ordenacion` (por
+        defecto `ordering`).
+        """
+        campos = []
+        for campo in ordenacion or self.ordering:
+            nombre = campo.lstrip("-")
+            campos.append(
+                (model._meta.get_field(nombre), campo.startswith("-"))
+            )
+        return campos
+
+    def orden(self, campos, invertir=False):
+        return [
+            f"-{campo.name}" if descendente != invertir else campo.name
+            for campo, descendente in campos
+        ]
+
+    def filtro_posicion(self, campos, valores, hacia_atras):
+        """
+        Comparación de tuplas (a, b) < (x, y) expresada como
+        a < x OR (a = x AND b < y), respetando el sentido de cada campo.
+        """
+        try:
+            valores = [
+                campo.to_python(valor)
+                for (campo, _), valor in zip(campos, valores, strict=True)
+            ]
+        except (ValidationError, ValueError, TypeError):
+            raise NotFound("Cursor inválido")
+
+        filtro = Q()
+        for i, (campo, descendente) in enumerate(campos):
+            operador = "lt" if descendente != hacia_atras else "gt"
+            condicion = Q(**{f"{campo.name}__{operador}": valores[i]})
+            for (anterior, _), valor in zip(campos[:i], valores):
+                condicion &= Q(**{anterior.name: valor})
+            filtro |= condicion
+        return filtro
+
+    def posicion(self, instancia, campos):
+        return [campo.value_from_object(instancia) for campo, _ in campos]
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            cursor = json.loads(b64decode(encoded.encode("ascii")))
+            if not isinstance(cursor, dict) or "v" not in cursor:
+                raise ValueError(encoded)
+        except (BinasciiError, UnicodeError, ValueError):
+            raise NotFound("Cursor inválido")
+        return cursor
+
+    def encode_cursor(self, posicion, hacia_atras=False):
+        cursor = {"v": posicion}
+        if hacia_atras:
+            cursor["p"] = 1
+        encoded = b64encode(
+            # default=str conserva los microsegundos de las fechas
+            json.dumps(cursor, default=str, separators=(",", ":")).encode(
+                "utf-8"
+            )
+        ).decode("ascii")
+        return replace_query_param(
+            self.base_url, self.cursor_query_param, encoded
+        )
+
+    def get_next_link(self):
+        if self.por_paginas:
+            return super().get_next_link()
+        if self.next_position is None:
+            return None
+        return self.encode_cursor(self.next_position)
+
+    def get_previous_link(self):
+        if self.por_paginas:
+            return super().get_previous_link()
+        if self.previous_position is None:
+            return None
+        return self.encode_cursor(self.previous_position, hacia_atras=True)
+
+    def get_paginated_response(self, data):
+        if self.por_paginas:
+            return super().get_paginated_response(data)
+
+        respuesta = {
+            "next": self.get_next_link(),
+            "previous": self.get_previous_link(),
+            "results": data,
+        }
+        if self.count is not None:
+            respuesta = {"count": self.count, **respuesta}
+        return Response(respuesta)
+
+    def get_schema_operation_parameters(self, view):
+        parametros = super().get_schema_operation_parameters(view)
+        parametros += [
+            {
+                "name": self.cursor_query_param,
+                "required": False,
+                "in": "query",
+                "description": "Cursor de la página (paginación por keyset)",
+                "schema": {"type": "string"},
+            },
+            {
+                "name": self.count_query_param,
+                "required": False,
+                "in": "query",
+                "description": "Incluir total: 'aprox' o 'exacto'",
+                "schema": {"type": "string", "enum": ["aprox", "exacto"]},
+            },
+        ]
+        return parametros
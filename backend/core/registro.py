@@ -0,0 +1,218 @@
+"""
+Registro estructurado (JSON por línea) y resumen por petición.
+
+- FormateadorJSON: una línea JSON por registro, con el request_id de la
+  petición en curso y los campos pasados en `extra`.
+- ManejadorEnCola: QueueHandler que deja el registro en una cola en memoria;
+  un QueueListener en otro hilo lo formatea y escribe, así la petición no
+  espera a la E/S del log.
+- RegistroPeticionesMiddleware: asigna el X-Request-ID (o respeta el que
+  llega de nginx o del cliente) y emite un único registro por petición con
+  tenant, usuario, ruta, estado, duración y número de consultas.
+
+Los resúmenes de peticiones correctas se muestrean con
+REGISTRO_PETICIONES_MUESTREO (0-1); los errores y las peticiones lentas
+(REGISTRO_PETICIONES_LENTAS_MS) se registran siempre. El nivel de cada
+logger se configura en LOGGING como de costumbre.
+"""
+
+import contextvars
+import copy
+import json
+import logging
+import queue
+import random
+import re
+import sys
+import time
+import uuid
+from logging.handlers import QueueHandler, QueueListener
+
+from django.conf import settings
+from django.db import connection
+
+CABECERA_REQUEST_ID = "X-Request-ID"
+REQUEST_ID_VALIDO = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
+request_id_actual = contextvars.ContextVar("request_id", default=None)
+
+logger = logging.getLogger("peticiones")
+
+# Atributos propios de LogRecord: el resto vienen de `extra`
+_ATRIBUTOS_REGISTRO = set(
+    vars(logging.LogRecord("", 0, "", 0, "", (), None))
+) | {"message", "asctime", "request_id"}
+
+
+class FiltroRequestId(logging.Filter):
+    """
+    Añade record.request_id con el de la petición en curso (o None).
+    Va en el logger o en el ManejadorEnCola: el contextvar solo se puede
+    leer en el hilo de la petición.
+    """
+
+    def filter(self, record):
+        if not hasattr(record, "request_id"):
+            record.request_id = request_id_actual.get()
+        return True
+
+
+class FormateadorJSON(logging.Formatter):
+    def format(self, record):
+        datos = {
+            "fecha": self.formatTime(record, "%Y-%m-%dT%H:%M:%S")
+            + f".{int(record.msecs):03d}",
+            "nivel": record.levelname,
+            "logger": record.name,
+            "mensaje": record.getMessage(),
+        }
+        request_id = getattr(record, "request_id", None)
+        if request_id:
+            datos["request_id"] = request_id
+        datos.update(
+            (clave, valor)
+            for clave, valor in vars(record).items()
+            if clave not in _ATRIBUTOS_REGISTRO
+        )
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            datos["excepcion"] = record.exc_text
+        return json.dumps(datos, ensure_ascii=False, default=str)
+
+
+class ManejadorEnCola(QueueHandler):
+    """
+    Escribe los registros en `stream` desde un hilo aparte, con
+    FormateadorJSON. Si la cola se llena (max_cola) el registro se descarta
+    en lugar de bloquear la petición.
+    """
+
+    def __init__(self, stream=None, max_cola=10000):
+        super().__init__(queue.Queue(max_cola))
+        self.addFilter(FiltroRequestId())
+
+        destino = logging.StreamHandler(stream or sys.stdout)
+        destino.setFormatter(FormateadorJSON())
+        self.listener = QueueListener(
+            self.queue, destino, respect_handler_level=False
+        )
+        self.listener.start()
+
+    def prepare(self, record):
+        # Resolver el mensaje y la traza aquí (los argumentos pueden dejar
+        # de ser válidos) y dejar el JSON para el hilo del listener
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(
+                record.exc_info
+            )
+            record.exc_info = None
+        return record
+
+    def close(self):
+        # logging.shutdown() cierra los manejadores al salir: vaciar la cola
+        if self.listener._thread is not None:
+            self.listener.stop()
+        super().close()
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            pass
+
+
+def _request_id(request):
+    recibido = request.META.get("HTTP_X_REQUEST_ID", "")
+    if REQUEST_ID_VALIDO.match(recibido):
+        return recibido
+    return uuid.uuid4().hex
+
+
+def ruta_peticion(request):
+    # El patrón de la URL (no la ruta con IDs) para poder agrupar
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return None
+    if match.route:
+        return match.route.lstrip("^").rstrip("$")
+    return match.view_name
+
+
+class RegistroPeticionesMiddleware:
+    """
+    Va el primero en MIDDLEWARE para medir la petición completa. En las
+    respuestas por streaming la duración llega hasta que empieza el envío.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.request_id = _request_id(request)
+        token = request_id_actual.set(request.request_id)
+        consultas = [0]
+
+        def contar(execute, sql, params, many, context):
+            consultas[0] += 1
+            return execute(sql, params, many, context)
+
+        inicio = time.monotonic()
+        try:
+            with connection.execute_wrapper(contar):
+                response = self.get_response(request)
+            response[CABECERA_REQUEST_ID] = request.request_id
+            self._registrar(
+                request,
+                response,
+                (time.monotonic() - inicio) * 1000,
+                consultas[0],
+            )
+        finally:
+            request_id_actual.reset(token)
+        return response
+
+    def _registrar(self, request, response, duracion_ms, consultas):
+        lenta = duracion_ms >= getattr(
+            settings, "REGISTRO_PETICIONES_LENTAS_MS", 1000
+        )
+        if response.status_code >= 500:
+            nivel = logging.ERROR
+        elif response.status_code >= 400 or lenta:
+            nivel = logging.WARNING
+        else:
+            nivel = logging.INFO
+        if not logger.isEnabledFor(nivel):
+            return
+
+        # Solo se muestrean las peticiones correctas y rápidas
+        muestreo = getattr(settings, "REGISTRO_PETICIONES_MUESTREO", 1.0)
+        if nivel == logging.INFO and random.random() >= muestreo:
+            return
+
+        tenant = getattr(request, "tenant", None)
+        usuario = getattr(request, "user", None)
+        logger.log(
+            nivel,
+            "%s %s %s",
+            request.method,
+            request.path,
+            response.status_code,
+            extra={
+                "request_id": request.request_id,
+                "metodo": request.method,
+                "ruta": ruta_peticion(request),
+                "estado": response.status_code,
+                "duracion_ms": round(duracion_ms, 1),
+                "consultas": consultas,
+                "tenant": tenant.slug if tenant else None,
+                "usuario": (
+                    usuario.pk
+                    if usuario is not None and usuario.is_authenticated
+                    else None
+                ),
+            },
+        )
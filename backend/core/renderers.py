@@ -0,0 +1,33 @@
+"""
+Renderers compactos para clientes con poco ancho de banda.
+
+MessagePackRenderer se elige con Accept: application/msgpack (o
+?format=msgpack). Los tipos que JSON convierte en texto (fechas, Decimal,
+UUID...) se codifican igual que en JSONRenderer, así que el cliente recibe
+los mismos valores en menos bytes.
+"""
+
+from django.core.exceptions import ImproperlyConfigured
+from rest_framework.renderers import BaseRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+
+class MessagePackRenderer(BaseRenderer):
+    media_type = "application/msgpack"
+    format = "msgpack"
+    charset = None
+    render_style = "binary"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        try:
+            import msgpack
+        except ImportError:
+            raise ImproperlyConfigured(
+                "MessagePackRenderer requiere el paquete 'msgpack'"
+            )
+
+        if data is None:
+            return b""
+        return msgpack.packb(
+            data, default=JSONEncoder().default, use_bin_type=True
+        )
@@ -0,0 +1,196 @@
+"""
+Rate limiting sobre la caché de Django (Redis en producción).
+
+Las clases usan una ventana deslizante aproximada: se guardan contadores de
+la ventana actual y de la anterior, y la anterior pondera según cuánto de
+ella sigue dentro de la ventana. Solo se usan add/incr/get, que son
+atómicos en Redis, así que varios workers comparten el mismo límite sin
+guardar el historial de timestamps de DRF. Los contadores se leen antes de
+incrementarlos: peticiones simultáneas pueden pasarse del límite por unas
+pocas unidades, a cambio de que las rechazadas no consuman nada.
+
+Una petición rechazada no se cobra en ningún límite: ni en las claves del
+throttle que la rechaza ni en los throttles que se evalúan después (DRF
+los evalúa todos). Por eso RastreoGuiaThrottle va el último en las vistas:
+un cliente que supera su límite por IP no agota el de la guía para el
+resto.
+
+Las ráfagas se controlan combinando un throttle sostenido (p. ej. por hora)
+con otro corto (p. ej. por minuto) sobre el mismo cliente.
+
+El rastreo en lote cuenta como una consulta por guía: consume del límite
+por IP tantas unidades como guías pide y cada guía cuenta en su propio
+límite, igual que si se hubiesen rastreado una a una.
+"""
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.settings import api_settings
+from rest_framework.throttling import SimpleRateThrottle
+
+
+def guias_rastreo(request):
+    """
+    Números de guía de una petición de rastreo: 'numero_guia' o
+    'numeros_guia' (separados por comas o repetido), recortados y sin
+    duplicados, en el orden pedido.
+    """
+    valores = [request.query_params.get("numero_guia") or ""]
+    valores += request.query_params.getlist("numeros_guia")
+    guias = (
+        guia.strip()[:50] for valor in valores for guia in valor.split(",")
+    )
+    return list(dict.fromkeys(guia for guia in guias if guia))
+
+
+def max_guias_lote():
+    return getattr(settings, "RASTREO_LOTE_MAX_GUIAS", 20)
+
+
+class SlidingWindowThrottle(SimpleRateThrottle):
+    """
+    Throttle de ventana deslizante. Las subclases definen `scope` (tasa en
+    REST_FRAMEWORK["DEFAULT_THROTTLE_RATES"]) y `get_cache_key`.
+    """
+
+    cache_format = "throttle:%(scope)s:%(ident)s"
+
+    # Atributo de la petición que marca que un throttle ya la rechazó
+    atributo_rechazada = "_throttle_rechazada"
+
+    @property
+    def cache(self):
+        return caches[getattr(settings, "THROTTLE_CACHE_ALIAS", "default")]
+
+    def get_rate(self):
+        # Leer la tasa en cada instancia (y no al importar) para respetar
+        # los cambios de configuración
+        return api_settings.DEFAULT_THROTTLE_RATES.get(self.scope)
+
+    def get_cache_keys(self, request, view):
+        """
+        Claves a contar para la petición; por defecto la de get_cache_key.
+        La petición se rechaza si cualquiera de ellas supera el límite.
+        """
+        clave = self.get_cache_key(request, view)
+        return [] if clave is None else [clave]
+
+    def get_peso(self, request, view):
+        """
+        Unidades del límite que consume la petición.
+        """
+        return 1
+
+    def _leer(self, claves, ventana):
+        """
+        Devuelve {clave: (actuales, anteriores)} en una sola lectura.
+        """
+        nombres = {
+            clave: (f"{clave}:{ventana}", f"{clave}:{ventana - 1}")
+            for clave in claves
+        }
+        valores = self.cache.get_many(
+            [nombre for par in nombres.values() for nombre in par]
+        )
+        return {
+            clave: (valores.get(actual, 0), valores.get(anterior, 0))
+            for clave, (actual, anterior) in nombres.items()
+        }
+
+    def _incrementar(self, clave, ventana, peso):
+        clave_actual = f"{clave}:{ventana}"
+
+        # La clave dura dos ventanas: sirve como 'anterior' en la siguiente
+        self.cache.add(clave_actual, 0, 2 * self.duration)
+        try:
+            self.cache.incr(clave_actual, peso)
+        except ValueError:
+            # Expiró entre add e incr
+            self.cache.set(clave_actual, peso, 2 * self.duration)
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+        if getattr(request, self.atributo_rechazada, False):
+            # Ya la rechazó otro throttle: no consumir de este límite
+            return True
+
+        claves = self.get_cache_keys(request, view)
+        if not claves:
+            return True
+
+        peso = self.get_peso(request, view)
+        self.now = self.timer()
+        ventana = int(self.now // self.duration)
+        self.transcurrido = (self.now % self.duration) / self.duration
+
+        # wait() se calcula con los contadores de la clave más cargada,
+        # contando ya esta petición
+        estimado_max = None
+        for actuales, anteriores in self._leer(claves, ventana).values():
+            actuales += peso
+            estimado = anteriores * (1 - self.transcurrido) + actuales
+            if estimado_max is None or estimado > estimado_max:
+                estimado_max = estimado
+                self.actuales, self.anteriores = actuales, anteriores
+
+        if estimado_max > self.num_requests:
+            setattr(request, self.atributo_rechazada, True)
+            return False
+        for clave in claves:
+            self._incrementar(clave, ventana, peso)
+        return True
+
+    def wait(self):
+        """
+        Segundos hasta que la estimación vuelva a estar dentro del límite.
+        """
+        restante = (1 - self.transcurrido) * self.duration
+        if self.actuales > self.num_requests or not self.anteriores:
+            return restante
+
+        # La ventana anterior pierde peso linealmente hasta desaparecer
+        sobrante = self.num_requests - self.actuales
+        fraccion = 1 - self.transcurrido - sobrante / self.anteriores
+        return min(max(fraccion * self.duration, 0), restante)
+
+
+class PublicoIPThrottle(SlidingWindowThrottle):
+    """
+    Límite sostenido por IP para los endpoints públicos.
+    """
+
+    scope = "publico_ip"
+
+    def get_cache_key(self, request, view):
+        return self.cache_format % {
+            "scope": self.scope,
+            "ident": self.get_ident(request),
+        }
+
+    def get_peso(self, request, view):
+        # Una unidad por guía en el rastreo en lote (ver guias_rastreo)
+        return min(max(len(guias_rastreo(request)), 1), max_guias_lote())
+
+
+class PublicoIPRafagaThrottle(PublicoIPThrottle):
+    """
+    Límite de ráfaga por IP (ventana corta) para los endpoints públicos.
+    """
+
+    scope = "publico_ip_rafaga"
+
+
+class RastreoGuiaThrottle(SlidingWindowThrottle):
+    """
+    Límite por número de guía, independiente de la IP, para que una guía
+    consultada desde muchas direcciones no genere carga ilimitada.
+    """
+
+    scope = "rastreo_guia"
+
+    def get_cache_keys(self, request, view):
+        return [
+            self.cache_format % {"scope": self.scope, "ident": guia.upper()}
+            for guia in guias_rastreo(request)[: max_guias_lote()]
+        ]
@@ -0,0 +1,9 @@
+from django.apps import AppConfig
+
+
+class EmpresasConfig(AppConfig):
+    name = "empresas"
+
+    def ready(self):
+        # Registrar señales de invalidación de cachés multi-tenant
+        from . import signals  # noqa: F401
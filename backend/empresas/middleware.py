@@ -1,11 +1,12 @@
 import logging
-import re
+from functools import partial
 
 from django.http import Http404, HttpResponseRedirect
 from django.shortcuts import get_object_or_404
 from django.utils.deprecation import MiddlewareMixin
+from django.utils.functional import SimpleLazyObject
 
-from .models import Empresa, PerfilUsuario
+from .tenancy import perfil_de_request, slug_desde_host, tenant_registry
 
 logger = logging.getLogger(__name__)
 
@@ -23,13 +24,9 @@ class TenantMiddleware(MiddlewareMixin):
         Procesa cada request para configurar contexto básico.
         Prioriza detección por subdominio, fallback a header.
         """
-        print(f"🚀 MIDDLEWARE process_request para {request.path}")
-        print(f"🌐 HOST: {request.get_host()}")
-
         # EXCLUIR RUTAS DEL ADMIN DJANGO - no requieren multitenancy
         admin_paths = ["/admin/", "/static/", "/media/"]
         if any(request.path.startswith(path) for path in admin_paths):
-            print(f"🔓 ADMIN PATH - saltando multitenancy para {request.path}")
             request.tenant = None
             return None
 
@@ -38,18 +35,16 @@ class TenantMiddleware(MiddlewareMixin):
 
         # Método 1: Detección por Subdominio (NUEVO - PRIORIDAD)
         empresa_slug = self._extract_tenant_from_subdomain(host)
-        print(f"🏢 SUBDOMAIN SLUG: {empresa_slug}")
 
         if empresa_slug:
-            try:
-                empresa = Empresa.objects.get(slug=empresa_slug, activo=True)
-                logger.info(
-                    f"Empresa detectada por subdominio: {empresa.nombre}"
+            empresa = tenant_registry.get_by_host(host)
+            if empresa:
+                logger.debug(
+                    "Empresa detectada por subdominio: %s", empresa.slug
                 )
-                print(f"✅ EMPRESA POR SUBDOMAIN: {empresa.nombre}")
-            except Empresa.DoesNotExist:
+            else:
                 logger.warning(
-                    f"Empresa no encontrada con slug: {empresa_slug}"
+                    "Empresa no encontrada con slug: %s", empresa_slug
                 )
                 # Para subdominios inválidos, redirigir a dominio principal
                 if not self._is_main_domain(host):
@@ -58,41 +53,30 @@ class TenantMiddleware(MiddlewareMixin):
                         f"http://{main_domain}{request.get_full_path()}"
                     )
                     logger.info(
-                        f"Redirigiendo a dominio principal: {redirect_url}"
+                        "Redirigiendo a dominio principal: %s", redirect_url
                     )
                     return HttpResponseRedirect(redirect_url)
 
         # Método 2: Header X-Tenant-Slug (para APIs) - fallback
         if not empresa:
             tenant_slug = request.META.get("HTTP_X_TENANT_SLUG")
-            print(f"🔍 HEADER TENANT SLUG: {tenant_slug}")
 
             if tenant_slug:
-                try:
-                    empresa = Empresa.objects.get(
-                        slug=tenant_slug, activo=True
-                    )
-                    logger.info(
-                        f"Empresa detectada por header: {empresa.nombre}"
+                empresa = tenant_registry.get_by_slug(tenant_slug)
+                if empresa:
+                    logger.debug(
+                        "Empresa detectada por header: %s", empresa.slug
                     )
-                    print(f"✅ EMPRESA POR HEADER: {empresa.nombre}")
-                except Empresa.DoesNotExist:
+                else:
                     logger.warning(
-                        f"Empresa no encontrada con slug: {tenant_slug}"
+                        "Empresa no encontrada con slug: %s", tenant_slug
                     )
                     raise Http404(f"Empresa '{tenant_slug}' no encontrada")
 
-        # Establecer contexto de empresa en el request
+        # Establecer contexto de empresa en el request (el resumen de
+        # core.registro incluye el tenant de cada petición)
         request.tenant = empresa
 
-        # Log del contexto establecido
-        if empresa:
-            logger.debug(
-                f"Contexto tenant establecido: {empresa.nombre} (ID: {empresa.id})"
-            )
-        else:
-            logger.debug("Sin contexto tenant - request sin empresa")
-
     def _extract_tenant_from_subdomain(self, host):
         """
         Extrae el slug de la empresa del subdominio.
@@ -103,25 +87,7 @@ class TenantMiddleware(MiddlewareMixin):
         - app.packfy.com → None (dominio principal)
         - packfy.com → None (dominio principal)
         """
-        # Limpiar puerto si existe
-        host_clean = host.split(":")[0]
-
-        # Patrones para detectar subdominios
-        patterns = [
-            r"^([^.]+)\.packfy\.com$",  # empresa1.packfy.com
-            r"^([^.]+)\.localhost$",  # empresa1.localhost (desarrollo)
-            r"^([^.]+)\.127\.0\.0\.1$",  # empresa1.127.0.0.1 (desarrollo)
-        ]
-
-        for pattern in patterns:
-            match = re.match(pattern, host_clean)
-            if match:
-                subdomain = match.group(1)
-                # Excluir subdominios principales/administrativos
-                if subdomain not in ["app", "admin", "api", "www"]:
-                    return subdomain
-
-        return None
+        return slug_desde_host(host)
 
     def _is_main_domain(self, host):
         """
@@ -151,72 +117,19 @@ class TenantMiddleware(MiddlewareMixin):
 
     def process_view(self, request, view_func, view_args, view_kwargs):
         """
-        Se ejecuta DESPUÉS de la autenticación DRF para configurar el perfil del usuario.
+        Expone request.perfil_usuario de forma perezosa; el perfil se
+        resuelve (y cachea) la primera vez que lo usa una vista o permiso.
         """
-        print(f"🎯 MIDDLEWARE process_view para {request.path}")
-        print(
-            f"🔍 USER EN PROCESS_VIEW: {getattr(request, 'user', 'NO USER')}"
-        )
-
         # EXCLUIR RUTAS DEL ADMIN DJANGO - no requieren multitenancy
         admin_paths = ["/admin/", "/static/", "/media/"]
         if any(request.path.startswith(path) for path in admin_paths):
-            print(f"🔓 ADMIN PATH - saltando process_view para {request.path}")
             return None
 
-        # Solo procesar si hay una empresa y el usuario está autenticado
-        if (
-            hasattr(request, "tenant")
-            and request.tenant
-            and hasattr(request, "user")
-            and request.user
-            and request.user.is_authenticated
-        ):
-
-            try:
-                perfil = (
-                    PerfilUsuario.objects.select_related("empresa")
-                    .filter(
-                        usuario=request.user,
-                        empresa=request.tenant,
-                        activo=True,
-                    )
-                    .first()
-                )
-
-                if perfil:
-                    request.perfil_usuario = perfil
-                    print(
-                        f"🎯 PERFIL CONFIGURADO: {perfil.rol} para {perfil.usuario.email}"
-                    )
-                else:
-                    # Si no tiene perfil en esta empresa, buscar su perfil principal
-                    perfil_principal = (
-                        PerfilUsuario.objects.select_related("empresa")
-                        .filter(
-                            usuario=request.user,
-                            activo=True,
-                            empresa__activo=True,
-                        )
-                        .first()
-                    )
-
-                    if perfil_principal:
-                        request.perfil_usuario = perfil_principal
-                        # También actualizar el tenant si es diferente
-                        if request.tenant != perfil_principal.empresa:
-                            request.tenant = perfil_principal.empresa
-                        print(
-                            f"🎯 PERFIL PRINCIPAL: {perfil_principal.rol} para {perfil_principal.usuario.email}"
-                        )
-                    else:
-                        print(
-                            f"⚠️ SIN PERFIL: Usuario {request.user.username} sin perfil activo"
-                        )
-
-            except Exception as e:
-                print(f"❌ ERROR PERFIL: {e}")
-                logger.warning(f"Error configurando perfil del usuario: {e}")
+        # El perfil se resuelve de forma perezosa: con JWT el usuario aún no
+        # está autenticado aquí, y muchas vistas públicas nunca lo necesitan
+        request.perfil_usuario = SimpleLazyObject(
+            partial(perfil_de_request, request)
+        )
 
         # No retornar nada para continuar con el procesamiento normal
         return None
@@ -11,6 +11,7 @@ from rest_framework import permissions
 from rest_framework.exceptions import PermissionDenied as DRFPermissionDenied
 
 from .models import PerfilUsuario
+from .tenancy import perfil_de_request
 
 
 def require_empresa(func):
@@ -135,74 +136,11 @@ class EmpresaOwnerPermission(permissions.BasePermission):
         if not request.user.is_authenticated:
             return False
 
-        # Configurar perfil_usuario si no existe
-        if (
-            not hasattr(request, "perfil_usuario")
-            or not request.perfil_usuario
-        ):
-            self._setup_user_profile(request)
-
-        if (
-            not hasattr(request, "perfil_usuario")
-            or not request.perfil_usuario
-        ):
+        perfil = perfil_de_request(request)
+        if not perfil:
             return False
 
-        return request.perfil_usuario.es_dueno
-
-    def _setup_user_profile(self, request):
-        """
-        Configura el perfil del usuario basado en el tenant y usuario autenticado.
-        """
-        try:
-            print(f"🔧 CONFIGURANDO PERFIL para {request.user.email}")
-
-            # Obtener empresa del tenant
-            empresa = getattr(request, "tenant", None)
-
-            if empresa:
-                # Buscar perfil específico para esta empresa
-                perfil = (
-                    PerfilUsuario.objects.select_related("empresa")
-                    .filter(
-                        usuario=request.user,
-                        empresa=empresa,
-                        activo=True,
-                    )
-                    .first()
-                )
-
-                if perfil:
-                    request.perfil_usuario = perfil
-                    print(
-                        f"✅ PERFIL CONFIGURADO: {perfil.rol} para {perfil.usuario.email}"
-                    )
-                    return
-
-            # Fallback: buscar cualquier perfil activo del usuario
-            perfil = (
-                PerfilUsuario.objects.select_related("empresa")
-                .filter(
-                    usuario=request.user, activo=True, empresa__activo=True
-                )
-                .first()
-            )
-
-            if perfil:
-                request.perfil_usuario = perfil
-                # También actualizar el tenant si no estaba configurado
-                if not hasattr(request, "tenant") or not request.tenant:
-                    request.tenant = perfil.empresa
-                print(
-                    f"✅ PERFIL FALLBACK: {perfil.rol} para {perfil.usuario.email}"
-                )
-            else:
-                print(
-                    f"❌ SIN PERFIL: Usuario {request.user.email} sin perfil activo"
-                )
-
-        except Exception as e:
-            print(f"❌ ERROR CONFIGURANDO PERFIL: {e}")
+        return perfil.es_dueno
 
 
 class EmpresaOperatorPermission(permissions.BasePermission):
@@ -215,74 +153,11 @@ class EmpresaOperatorPermission(permissions.BasePermission):
         if not request.user.is_authenticated:
             return False
 
-        # Configurar perfil_usuario si no existe
-        if (
-            not hasattr(request, "perfil_usuario")
-            or not request.perfil_usuario
-        ):
-            self._setup_user_profile(request)
-
-        if (
-            not hasattr(request, "perfil_usuario")
-            or not request.perfil_usuario
-        ):
+        perfil = perfil_de_request(request)
+        if not perfil:
             return False
 
-        return request.perfil_usuario.puede_gestionar_envios
-
-    def _setup_user_profile(self, request):
-        """
-        Configura el perfil del usuario basado en el tenant y usuario autenticado.
-        """
-        try:
-            print(f"🔧 CONFIGURANDO PERFIL OPERATOR para {request.user.email}")
-
-            # Obtener empresa del tenant
-            empresa = getattr(request, "tenant", None)
-
-            if empresa:
-                # Buscar perfil específico para esta empresa
-                perfil = (
-                    PerfilUsuario.objects.select_related("empresa")
-                    .filter(
-                        usuario=request.user,
-                        empresa=empresa,
-                        activo=True,
-                    )
-                    .first()
-                )
-
-                if perfil:
-                    request.perfil_usuario = perfil
-                    print(
-                        f"✅ PERFIL OPERATOR CONFIGURADO: {perfil.rol} para {perfil.usuario.email}"
-                    )
-                    return
-
-            # Fallback: buscar cualquier perfil activo del usuario
-            perfil = (
-                PerfilUsuario.objects.select_related("empresa")
-                .filter(
-                    usuario=request.user, activo=True, empresa__activo=True
-                )
-                .first()
-            )
-
-            if perfil:
-                request.perfil_usuario = perfil
-                # También actualizar el tenant si no estaba configurado
-                if not hasattr(request, "tenant") or not request.tenant:
-                    request.tenant = perfil.empresa
-                print(
-                    f"✅ PERFIL OPERATOR FALLBACK: {perfil.rol} para {perfil.usuario.email}"
-                )
-            else:
-                print(
-                    f"❌ SIN PERFIL OPERATOR: Usuario {request.user.email} sin perfil activo"
-                )
-
-        except Exception as e:
-            print(f"❌ ERROR CONFIGURANDO PERFIL OPERATOR: {e}")
+        return perfil.puede_gestionar_envios
 
 
 class EmpresaClientPermission(permissions.BasePermission):
@@ -1,9 +1,10 @@
+from core.campos import CamposDinamicosMixin
 from rest_framework import serializers
 
 from .models import Empresa
 
 
-class EmpresaSerializer(serializers.ModelSerializer):
+class EmpresaSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     """
     Serializer para el modelo Empresa
     """
@@ -0,0 +1,39 @@
+"""
+Señales de la app empresas.
+Mantienen coherentes las cachés del contexto multi-tenant.
+"""
+
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Empresa, PerfilUsuario
+from .tenancy import perfil_resolver, tenant_registry
+
+
+@receiver(post_save, sender=Empresa)
+@receiver(post_delete, sender=Empresa)
+def invalidar_registro_empresas(sender, instance, **kwargs):
+    """
+    Cualquier alta, cambio (slug, activo...) o baja de una empresa invalida
+    el registro de tenants para que el siguiente request la vea.
+    """
+    tenant_registry.invalidate()
+
+    if kwargs.get("created"):
+        return
+
+    # Los perfiles cacheados llevan una copia de la empresa
+    usuario_ids = PerfilUsuario.objects.filter(empresa=instance).values_list(
+        "usuario_id", flat=True
+    )
+    perfil_resolver.invalidate(*usuario_ids)
+
+
+@receiver(post_save, sender=PerfilUsuario)
+@receiver(post_delete, sender=PerfilUsuario)
+def invalidar_perfiles_usuario(sender, instance, **kwargs):
+    """
+    Invalida los perfiles cacheados del usuario al crear, modificar
+    (rol, activo...) o eliminar uno de sus perfiles.
+    """
+    perfil_resolver.invalidate(instance.usuario_id)
@@ -0,0 +1,299 @@
+"""
+Resolución cacheada del contexto multi-tenant.
+
+El registro de empresas vive en memoria del proceso y se apoya en una
+caché compartida (Redis en producción) para que todos los workers vean las
+invalidaciones. En estado estable resolver la empresa de
+un request no consulta la base de datos.
+
+Los perfiles de usuario se resuelven con PerfilResolver, compartido por el
+middleware y los permisos de DRF.
+"""
+
+import re
+import threading
+import time
+from functools import lru_cache
+
+from core.instrumentacion import registrar_cache
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Case, IntegerField, Q, Value, When
+
+from .models import Empresa, PerfilUsuario
+
+# Patrones para detectar subdominios de empresa
+SUBDOMAIN_PATTERN = re.compile(
+    r"^([^.]+)\.(?:packfy\.com|localhost|127\.0\.0\.1)$"
+)
+
+# Subdominios principales/administrativos que no son empresas
+RESERVED_SUBDOMAINS = frozenset(["app", "admin", "api", "www"])
+
+
+@lru_cache(maxsize=1024)
+def slug_desde_host(host):
+    """
+    Extrae el slug de la empresa del subdominio del host.
+
+    Ejemplos:
+    - empresa1.packfy.com → empresa1
+    - empresa2.localhost:5173 → empresa2
+    - app.packfy.com → None (dominio principal)
+    - packfy.com → None (dominio principal)
+    """
+    # Limpiar puerto si existe
+    host_clean = host.split(":")[0]
+
+    match = SUBDOMAIN_PATTERN.match(host_clean)
+    if match and match.group(1) not in RESERVED_SUBDOMAINS:
+        return match.group(1)
+
+    return None
+
+
+class TenantRegistry:
+    """
+    Registro de empresas activas indexado por slug y por host.
+
+    - Nivel 1: diccionario en memoria del proceso (sin I/O).
+    - Nivel 2: caché compartida definida en TENANT_CACHE_ALIAS ("default"
+      si no se indica), que además guarda una versión global para
+      invalidar el nivel 1 de todos los workers. Con TENANT_CACHE_ALIAS =
+      None la invalidación es local al proceso y los demás workers solo
+      la ven al vencer el TTL: válido únicamente en desarrollo.
+
+    Las búsquedas fallidas también se cachean (empresa inexistente o
+    inactiva) y se invalidan con las señales de Empresa.
+    """
+
+    VERSION_KEY = "tenants:version"
+    SLUG_KEY = "tenants:slug:{version}:{slug}"
+    MISSING = "__missing__"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._por_slug = {}
+        self._por_host = {}
+        self._version = None
+
+    @property
+    def timeout(self):
+        return getattr(settings, "TENANT_CACHE_TIMEOUT", 300)
+
+    @property
+    def shared_cache(self):
+        alias = getattr(settings, "TENANT_CACHE_ALIAS", "default")
+        return caches[alias] if alias else None
+
+    def _current_version(self):
+        """
+        Versión global del registro. Sin caché compartida siempre es 0 y la
+        invalidación es local al proceso (más el TTL).
+        """
+        cache = self.shared_cache
+        if cache is None:
+            return 0
+        version = cache.get(self.VERSION_KEY)
+        if version is None:
+            # Semilla basada en tiempo: si la clave se pierde no se repite
+            # una versión que otro worker pueda tener todavía en memoria
+            cache.add(self.VERSION_KEY, int(time.time() * 1000), None)
+            version = cache.get(self.VERSION_KEY)
+        return version
+
+    def _sync_version(self):
+        version = self._current_version()
+        if version != self._version:
+            with self._lock:
+                self._por_slug.clear()
+                self._por_host.clear()
+                self._version = version
+        return version
+
+    def get_by_slug(self, slug):
+        """
+        Devuelve la empresa activa con ese slug o None si no existe.
+        """
+        if not slug:
+            return None
+
+        version = self._sync_version()
+        entry = self._por_slug.get(slug)
+        vigente = entry is not None and entry[1] > time.monotonic()
+        registrar_cache("tenants", aciertos=vigente, fallos=not vigente)
+        if vigente:
+            return entry[0]
+
+        empresa = self._load(slug, version)
+        with self._lock:
+            if self._version == version:
+                self._por_slug[slug] = (
+                    empresa,
+                    time.monotonic() + self.timeout,
+                )
+        return empresa
+
+    def get_by_host(self, host):
+        """
+        Devuelve la empresa activa asociada al subdominio del host.
+        """
+        version = self._sync_version()
+        entry = self._por_host.get(host)
+        if entry is not None and entry[1] > time.monotonic():
+            return entry[0]
+
+        empresa = self.get_by_slug(slug_desde_host(host))
+        with self._lock:
+            if self._version == version:
+                self._por_host[host] = (
+                    empresa,
+                    time.monotonic() + self.timeout,
+                )
+        return empresa
+
+    def _load(self, slug, version):
+        cache = self.shared_cache
+        key = self.SLUG_KEY.format(version=version, slug=slug)
+
+        if cache is not None:
+            cached = cache.get(key)
+            if cached is not None:
+                return None if cached == self.MISSING else cached
+
+        empresa = Empresa.objects.filter(slug=slug, activo=True).first()
+
+        if cache is not None:
+            cache.set(key, empresa if empresa else self.MISSING, self.timeout)
+        return empresa
+
+    def invalidate(self):
+        """
+        Vacía el registro local y, si hay caché compartida, incrementa la
+        versión global para que el resto de workers descarten el suyo.
+        """
+        cache = self.shared_cache
+        if cache is not None:
+            try:
+                cache.incr(self.VERSION_KEY)
+            except ValueError:
+                cache.set(self.VERSION_KEY, int(time.time() * 1000), None)
+
+        with self._lock:
+            self._por_slug.clear()
+            self._por_host.clear()
+            self._version = None
+
+
+tenant_registry = TenantRegistry()
+
+
+class PerfilResolver:
+    """
+    Resolución del PerfilUsuario activo de un usuario en una empresa.
+
+    Prioriza el perfil en la empresa pedida y, si no existe, cae al perfil
+    principal del usuario (cualquier perfil activo en una empresa activa),
+    todo en una única consulta. Los resultados se guardan con un TTL corto
+    en la caché PERFIL_CACHE_ALIAS, agrupados por usuario para poder
+    invalidarlos con una sola clave.
+    """
+
+    KEY = "perfiles:{usuario_id}"
+    MISSING = "__missing__"
+
+    @property
+    def timeout(self):
+        return getattr(settings, "PERFIL_CACHE_TIMEOUT", 60)
+
+    @property
+    def cache(self):
+        return caches[getattr(settings, "PERFIL_CACHE_ALIAS", "default")]
+
+    def resolver(self, usuario, empresa=None):
+        """
+        Devuelve el perfil del usuario para la empresa (o su perfil
+        principal como fallback), o None si no tiene perfiles activos.
+        """
+        key = self.KEY.format(usuario_id=usuario.pk)
+        empresa_id = empresa.pk if empresa else None
+
+        perfiles = self.cache.get(key) or {}
+        registrar_cache(
+            "perfiles",
+            aciertos=empresa_id in perfiles,
+            fallos=empresa_id not in perfiles,
+        )
+        if empresa_id in perfiles:
+            perfil = perfiles[empresa_id]
+            if perfil == self.MISSING:
+                return None
+        else:
+            perfil = self._load(usuario, empresa)
+            perfiles[empresa_id] = perfil or self.MISSING
+            self.cache.set(key, perfiles, self.timeout)
+
+        if perfil:
+            # Evitar una consulta extra al acceder a perfil.usuario
+            PerfilUsuario.usuario.field.set_cached_value(perfil, usuario)
+        return perfil
+
+    def _load(self, usuario, empresa):
+        queryset = PerfilUsuario.objects.select_related("empresa").filter(
+            usuario=usuario, activo=True
+        )
+
+        if not empresa:
+            return queryset.filter(empresa__activo=True).first()
+
+        return (
+            queryset.filter(Q(empresa=empresa) | Q(empresa__activo=True))
+            .annotate(
+                prioridad=Case(
+                    When(empresa=empresa, then=Value(0)),
+                    default=Value(1),
+                    output_field=IntegerField(),
+                )
+            )
+            .order_by("prioridad", *PerfilUsuario._meta.ordering)
+            .first()
+        )
+
+    def invalidate(self, *usuario_ids):
+        self.cache.delete_many(
+            [self.KEY.format(usuario_id=pk) for pk in usuario_ids]
+        )
+
+
+perfil_resolver = PerfilResolver()
+
+
+def perfil_de_request(request):
+    """
+    Resuelve una sola vez por request el perfil del usuario autenticado.
+
+    Funciona tanto con el HttpRequest de Django como con el Request de DRF
+    (el estado se guarda en el HttpRequest subyacente). Si el perfil
+    resuelto pertenece a otra empresa, el tenant del request pasa a ser esa
+    empresa para que perfil y tenant sean siempre coherentes.
+    """
+    http_request = getattr(request, "_request", request)
+
+    if hasattr(http_request, "_perfil_resuelto"):
+        return http_request._perfil_resuelto
+
+    usuario = getattr(request, "user", None)
+    if not usuario or not usuario.is_authenticated:
+        # No memorizar: la autenticación de DRF puede ocurrir más tarde
+        return None
+
+    perfil = perfil_resolver.resolver(
+        usuario, getattr(http_request, "tenant", None)
+    )
+    if perfil and getattr(http_request, "tenant", None) != perfil.empresa:
+        http_request.tenant = perfil.empresa
+
+    http_request._perfil_resuelto = perfil
+    if not hasattr(http_request, "perfil_usuario"):
+        http_request.perfil_usuario = perfil
+    return perfil
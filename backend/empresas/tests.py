@@ -0,0 +1,185 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import RequestFactory, TestCase, override_settings
+from rest_framework.test import APIClient
+
+from empresas.models import Empresa, PerfilUsuario
+from empresas.tenancy import (
+    TenantRegistry,
+    perfil_de_request,
+    perfil_resolver,
+    slug_desde_host,
+    tenant_registry,
+)
+
+Usuario = get_user_model()
+
+
+class TenantRegistryTest(TestCase):
+    def setUp(self):
+        tenant_registry.invalidate()
+        self.empresa = Empresa.objects.create(
+            nombre="Empresa Registro", slug="registro", activo=True
+        )
+
+    def test_slug_desde_host(self):
+        """Probar la extracción del slug desde el subdominio"""
+        self.assertEqual(slug_desde_host("registro.packfy.com"), "registro")
+        self.assertEqual(
+            slug_desde_host("registro.localhost:5173"), "registro"
+        )
+        self.assertIsNone(slug_desde_host("app.packfy.com"))
+        self.assertIsNone(slug_desde_host("packfy.com"))
+        self.assertIsNone(slug_desde_host("localhost:8000"))
+
+    def test_resolucion_sin_consultas_en_estado_estable(self):
+        """Probar que la segunda resolución del tenant no consulta la BD"""
+        self.client.get("/api/health/", HTTP_X_TENANT_SLUG="registro")
+
+        with self.assertNumQueries(0):
+            response = self.client.get(
+                "/api/health/", HTTP_X_TENANT_SLUG="registro"
+            )
+
+        self.assertEqual(response["X-Tenant-Slug"], "registro")
+
+    def test_resolucion_por_host_cacheada(self):
+        """Probar que la resolución por host también queda en caché"""
+        self.assertEqual(
+            tenant_registry.get_by_host("registro.packfy.com"), self.empresa
+        )
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                tenant_registry.get_by_host("registro.packfy.com"),
+                self.empresa,
+            )
+
+    def test_desactivar_empresa_invalida_registro(self):
+        """Probar que desactivar una empresa surte efecto inmediatamente"""
+        self.assertEqual(tenant_registry.get_by_slug("registro"), self.empresa)
+
+        self.empresa.activo = False
+        self.empresa.save()
+
+        self.assertIsNone(tenant_registry.get_by_slug("registro"))
+        response = self.client.get(
+            "/api/health/", HTTP_X_TENANT_SLUG="registro"
+        )
+        self.assertEqual(response.status_code, 404)
+
+    def test_eliminar_empresa_invalida_registro(self):
+        """Probar que eliminar una empresa la saca del registro"""
+        self.assertEqual(tenant_registry.get_by_slug("registro"), self.empresa)
+
+        self.empresa.delete()
+
+        self.assertIsNone(tenant_registry.get_by_slug("registro"))
+
+    @override_settings(TENANT_CACHE_ALIAS="default")
+    def test_cache_compartida(self):
+        """Probar el nivel compartido y su invalidación por versión"""
+        tenant_registry.invalidate()
+        self.assertEqual(tenant_registry.get_by_slug("registro"), self.empresa)
+
+        # Otro worker: memoria local vacía, pero la caché compartida responde
+        with tenant_registry._lock:
+            tenant_registry._por_slug.clear()
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                tenant_registry.get_by_slug("registro"), self.empresa
+            )
+
+        Empresa.objects.filter(pk=self.empresa.pk).update(activo=False)
+        self.empresa.save(update_fields=["ultima_actualizacion"])
+        self.assertIsNone(tenant_registry.get_by_slug("registro"))
+
+    def test_desactivar_empresa_invalida_otros_workers(self):
+        """Probar que, con la configuración por defecto, la desactivación
+        llega al registro en memoria de otro worker sin esperar al TTL"""
+        otro_worker = TenantRegistry()
+        self.assertEqual(otro_worker.get_by_slug("registro"), self.empresa)
+
+        self.empresa.activo = False
+        self.empresa.save()
+
+        self.assertIsNone(otro_worker.get_by_slug("registro"))
+
+
+class PerfilResolverTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        tenant_registry.invalidate()
+        self.empresa = Empresa.objects.create(
+            nombre="Empresa A", slug="empresa-a"
+        )
+        self.otra_empresa = Empresa.objects.create(
+            nombre="Empresa B", slug="empresa-b"
+        )
+        self.usuario = Usuario.objects.create_user(
+            email="dueno@example.com", password="password123"
+        )
+        self.perfil = PerfilUsuario.objects.create(
+            usuario=self.usuario,
+            empresa=self.empresa,
+            rol=PerfilUsuario.RolChoices.DUENO,
+        )
+
+    def test_resolucion_cacheada(self):
+        """Probar que el perfil se resuelve en una consulta y luego se cachea"""
+        with self.assertNumQueries(1):
+            perfil = perfil_resolver.resolver(self.usuario, self.empresa)
+        self.assertEqual(perfil, self.perfil)
+
+        with self.assertNumQueries(0):
+            perfil = perfil_resolver.resolver(self.usuario, self.empresa)
+            self.assertEqual(perfil.usuario.email, "dueno@example.com")
+
+    def test_fallback_a_perfil_principal(self):
+        """Probar el fallback al perfil principal y el cambio de tenant"""
+        request = RequestFactory().get("/api/envios/")
+        request.user = self.usuario
+        request.tenant = self.otra_empresa
+
+        with self.assertNumQueries(1):
+            perfil = perfil_de_request(request)
+            self.assertEqual(perfil_de_request(request), perfil)
+
+        self.assertEqual(perfil, self.perfil)
+        self.assertEqual(request.tenant, self.empresa)
+
+    def test_invalidacion_al_guardar_perfil(self):
+        """Probar que cambiar el rol invalida la caché del usuario"""
+        perfil_resolver.resolver(self.usuario, self.empresa)
+
+        self.perfil.rol = PerfilUsuario.RolChoices.OPERADOR_MIAMI
+        self.perfil.save()
+        self.assertEqual(
+            perfil_resolver.resolver(self.usuario, self.empresa).rol,
+            PerfilUsuario.RolChoices.OPERADOR_MIAMI,
+        )
+
+        self.perfil.delete()
+        self.assertIsNone(perfil_resolver.resolver(self.usuario, self.empresa))
+
+    def test_permiso_dueno_usa_perfil_resuelto(self):
+        """Probar que los permisos de DRF usan el perfil compartido"""
+        client = APIClient()
+        client.force_authenticate(self.usuario)
+
+        response = client.patch(
+            f"/api/empresas/{self.empresa.id}/",
+            {"telefono": "+5355123456"},
+            format="json",
+            HTTP_X_TENANT_SLUG="empresa-a",
+        )
+        self.assertEqual(response.status_code, 200)
+
+        self.perfil.rol = PerfilUsuario.RolChoices.OPERADOR_CUBA
+        self.perfil.save()
+        response = client.patch(
+            f"/api/empresas/{self.empresa.id}/",
+            {"telefono": "+5355123456"},
+            format="json",
+            HTTP_X_TENANT_SLUG="empresa-a",
+        )
+        self.assertEqual(response.status_code, 403)
@@ -6,6 +6,7 @@ Proporciona funciones helper para trabajar con empresas y usuarios.
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ValidationError
 from django.db import transaction
+from django.db.models import Count, Q
 
 from .models import Empresa, PerfilUsuario
 
@@ -235,23 +236,21 @@ class TenantUtils:
         Returns:
             dict: Estadísticas de la empresa
         """
-        perfiles = PerfilUsuario.objects.filter(empresa=empresa, activo=True)
-
-        return {
-            "total_usuarios": perfiles.count(),
-            "duenos": perfiles.filter(
-                rol=PerfilUsuario.RolChoices.DUENO
-            ).count(),
-            "operadores_miami": perfiles.filter(
-                rol=PerfilUsuario.RolChoices.OPERADOR_MIAMI
-            ).count(),
-            "operadores_cuba": perfiles.filter(
-                rol=PerfilUsuario.RolChoices.OPERADOR_CUBA
-            ).count(),
-            "remitentes": perfiles.filter(
-                rol=PerfilUsuario.RolChoices.REMITENTE
-            ).count(),
-            "destinatarios": perfiles.filter(
-                rol=PerfilUsuario.RolChoices.DESTINATARIO
-            ).count(),
+        roles = {
+            "duenos": PerfilUsuario.RolChoices.DUENO,
+            "operadores_miami": PerfilUsuario.RolChoices.OPERADOR_MIAMI,
+            "operadores_cuba": PerfilUsuario.RolChoices.OPERADOR_CUBA,
+            "remitentes": PerfilUsuario.RolChoices.REMITENTE,
+            "destinatarios": PerfilUsuario.RolChoices.DESTINATARIO,
         }
+
+        # Un solo recorrido con agregados condicionales
+        return PerfilUsuario.objects.filter(
+            empresa=empresa, activo=True
+        ).aggregate(
+            total_usuarios=Count("id"),
+            **{
+                clave: Count("id", filter=Q(rol=rol))
+                for clave, rol in roles.items()
+            },
+        )
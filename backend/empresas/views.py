@@ -5,6 +5,7 @@ from rest_framework.response import Response
 from .models import Empresa, PerfilUsuario
 from .permissions import TenantPermission, require_rol
 from .serializers import EmpresaSerializer
+from .utils import TenantUtils
 
 
 class EmpresaViewSet(viewsets.ModelViewSet):
@@ -23,6 +24,7 @@ class EmpresaViewSet(viewsets.ModelViewSet):
         - Lectura (list, retrieve, mi_empresa, mis_perfiles): Todos los usuarios
         - Modificación (update, partial_update): Solo dueño
         - Creación/eliminación: Solo dueño
+        - Estadísticas y métricas: Dueño y operadores
         """
         if self.action in ["list", "retrieve", "mi_empresa", "mis_perfiles"]:
             # Lectura: Todos los usuarios autenticados con tenant
@@ -32,6 +34,10 @@ class EmpresaViewSet(viewsets.ModelViewSet):
             from .permissions import EmpresaOwnerPermission
 
             permission_classes = [TenantPermission, EmpresaOwnerPermission]
+        elif self.action in ["estadisticas", "metricas"]:
+            from .permissions import EmpresaOperatorPermission
+
+            permission_classes = [TenantPermission, EmpresaOperatorPermission]
         else:
             permission_classes = [TenantPermission]
         return [permission() for permission in permission_classes]
@@ -95,3 +101,63 @@ class EmpresaViewSet(viewsets.ModelViewSet):
         ]
 
         return Response(data)
+
+    @action(detail=False, methods=["get"])
+    def estadisticas(self, request):
+        """
+        Endpoint con las estadísticas de la empresa actual para los
+        dashboards: envíos (total, peso y valor declarado, globales y por
+        estado) y usuarios por rol
+        """
+        from envios.estadisticas import estadisticas_envios
+
+        if not hasattr(request, "tenant") or not request.tenant:
+            return Response(
+                {"error": "No hay empresa en el contexto"}, status=400
+            )
+
+        return Response(
+            {
+                "envios": estadisticas_envios(request.tenant),
+                "usuarios": TenantUtils.obtener_estadisticas_empresa(
+                    request.tenant
+                ),
+            }
+        )
+
+    @action(detail=False, methods=["get"])
+    def metricas(self, request):
+        """
+        Endpoint con series temporales de envíos de la empresa actual
+        (creados, entregados, devueltos y tiempo medio por estado), leídas
+        de los rollups de métricas.
+
+        Parámetros: intervalo (hora, dia, semana), desde, hasta (ISO 8601)
+        y estados (repetible)
+        """
+        from envios.metricas import serie_metricas
+        from envios.serializers import MetricasQuerySerializer
+
+        if not hasattr(request, "tenant") or not request.tenant:
+            return Response(
+                {"error": "No hay empresa en el contexto"}, status=400
+            )
+
+        serializer = MetricasQuerySerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        parametros = serializer.validated_data
+
+        return Response(
+            {
+                "intervalo": parametros["intervalo"],
+                "desde": parametros["desde"],
+                "hasta": parametros["hasta"],
+                "serie": serie_metricas(
+                    request.tenant,
+                    parametros["intervalo"],
+                    parametros["desde"],
+                    parametros["hasta"],
+                    estados=parametros.get("estados"),
+                ),
+            }
+        )
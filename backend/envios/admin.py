@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import Envio, HistorialEstado
+from .busqueda import buscar_envios
+from .models import Envio, HistorialEstado, NotificacionEmail
 
 class HistorialEstadoInline(admin.TabularInline):
     model = HistorialEstado
@@ -38,6 +39,12 @@ class EnvioAdmin(admin.ModelAdmin):
         }),
     )
     
+    def get_search_results(self, request, queryset, search_term):
+        # Usar la búsqueda full-text en lugar de un OR de icontains
+        if not search_term:
+            return queryset, False
+        return buscar_envios(queryset, search_term), False
+
     def save_model(self, request, obj, form, change):
         if not change:  # Si es una creación nueva
             obj.creado_por = request.user
@@ -63,3 +70,11 @@ class HistorialEstadoAdmin(admin.ModelAdmin):
     def has_add_permission(self, request):
         # Desactivar la creación directa de historiales (deben crearse a través del Envio)
         return False
+
+
+@admin.register(NotificacionEmail)
+class NotificacionEmailAdmin(admin.ModelAdmin):
+    list_display = ('envio', 'destinatario', 'estado', 'intentos', 'proximo_intento', 'fecha_envio')
+    list_filter = ('estado', 'fecha_creacion')
+    search_fields = ('envio__numero_guia', 'destinatario', 'asunto')
+    readonly_fields = ('envio', 'destinatario', 'asunto', 'mensaje_html', 'mensaje_texto', 'fecha_creacion', 'fecha_envio', 'ultimo_error')
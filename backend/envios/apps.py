@@ -0,0 +1,9 @@
+from django.apps import AppConfig
+
+
+class EnviosConfig(AppConfig):
+    name = "envios"
+
+    def ready(self):
+        # Registrar señales de invalidación de la caché de rastreo
+        from . import signals  # noqa: F401
@@ -0,0 +1,96 @@
+"""
+Búsqueda full-text de envíos.
+
+En PostgreSQL usa la columna Envio.busqueda (tsvector mantenido por un
+trigger, migración 0008) con su índice GIN: los términos se buscan por
+prefijo y los resultados se ordenan por relevancia. En otros motores cae a
+icontains sobre los mismos campos.
+"""
+
+import re
+
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connection
+from django.db.models import F, Q
+from rest_framework import filters
+
+CONFIGURACION = "simple"
+
+# Campos de cada peso del documento de búsqueda (debe coincidir con el
+# trigger de la migración 0008)
+CAMPOS_POR_PESO = {
+    "A": ("numero_guia", "estado_actual"),
+    "B": ("remitente_nombre", "remitente_telefono"),
+    "C": ("destinatario_nombre", "destinatario_telefono"),
+    "D": ("descripcion",),
+}
+PESO_REMITENTE = "B"
+PESO_DESTINATARIO = "C"
+
+TOKEN_PATTERN = re.compile(r"[^\W_]+")
+
+
+def tokens_busqueda(termino):
+    """
+    Divide el término en tokens seguros para una tsquery (solo letras y
+    dígitos, en minúsculas).
+    """
+    return TOKEN_PATTERN.findall((termino or "").lower())
+
+
+def buscar_envios(queryset, termino, pesos=None):
+    """
+    Filtra `queryset` por el término de búsqueda.
+
+    Cada token debe aparecer (por prefijo) en alguno de los campos de los
+    pesos indicados; sin pesos se busca en todos.
+
+    Args:
+        queryset (QuerySet): Envíos sobre los que buscar
+        termino (str): Texto libre introducido por el usuario
+        pesos (str, optional): Pesos a considerar, p. ej. "B" o "BC"
+
+    Returns:
+        QuerySet: Envíos coincidentes, ordenados por relevancia en
+        PostgreSQL
+    """
+    tokens = tokens_busqueda(termino)
+    if not tokens:
+        return queryset.none()
+
+    if connection.vendor == "postgresql":
+        consulta = SearchQuery(
+            " & ".join(f"{token}:*{pesos or ''}" for token in tokens),
+            search_type="raw",
+            config=CONFIGURACION,
+        )
+        return (
+            queryset.filter(busqueda=consulta)
+            .annotate(relevancia=SearchRank(F("busqueda"), consulta))
+            .order_by("-relevancia", "-fecha_creacion")
+        )
+
+    campos = [
+        campo
+        for peso, campos_peso in CAMPOS_POR_PESO.items()
+        if not pesos or peso in pesos
+        for campo in campos_peso
+    ]
+    for token in tokens:
+        condicion = Q()
+        for campo in campos:
+            condicion |= Q(**{f"{campo}__icontains": token})
+        queryset = queryset.filter(condicion)
+    return queryset
+
+
+class EnvioSearchFilter(filters.SearchFilter):
+    """
+    SearchFilter de DRF respaldado por buscar_envios (parámetro ?search=).
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        terminos = self.get_search_terms(request)
+        if not terminos:
+            return queryset
+        return buscar_envios(queryset, " ".join(terminos))
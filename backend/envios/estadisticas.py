@@ -0,0 +1,216 @@
+"""
+Contadores de envíos por empresa y estado para los dashboards.
+
+ContadorEnvios guarda, por (empresa, estado), el número de envíos y la
+suma de peso y valor declarado. Las escrituras aplican deltas con
+UPDATE ... SET total = total + n en la misma transacción que el cambio del
+envío, así que leer las estadísticas de una empresa es leer a lo sumo una
+fila por estado en lugar de agrupar toda la tabla de envíos.
+
+Las señales de Envio cubren las escrituras normales (vistas, admin); las
+escrituras en bloque (update()/bulk_create) llaman a registrar_envios o
+registrar_cambios_estado. reconciliar_contadores recalcula los totales
+desde los envíos y corrige cualquier desviación.
+"""
+
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.utils import timezone
+
+from .models import ContadorEnvios, Envio
+
+CAMPOS = ("total", "peso_total", "valor_declarado_total")
+
+
+def valores_envio(envio):
+    """
+    (empresa_id, estado, peso, valor_declarado) de un envío, la parte que
+    afecta a los contadores.
+    """
+    # Los valores asignados aún sin guardar pueden venir como str o float
+    return (
+        envio.empresa_id,
+        envio.estado_actual,
+        Decimal(str(envio.peso or 0)),
+        Decimal(str(envio.valor_declarado or 0)),
+    )
+
+
+def _acumular(deltas, valores, signo):
+    empresa_id, estado, peso, valor = valores
+    if empresa_id is None:
+        return
+    delta = deltas[(empresa_id, estado)]
+    delta[0] += signo
+    delta[1] += signo * peso
+    delta[2] += signo * valor
+
+
+def aplicar_deltas(deltas):
+    """
+    Suma los deltas {(empresa_id, estado): [total, peso, valor]} a los
+    contadores. Las filas se actualizan en orden para que dos transacciones
+    concurrentes no se bloqueen mutuamente.
+    """
+    ahora = timezone.now()
+    for (empresa_id, estado), (total, peso, valor) in sorted(deltas.items()):
+        if not (total or peso or valor):
+            continue
+        cambios = {
+            "total": F("total") + total,
+            "peso_total": F("peso_total") + peso,
+            "valor_declarado_total": F("valor_declarado_total") + valor,
+            "fecha_actualizacion": ahora,
+        }
+        filtro = ContadorEnvios.objects.filter(
+            empresa_id=empresa_id, estado=estado
+        )
+        if filtro.update(**cambios) or total < 0:
+            # Sin fila que descontar no hay nada que hacer: la
+            # reconciliación la recrea si hiciera falta
+            continue
+        try:
+            with transaction.atomic():
+                ContadorEnvios.objects.create(
+                    empresa_id=empresa_id,
+                    estado=estado,
+                    total=total,
+                    peso_total=peso,
+                    valor_declarado_total=valor,
+                    fecha_actualizacion=ahora,
+                )
+        except IntegrityError:
+            # Otra transacción creó la fila entre el UPDATE y el INSERT
+            filtro.update(**cambios)
+
+
+def registrar_envios(envios, signo=1):
+    """
+    Suma (o resta, con signo=-1) los envíos indicados a los contadores.
+    """
+    deltas = defaultdict(lambda: [0, Decimal("0"), Decimal("0")])
+    for envio in envios:
+        _acumular(deltas, valores_envio(envio), signo)
+    aplicar_deltas(deltas)
+
+
+def registrar_cambio(anteriores, actuales):
+    """
+    Mueve un envío de sus valores anteriores a los actuales (tuplas de
+    valores_envio). Cualquiera de los dos puede ser None (alta o baja).
+    """
+    deltas = defaultdict(lambda: [0, Decimal("0"), Decimal("0")])
+    if anteriores is not None:
+        _acumular(deltas, anteriores, -1)
+    if actuales is not None:
+        _acumular(deltas, actuales, 1)
+    aplicar_deltas(deltas)
+
+
+def registrar_cambios_estado(cambios):
+    """
+    Registra una lista de (envio, estado_anterior) de un cambio de estado
+    en bloque. Los envíos ya llevan el estado nuevo.
+    """
+    deltas = defaultdict(lambda: [0, Decimal("0"), Decimal("0")])
+    for envio, estado_anterior in cambios:
+        actuales = valores_envio(envio)
+        _acumular(deltas, (actuales[0], estado_anterior, *actuales[2:]), -1)
+        _acumular(deltas, actuales, 1)
+    aplicar_deltas(deltas)
+
+
+def reconciliar_contadores(empresa_ids=None):
+    """
+    Recalcula los contadores desde la tabla de envíos.
+
+    Por cada empresa bloquea primero sus contadores: las escrituras
+    concurrentes esperan a que termine y aplican su delta sobre el valor
+    ya recalculado, de modo que no se pierde ni se duplica ningún cambio.
+
+    Returns:
+        int: Número de contadores que estaban desviados
+    """
+    if empresa_ids is None:
+        empresa_ids = Envio.objects.order_by().values_list(
+            "empresa_id", flat=True
+        )
+        empresa_ids = set(empresa_ids) | set(
+            ContadorEnvios.objects.values_list("empresa_id", flat=True)
+        )
+
+    corregidos = 0
+    for empresa_id in sorted(set(empresa_ids)):
+        with transaction.atomic():
+            actuales = {
+                contador.estado: contador
+                for contador in ContadorEnvios.objects.select_for_update()
+                .filter(empresa_id=empresa_id)
+                .order_by("estado")
+            }
+            reales = {
+                fila["estado_actual"]: fila
+                for fila in Envio.objects.filter(empresa_id=empresa_id)
+                .order_by()
+                .values("estado_actual")
+                .annotate(
+                    total=Count("id"),
+                    peso_total=Sum("peso"),
+                    valor_declarado_total=Sum("valor_declarado"),
+                )
+            }
+
+            ahora = timezone.now()
+            for estado in set(actuales) | set(reales):
+                fila = reales.get(estado, {})
+                valores = {campo: fila.get(campo) or 0 for campo in CAMPOS}
+                contador = actuales.get(estado)
+                if contador is None:
+                    contador = ContadorEnvios(
+                        empresa_id=empresa_id, estado=estado
+                    )
+                elif all(
+                    getattr(contador, campo) == valor
+                    for campo, valor in valores.items()
+                ):
+                    continue
+
+                for campo, valor in valores.items():
+                    setattr(contador, campo, valor)
+                contador.fecha_actualizacion = ahora
+                contador.save()
+                corregidos += 1
+
+    return corregidos
+
+
+def estadisticas_envios(empresa):
+    """
+    Totales de envíos de la empresa, globales y por estado, leídos de los
+    contadores.
+    """
+    por_estado = {
+        estado: {"total": 0, "peso_total": 0, "valor_declarado_total": 0}
+        for estado in Envio.EstadoChoices.values
+    }
+    for contador in ContadorEnvios.objects.filter(empresa=empresa):
+        por_estado[contador.estado] = {
+            campo: getattr(contador, campo) for campo in CAMPOS
+        }
+
+    resumen = {
+        campo: sum(valores[campo] for valores in por_estado.values())
+        for campo in CAMPOS
+    }
+    return {
+        **resumen,
+        "activos": sum(
+            valores["total"]
+            for estado, valores in por_estado.items()
+            if estado not in Envio.ESTADOS_FINALES
+        ),
+        "por_estado": por_estado,
+    }
@@ -0,0 +1,121 @@
+"""
+Cambios de estado en lote.
+
+Aplica una misma transición a muchos envíos con un único UPDATE y un
+bulk_create del historial; las notificaciones se encolan en la bandeja de
+salida para su envío asíncrono.
+"""
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .estadisticas import registrar_cambios_estado
+from .eventos import publicar_cambios_estado
+from .models import Envio, HistorialEstado
+from .notifications import encolar_notificaciones
+from .rastreo import programar_snapshots
+
+
+def cambiar_estado_lote(
+    queryset,
+    estado,
+    numeros_guia=(),
+    ids=(),
+    comentario="",
+    ubicacion="",
+    usuario=None,
+):
+    """
+    Cambia el estado de los envíos de `queryset` identificados por número de
+    guía o ID.
+
+    Args:
+        queryset (QuerySet): Envíos visibles para el usuario (tenant/rol)
+        estado (str): Estado destino
+        numeros_guia (list): Números de guía a actualizar
+        ids (list): IDs de envío a actualizar
+        comentario (str): Comentario para el historial
+        ubicacion (str): Ubicación para el historial
+        usuario (Usuario): Usuario que registra el cambio
+
+    Returns:
+        dict: {"actualizados": int, "resultados": [...]} con un resultado
+        por identificador solicitado, en el mismo orden
+    """
+    numeros_guia = list(dict.fromkeys(numeros_guia))
+    ids = list(dict.fromkeys(ids))
+    ahora = timezone.now()
+
+    with transaction.atomic():
+        envios = list(
+            queryset.filter(Q(numero_guia__in=numeros_guia) | Q(id__in=ids))
+            .select_for_update(of=("self",))
+            .order_by("id")
+        )
+        por_guia = {envio.numero_guia: envio for envio in envios}
+        por_id = {envio.id: envio for envio in envios}
+
+        solicitados = [
+            ("numero_guia", n, por_guia.get(n)) for n in numeros_guia
+        ]
+        solicitados += [("id", i, por_id.get(i)) for i in ids]
+
+        resultados = []
+        cambios = {}
+        for campo, valor, envio in solicitados:
+            resultado = {campo: valor}
+            if envio is None:
+                resultado["error"] = "Envío no encontrado"
+            elif envio.id in cambios:
+                resultado.update(cambios[envio.id][1])
+            elif not envio.puede_cambiar_a(estado):
+                resultado["error"] = (
+                    f"Transición inválida: {envio.estado_actual} → {estado}"
+                )
+            else:
+                resultado.update(
+                    {
+                        "id": envio.id,
+                        "numero_guia": envio.numero_guia,
+                        "estado_anterior": envio.estado_actual,
+                        "estado": estado,
+                    }
+                )
+                cambios[envio.id] = (envio, resultado)
+            resultados.append(resultado)
+
+        if cambios:
+            Envio.objects.filter(id__in=cambios.keys()).update(
+                estado_actual=estado,
+                actualizado_por=usuario,
+                ultima_actualizacion=ahora,
+            )
+            HistorialEstado.objects.bulk_create(
+                [
+                    HistorialEstado(
+                        envio=envio,
+                        empresa_id=envio.empresa_id,
+                        estado=estado,
+                        comentario=comentario,
+                        ubicacion=ubicacion,
+                        registrado_por=usuario,
+                    )
+                    for envio, _ in cambios.values()
+                ]
+            )
+
+            notificaciones = []
+            for envio, resultado in cambios.values():
+                envio.estado_actual = estado
+                envio.actualizado_por = usuario
+                envio.ultima_actualizacion = ahora
+                notificaciones.append((envio, resultado["estado_anterior"]))
+            encolar_notificaciones(notificaciones)
+            publicar_cambios_estado(notificaciones)
+
+            # update()/bulk_create no disparan señales
+            registrar_cambios_estado(notificaciones)
+            programar_snapshots(*cambios.keys())
+
+    return {"actualizados": len(cambios), "resultados": resultados}
@@ -0,0 +1,284 @@
+"""
+Códigos QR y etiquetas imprimibles de envíos.
+
+El QR lleva el mismo JSON compacto que generaba el frontend
+({"t", "r", "s", "w", "d"}), así que el validador de la app sigue
+funcionando, pero se genera aquí (segno) sin depender de servicios
+externos.
+
+Las etiquetas se dibujan con Pillow a ETIQUETAS_DPI y se guardan en caché
+como PNG con una clave que incluye numero_guia y la ultima_actualizacion
+del envío y de su empresa (la etiqueta lleva su nombre): mientras ninguno
+cambie no se vuelve a dibujar. Los lotes se componen
+en un único PDF con una etiqueta por página (impresoras de etiquetas
+100 × 150 mm) o cuatro por página A4.
+"""
+
+import io
+import json
+import textwrap
+
+from core.instrumentacion import registrar_cache
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.utils import timezone
+from PIL import Image, ImageDraw, ImageFont
+
+MM_POR_PULGADA = 25.4
+
+# Tamaño de página y etiquetas por fila/columna de cada diseño (mm)
+DISENOS = {
+    "etiqueta": {"pagina": (100, 150), "columnas": 1, "filas": 1},
+    "a4": {"pagina": (210, 297), "columnas": 2, "filas": 2},
+}
+MARGEN_MM = 4
+
+CLAVE_ETIQUETA = (
+    "etiquetas:{numero_guia}:{version}:{version_empresa}:{ancho}x{alto}"
+)
+
+
+def _cache():
+    return caches[getattr(settings, "ETIQUETAS_CACHE_ALIAS", "default")]
+
+
+def _dpi():
+    return getattr(settings, "ETIQUETAS_DPI", 150)
+
+
+def _px(mm):
+    return round(mm * _dpi() / MM_POR_PULGADA)
+
+
+def contenido_qr(envio):
+    """
+    Texto del QR de un envío (formato del validador del frontend).
+    """
+    return json.dumps(
+        {
+            "t": envio.numero_guia,
+            "r": envio.destinatario_nombre,
+            "s": envio.remitente_nombre,
+            "w": float(envio.peso),
+            "d": timezone.localtime(envio.fecha_creacion).date().isoformat(),
+        },
+        ensure_ascii=False,
+        separators=(",", ":"),
+    )
+
+
+def imagen_qr(contenido, tamano):
+    """
+    QR como imagen en blanco y negro de aproximadamente `tamano` px de
+    lado, con cada módulo escalado a un número entero de píxeles.
+    """
+    try:
+        import segno
+    except ImportError:
+        raise ImproperlyConfigured("La generación de QR requiere 'segno'")
+
+    qr = segno.make(contenido, error="m", micro=False)
+    borde = 4
+    modulos = len(qr.matrix) + 2 * borde
+    escala = max(1, tamano // modulos)
+
+    imagen = Image.new("1", (modulos, modulos), 1)
+    pixeles = imagen.load()
+    for y, fila in enumerate(qr.matrix):
+        for x, modulo in enumerate(fila):
+            if modulo:
+                pixeles[x + borde, y + borde] = 0
+    return imagen.resize(
+        (modulos * escala, modulos * escala), Image.Resampling.NEAREST
+    )
+
+
+def png_qr(envio, tamano=300):
+    """
+    PNG del QR del envío.
+    """
+    buffer = io.BytesIO()
+    imagen_qr(contenido_qr(envio), tamano).save(buffer, "PNG", optimize=True)
+    return buffer.getvalue()
+
+
+def _fuente(tamano):
+    try:
+        return ImageFont.load_default(size=tamano)
+    except TypeError:
+        # Pillow sin soporte de tamaño en la fuente por defecto
+        return ImageFont.load_default()
+
+
+def _envolver(texto, fuente, ancho, max_lineas):
+    """
+    Parte `texto` en líneas que caben en `ancho` px (como mucho
+    `max_lineas`; la última se recorta con '…').
+    """
+    texto = " ".join((texto or "").split())
+    if not texto:
+        return []
+    caracteres = max(
+        8, int(ancho / max(fuente.getlength("n"), 1))
+    )  # estimación inicial por ancho medio
+    while True:
+        lineas = textwrap.wrap(texto, caracteres)
+        if (
+            all(fuente.getlength(linea) <= ancho for linea in lineas)
+            or caracteres <= 8
+        ):
+            break
+        caracteres -= 2
+    if len(lineas) > max_lineas:
+        lineas = lineas[:max_lineas]
+        lineas[-1] = lineas[-1][: max(caracteres - 1, 1)].rstrip() + "…"
+    return lineas
+
+
+def dibujar_etiqueta(envio, ancho, alto):
+    """
+    Dibuja la etiqueta del envío en una imagen de ancho × alto px.
+    """
+    imagen = Image.new("1", (ancho, alto), 1)
+    dibujo = ImageDraw.Draw(imagen)
+    margen = round(ancho * 0.04)
+    util = ancho - 2 * margen
+    grosor = max(2, ancho // 250)
+    y = margen
+
+    def texto(contenido, tamano, centrado=False):
+        nonlocal y
+        fuente = _fuente(tamano)
+        for linea in _envolver(contenido, fuente, util, 3):
+            x = margen
+            if centrado:
+                x = (ancho - fuente.getlength(linea)) / 2
+            dibujo.text((x, y), linea, font=fuente, fill=0)
+            y += round(tamano * 1.2)
+
+    def separador():
+        nonlocal y
+        y += round(alto * 0.01)
+        dibujo.line((margen, y, ancho - margen, y), fill=0, width=grosor)
+        y += round(alto * 0.015)
+
+    dibujo.rectangle(
+        (grosor, grosor, ancho - grosor, alto - grosor),
+        outline=0,
+        width=grosor,
+    )
+
+    pequeno = round(alto * 0.025)
+    normal = round(alto * 0.03)
+    grande = round(alto * 0.045)
+
+    texto(envio.empresa.nombre, normal)
+    fecha = timezone.localtime(envio.fecha_creacion)
+    texto(f"{fecha:%d/%m/%Y}  ·  {envio.peso} kg", pequeno)
+    separador()
+
+    texto(envio.numero_guia, grande, centrado=True)
+    lado_qr = min(util, round(alto * 0.3))
+    qr = imagen_qr(contenido_qr(envio), lado_qr)
+    imagen.paste(qr, ((ancho - qr.width) // 2, y))
+    y += qr.height
+    separador()
+
+    texto("DESTINATARIO", pequeno)
+    texto(envio.destinatario_nombre, grande)
+    texto(envio.destinatario_direccion, normal)
+    texto(f"Tel: {envio.destinatario_telefono}", normal)
+    separador()
+
+    texto("REMITENTE", pequeno)
+    texto(envio.remitente_nombre, normal)
+    texto(envio.remitente_telefono, pequeno)
+    separador()
+
+    texto(envio.descripcion, pequeno)
+    return imagen
+
+
+def imagen_etiqueta(envio, ancho, alto):
+    """
+    Imagen de la etiqueta, leída de la caché si ni el envío ni su empresa
+    han cambiado.
+    """
+    clave = CLAVE_ETIQUETA.format(
+        numero_guia=envio.numero_guia,
+        version=envio.ultima_actualizacion.timestamp(),
+        version_empresa=envio.empresa.ultima_actualizacion.timestamp(),
+        ancho=ancho,
+        alto=alto,
+    )
+    cache = _cache()
+    png = cache.get(clave)
+    registrar_cache("etiquetas", aciertos=png is not None, fallos=png is None)
+    if png is not None:
+        return Image.open(io.BytesIO(png))
+
+    imagen = dibujar_etiqueta(envio, ancho, alto)
+    buffer = io.BytesIO()
+    imagen.save(buffer, "PNG", optimize=True)
+    cache.set(
+        clave,
+        buffer.getvalue(),
+        getattr(settings, "ETIQUETAS_CACHE_TIMEOUT", 86400),
+    )
+    return imagen
+
+
+def _tamano_etiqueta(diseno):
+    ancho, alto = DISENOS[diseno]["pagina"]
+    if diseno == "etiqueta":
+        return _px(ancho), _px(alto)
+    columnas, filas = DISENOS[diseno]["columnas"], DISENOS[diseno]["filas"]
+    return (
+        _px(ancho / columnas - 2 * MARGEN_MM),
+        _px(alto / filas - 2 * MARGEN_MM),
+    )
+
+
+def png_etiqueta(envio, diseno="etiqueta"):
+    """
+    PNG de la etiqueta del envío.
+    """
+    buffer = io.BytesIO()
+    imagen_etiqueta(envio, *_tamano_etiqueta(diseno)).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def pdf_etiquetas(envios, diseno="etiqueta"):
+    """
+    PDF listo para imprimir con las etiquetas de los envíos, en orden.
+    """
+    configuracion = DISENOS[diseno]
+    columnas, filas = configuracion["columnas"], configuracion["filas"]
+    ancho_pagina, alto_pagina = (_px(mm) for mm in configuracion["pagina"])
+    ancho, alto = _tamano_etiqueta(diseno)
+    por_pagina = columnas * filas
+
+    paginas = []
+    for indice, envio in enumerate(envios):
+        if indice % por_pagina == 0:
+            paginas.append(Image.new("1", (ancho_pagina, alto_pagina), 1))
+        celda = indice % por_pagina
+        x = (celda % columnas) * ancho_pagina // columnas
+        y = (celda // columnas) * alto_pagina // filas
+        if por_pagina > 1:
+            x, y = x + _px(MARGEN_MM), y + _px(MARGEN_MM)
+        paginas[-1].paste(imagen_etiqueta(envio, ancho, alto), (x, y))
+
+    if not paginas:
+        paginas.append(Image.new("1", (ancho_pagina, alto_pagina), 1))
+
+    buffer = io.BytesIO()
+    paginas[0].save(
+        buffer,
+        "PDF",
+        resolution=_dpi(),
+        save_all=True,
+        append_images=paginas[1:],
+    )
+    return buffer.getvalue()
@@ -0,0 +1,250 @@
+"""
+Publicación de eventos de envíos para los clientes en tiempo real (SSE).
+
+Los eventos se publican en canales por empresa ("empresa:<id>") y por guía
+("guia:<numero_guia>") a través de un broker configurable en
+EVENTOS_BROKER:
+
+- MemoriaBroker: en el propio proceso. Sirve para desarrollo y para
+  despliegues ASGI de un solo proceso.
+- RedisBroker: Redis Streams. Comparte los eventos entre procesos y
+  conserva un historial por canal para reanudar con Last-Event-ID.
+
+Cada broker guarda los últimos EVENTOS_HISTORIAL eventos por canal.
+Suscribirse a un canal no crea nada en el broker: los nombres de canal
+vienen del cliente y solo publicar() (cambios de envíos reales) añade
+historial.
+"""
+
+import asyncio
+import itertools
+import json
+import logging
+import threading
+import weakref
+from collections import defaultdict, deque
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.utils.module_loading import import_string
+from rest_framework.utils.encoders import JSONEncoder
+
+logger = logging.getLogger(__name__)
+
+
+def canal_empresa(empresa_id):
+    return f"empresa:{empresa_id}"
+
+
+def canal_guia(numero_guia):
+    return f"guia:{numero_guia}"
+
+
+class MemoriaBroker:
+    """
+    Broker en memoria del proceso. publicar() puede llamarse desde
+    cualquier hilo; los suscriptores son corrutinas de un event loop.
+    """
+
+    def __init__(self, historial=100):
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._historial = defaultdict(lambda: deque(maxlen=historial))
+        self._suscriptores = defaultdict(set)
+
+    def publicar(self, canal, tipo, datos):
+        with self._lock:
+            evento = {
+                "id": str(next(self._ids)),
+                "tipo": tipo,
+                "datos": json.dumps(datos, cls=JSONEncoder),
+            }
+            self._historial[canal].append(evento)
+            suscriptores = list(self._suscriptores.get(canal, ()))
+
+        for loop, cola in suscriptores:
+            try:
+                loop.call_soon_threadsafe(cola.put_nowait, evento)
+            except RuntimeError:
+                # El loop del suscriptor ya se cerró
+                pass
+        return evento["id"]
+
+    async def suscribir(self, canal, ultimo_id=None, espera=15):
+        """
+        Generador asíncrono de eventos del canal. Primero entrega los
+        eventos del historial posteriores a `ultimo_id` y después los
+        nuevos; produce None cada `espera` segundos sin eventos.
+        """
+        suscriptor = (asyncio.get_running_loop(), asyncio.Queue())
+        with self._lock:
+            self._suscriptores[canal].add(suscriptor)
+            pendientes = list(self._historial.get(canal, ()))
+
+        try:
+            desde = int(ultimo_id) if ultimo_id else None
+        except ValueError:
+            desde = None
+
+        try:
+            ultimo = 0
+            if desde is not None:
+                for evento in pendientes:
+                    if int(evento["id"]) > desde:
+                        ultimo = int(evento["id"])
+                        yield evento
+            while True:
+                try:
+                    evento = await asyncio.wait_for(
+                        suscriptor[1].get(), timeout=espera
+                    )
+                except asyncio.TimeoutError:
+                    yield None
+                    continue
+                # Descartar los ya entregados desde el historial
+                if int(evento["id"]) > ultimo:
+                    yield evento
+        finally:
+            with self._lock:
+                suscriptores = self._suscriptores[canal]
+                suscriptores.discard(suscriptor)
+                if not suscriptores:
+                    del self._suscriptores[canal]
+
+
+class RedisBroker:
+    """
+    Broker sobre Redis Streams (un stream por canal, acotado con MAXLEN).
+    Requiere el paquete redis.
+
+    Los suscriptores de un proceso comparten un cliente asíncrono (uno por
+    event loop) cuyo pool se limita a EVENTOS_MAX_CONEXIONES: cada stream
+    abierto ocupa una conexión solo mientras espera en XREAD.
+    """
+
+    PREFIJO = "eventos:"
+
+    def __init__(self, historial=100, url=None):
+        try:
+            import redis
+            import redis.asyncio
+        except ImportError:
+            raise ImproperlyConfigured(
+                "RedisBroker requiere el paquete 'redis'"
+            )
+        self.historial = historial
+        self.url = url or getattr(
+            settings, "EVENTOS_REDIS_URL", "redis://redis:6379/2"
+        )
+        self._cliente = redis.Redis.from_url(self.url)
+        self._asyncio = redis.asyncio
+        self._clientes_async = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def _cliente_async(self):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            cliente = self._clientes_async.get(loop)
+            if cliente is None:
+                cliente = self._asyncio.Redis.from_url(
+                    self.url,
+                    max_connections=getattr(
+                        settings, "EVENTOS_MAX_CONEXIONES", 1000
+                    ),
+                )
+                self._clientes_async[loop] = cliente
+        return cliente
+
+    def publicar(self, canal, tipo, datos):
+        evento_id = self._cliente.xadd(
+            self.PREFIJO + canal,
+            {"tipo": tipo, "datos": json.dumps(datos, cls=JSONEncoder)},
+            maxlen=self.historial,
+            approximate=True,
+        )
+        return evento_id.decode()
+
+    async def suscribir(self, canal, ultimo_id=None, espera=15):
+        clave = self.PREFIJO + canal
+        cliente = self._cliente_async()
+        desde = ultimo_id or "$"
+        while True:
+            respuesta = await cliente.xread(
+                {clave: desde}, block=int(espera * 1000), count=100
+            )
+            if not respuesta:
+                yield None
+                continue
+            for evento_id, campos in respuesta[0][1]:
+                desde = evento_id.decode()
+                yield {
+                    "id": desde,
+                    "tipo": campos[b"tipo"].decode(),
+                    "datos": campos[b"datos"].decode(),
+                }
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def obtener_broker():
+    """
+    Devuelve la instancia (única por proceso) del broker configurado.
+    """
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                clase = import_string(
+                    getattr(
+                        settings,
+                        "EVENTOS_BROKER",
+                        "envios.eventos.MemoriaBroker",
+                    )
+                )
+                _broker = clase(
+                    historial=getattr(settings, "EVENTOS_HISTORIAL", 100)
+                )
+    return _broker
+
+
+def publicar_cambios_estado(cambios):
+    """
+    Publica tras el commit un evento 'estado' por cada (envio,
+    estado_anterior), en el canal de su empresa y en el de su guía. El
+    canal de la guía es público y solo lleva datos de rastreo.
+    """
+    eventos = []
+    for envio, estado_anterior in cambios:
+        publico = {
+            "numero_guia": envio.numero_guia,
+            "estado": envio.estado_actual,
+            "estado_display": envio.get_estado_actual_display(),
+            "fecha_actualizacion": envio.ultima_actualizacion,
+        }
+        eventos.append((canal_guia(envio.numero_guia), publico))
+        if envio.empresa_id:
+            eventos.append(
+                (
+                    canal_empresa(envio.empresa_id),
+                    {
+                        **publico,
+                        "id": envio.id,
+                        "estado_anterior": estado_anterior,
+                    },
+                )
+            )
+
+    def _publicar():
+        # Un broker caído no debe hacer fallar la escritura ya confirmada
+        try:
+            broker = obtener_broker()
+            for canal, datos in eventos:
+                broker.publicar(canal, "estado", datos)
+        except Exception as e:
+            logger.warning(f"Error publicando eventos de estado: {e}")
+
+    if eventos:
+        transaction.on_commit(_publicar)
@@ -0,0 +1,268 @@
+"""
+Exportación de envíos en CSV o XLSX por streaming.
+
+Las filas se leen con values_list().iterator(chunk_size), que en PostgreSQL
+usa un cursor del lado del servidor, y se escriben por bloques en un
+generador: la memoria no depende del número de envíos y la respuesta
+empieza a llegar al cliente desde el primer bloque.
+
+Las columnas usan los nombres de los campos, así que un CSV exportado se
+puede volver a importar con envios.importacion.
+
+El XLSX se genera sin dependencias: es un zip con una sola hoja escrita
+como XML con cadenas en línea, que zipfile puede emitir sobre un flujo no
+posicionable.
+
+Bajo ASGI, Django 4.2 consume los iteradores síncronos de una
+StreamingHttpResponse con sync_to_async(list), es decir, entero en memoria
+antes de enviar nada: iterar_async() los recorre bloque a bloque.
+"""
+
+import csv
+import io
+import re
+import zipfile
+from datetime import date, datetime
+from decimal import Decimal
+from xml.sax.saxutils import escape
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils import timezone
+
+COLUMNAS = (
+    "numero_guia",
+    "estado_actual",
+    "fecha_creacion",
+    "fecha_estimada_entrega",
+    "descripcion",
+    "peso",
+    "valor_declarado",
+    "precio",
+    "remitente_nombre",
+    "remitente_direccion",
+    "remitente_telefono",
+    "remitente_email",
+    "destinatario_nombre",
+    "destinatario_direccion",
+    "destinatario_telefono",
+    "destinatario_email",
+    "notas",
+    "ultima_actualizacion",
+)
+
+FORMATOS = {
+    "csv": ("text/csv; charset=utf-8", "csv"),
+    "xlsx": (
+        "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        "xlsx",
+    ),
+}
+
+# Celdas que una hoja de cálculo interpretaría como fórmula. Un signo
+# seguido de un dígito (teléfonos, importes) se deja tal cual.
+FORMULA = re.compile(r"^(?:[=@\t\r]|[+-](?!\d))")
+
+# Caracteres de control que no admite XML 1.0
+CONTROL_XML = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+
+def _chunk_size():
+    return getattr(settings, "EXPORTACION_CHUNK_SIZE", 2000)
+
+
+def _texto(valor):
+    if valor is None:
+        return ""
+    if isinstance(valor, datetime):
+        return timezone.localtime(valor).isoformat(timespec="seconds")
+    if isinstance(valor, date):
+        return valor.isoformat()
+    valor = str(valor)
+    if FORMULA.match(valor):
+        return "'" + valor
+    return valor
+
+
+def filas_envios(queryset, chunk_size=None):
+    """
+    Tuplas con los valores de COLUMNAS de cada envío, en el orden del
+    queryset y sin instanciar modelos ni precargar relaciones.
+    """
+    return (
+        queryset.select_related(None)
+        .prefetch_related(None)
+        .values_list(*COLUMNAS)
+        .iterator(chunk_size=chunk_size or _chunk_size())
+    )
+
+
+def _por_bloques(filas, tamano):
+    bloque = []
+    for fila in filas:
+        bloque.append(fila)
+        if len(bloque) >= tamano:
+            yield bloque
+            bloque = []
+    if bloque:
+        yield bloque
+
+
+def exportar_csv(queryset, chunk_size=None):
+    """
+    Generador de bytes del CSV (UTF-8 con BOM para que Excel muestre bien
+    los acentos), un bloque de filas por iteración.
+    """
+    chunk_size = chunk_size or _chunk_size()
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+
+    escritor.writerow(COLUMNAS)
+    yield ("\ufeff" + buffer.getvalue()).encode("utf-8")
+
+    for bloque in _por_bloques(filas_envios(queryset, chunk_size), chunk_size):
+        buffer.seek(0)
+        buffer.truncate()
+        escritor.writerows(
+            [_texto(valor) for valor in fila] for fila in bloque
+        )
+        yield buffer.getvalue().encode("utf-8")
+
+
+class _Salida:
+    """
+    Destino no posicionable para zipfile que acumula lo escrito hasta que
+    el generador lo recoge.
+    """
+
+    def __init__(self):
+        self.partes = []
+
+    def write(self, datos):
+        self.partes.append(bytes(datos))
+        return len(datos)
+
+    def flush(self):
+        pass
+
+    def recoger(self):
+        datos = b"".join(self.partes)
+        self.partes = []
+        return datos
+
+
+def _celda(valor):
+    if isinstance(valor, (int, float, Decimal)):
+        return f"<c><v>{valor}</v></c>"
+    texto = escape(CONTROL_XML.sub("", _texto(valor)))
+    return (
+        '<c t="inlineStr"><is><t xml:space="preserve">' f"{texto}</t></is></c>"
+    )
+
+
+def _fila_xml(valores):
+    return "<row>" + "".join(_celda(valor) for valor in valores) + "</row>"
+
+
+XLSX_ARCHIVOS = {
+    "[Content_Types].xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/'
+        'content-types">'
+        '<Default Extension="rels" ContentType="application/'
+        'vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" ContentType="application/'
+        'vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="'
+        "application/vnd.openxmlformats-officedocument.spreadsheetml."
+        'worksheet+xml"/>'
+        "</Types>"
+    ),
+    "_rels/.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/'
+        '2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/'
+        'officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/>'
+        "</Relationships>"
+    ),
+    "xl/workbook.xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/'
+        '2006/main" xmlns:r="http://schemas.openxmlformats.org/'
+        'officeDocument/2006/relationships">'
+        '<sheets><sheet name="Envios" sheetId="1" r:id="rId1"/></sheets>'
+        "</workbook>"
+    ),
+    "xl/_rels/workbook.xml.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/'
+        '2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/'
+        'officeDocument/2006/relationships/worksheet" '
+        'Target="worksheets/sheet1.xml"/>'
+        "</Relationships>"
+    ),
+}
+
+
+def exportar_xlsx(queryset, chunk_size=None):
+    """
+    Generador de bytes de un libro XLSX con una hoja 'Envios'.
+    """
+    chunk_size = chunk_size or _chunk_size()
+    salida = _Salida()
+
+    with zipfile.ZipFile(salida, "w", zipfile.ZIP_DEFLATED) as libro:
+        for nombre, contenido in XLSX_ARCHIVOS.items():
+            libro.writestr(nombre, contenido)
+        yield salida.recoger()
+
+        with libro.open("xl/worksheets/sheet1.xml", "w") as hoja:
+            hoja.write(
+                b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                b'<worksheet xmlns="http://schemas.openxmlformats.org/'
+                b'spreadsheetml/2006/main"><sheetData>'
+            )
+            hoja.write(_fila_xml(COLUMNAS).encode("utf-8"))
+            for bloque in _por_bloques(
+                filas_envios(queryset, chunk_size), chunk_size
+            ):
+                filas = "".join(_fila_xml(fila) for fila in bloque)
+                hoja.write(filas.encode("utf-8"))
+                yield salida.recoger()
+            hoja.write(b"</sheetData></worksheet>")
+
+    yield salida.recoger()
+
+
+_FIN = object()
+
+
+async def iterar_async(generador):
+    """
+    Iterador asíncrono sobre un generador síncrono de bloques. Cada bloque
+    se produce en el hilo síncrono de Django (thread_sensitive), el mismo
+    que ejecutó la vista, así que el cursor de la base de datos sigue en
+    su conexión.
+    """
+    siguiente = sync_to_async(next, thread_sensitive=True)
+    try:
+        while True:
+            bloque = await siguiente(generador, _FIN)
+            if bloque is _FIN:
+                return
+            yield bloque
+    finally:
+        await sync_to_async(generador.close, thread_sensitive=True)()
+
+
+def exportar(queryset, formato="csv", chunk_size=None):
+    """
+    Generador de bytes del export en el formato indicado ('csv' o 'xlsx').
+    """
+    if formato == "xlsx":
+        return exportar_xlsx(queryset, chunk_size)
+    return exportar_csv(queryset, chunk_size)
@@ -0,0 +1,77 @@
+"""
+Asignación de números de guía.
+
+Los números salen de una secuencia de base de datos (SEQUENCE en
+PostgreSQL, tabla SecuenciaGuia como fallback), por lo que no requieren
+leer el último envío ni pueden repetirse entre operadores concurrentes.
+El prefijo es configurable por empresa en Empresa.configuracion.
+"""
+
+from django.db import connection, transaction
+from django.db.models import F
+
+SECUENCIA_GUIA = "envios_numero_guia_seq"
+PREFIJO_DEFAULT = "PKF"
+DIGITOS_GUIA = 8
+
+
+def prefijo_empresa(empresa=None):
+    """
+    Prefijo de guía de la empresa (configuracion["prefijo_guia"]).
+    """
+    if empresa is None:
+        return PREFIJO_DEFAULT
+    configuracion = empresa.configuracion or {}
+    return configuracion.get("prefijo_guia") or PREFIJO_DEFAULT
+
+
+def formatear_numero_guia(valor, prefijo=PREFIJO_DEFAULT):
+    return f"{prefijo}{valor:0{DIGITOS_GUIA}d}"
+
+
+def reservar_valores(cantidad=1):
+    """
+    Reserva `cantidad` valores únicos de la secuencia global.
+
+    En PostgreSQL los valores salen de nextval() y nunca se bloquean filas;
+    en otros motores se incrementa el contador de SecuenciaGuia en una sola
+    sentencia UPDATE y se devuelve el rango reservado.
+    """
+    if cantidad < 1:
+        return []
+
+    if connection.vendor == "postgresql":
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT nextval(%s) FROM generate_series(1, %s)",
+                [SECUENCIA_GUIA, cantidad],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    from .models import SecuenciaGuia
+
+    with transaction.atomic():
+        SecuenciaGuia.objects.get_or_create(nombre=SECUENCIA_GUIA)
+        SecuenciaGuia.objects.filter(nombre=SECUENCIA_GUIA).update(
+            ultimo_valor=F("ultimo_valor") + cantidad
+        )
+        ultimo = SecuenciaGuia.objects.values_list(
+            "ultimo_valor", flat=True
+        ).get(nombre=SECUENCIA_GUIA)
+
+    return list(range(ultimo - cantidad + 1, ultimo + 1))
+
+
+def asignar_numeros_guia(cantidad, empresa=None):
+    """
+    Pre-asigna un bloque de números de guía (importaciones masivas).
+    """
+    prefijo = prefijo_empresa(empresa)
+    return [
+        formatear_numero_guia(valor, prefijo)
+        for valor in reservar_valores(cantidad)
+    ]
+
+
+def siguiente_numero_guia(empresa=None):
+    return asignar_numeros_guia(1, empresa)[0]
@@ -0,0 +1,142 @@
+"""
+Importación masiva de envíos (manifiestos).
+
+Valida cada fila con las reglas de EnvioSerializer, asigna los números de
+guía por bloques y crea los envíos y su historial inicial con bulk_create
+por lotes. Las filas inválidas no detienen la importación: se devuelven
+con su índice y sus errores.
+"""
+
+import csv
+import io
+
+from django.conf import settings
+from django.db import transaction
+from rest_framework import serializers
+
+from .estadisticas import registrar_envios
+from .guias import asignar_numeros_guia
+from .models import Envio, HistorialEstado
+from .notifications import encolar_notificaciones
+from .rastreo import programar_snapshots
+from .serializers import EnvioSerializer
+from .tarifas import obtener_tarifa
+
+TAMANO_LOTE_DEFAULT = 500
+
+
+def leer_csv(archivo):
+    """
+    Convierte un CSV (bytes, texto o archivo subido) en una lista de dicts.
+    Las celdas vacías se omiten para que los campos opcionales no se
+    validen como valores inválidos.
+    """
+    contenido = archivo.read() if hasattr(archivo, "read") else archivo
+    if isinstance(contenido, bytes):
+        contenido = contenido.decode("utf-8-sig")
+
+    lector = csv.DictReader(io.StringIO(contenido))
+    return [
+        {
+            clave.strip(): valor.strip()
+            for clave, valor in fila.items()
+            if clave and valor is not None and valor.strip() != ""
+        }
+        for fila in lector
+    ]
+
+
+def validar_filas(filas):
+    """
+    Valida las filas con EnvioSerializer reutilizando una sola instancia.
+
+    Returns:
+        tuple: (validas, errores) donde validas es una lista de
+        (indice, validated_data) y errores una lista de
+        {"fila": indice, "errores": {...}}
+    """
+    serializer = EnvioSerializer()
+    validas = []
+    errores = []
+
+    for indice, fila in enumerate(filas):
+        if not isinstance(fila, dict):
+            errores.append(
+                {
+                    "fila": indice,
+                    "errores": {"non_field_errors": ["Fila inválida"]},
+                }
+            )
+            continue
+        try:
+            validas.append((indice, serializer.run_validation(fila)))
+        except serializers.ValidationError as exc:
+            errores.append({"fila": indice, "errores": exc.detail})
+
+    return validas, errores
+
+
+def importar_envios(
+    filas, empresa, usuario=None, tamano_lote=None, notificar=True
+):
+    """
+    Crea en bloque los envíos válidos de `filas` para la empresa.
+
+    Args:
+        filas (list): Lista de dicts con los campos de EnvioSerializer
+        empresa (Empresa): Empresa propietaria de los envíos
+        usuario (Usuario, optional): Usuario que registra la importación
+        tamano_lote (int, optional): Filas por bulk_create
+        notificar (bool): Encolar las notificaciones de creación
+
+    Returns:
+        dict: {"creados": int, "envios": [...], "errores": [...]}
+    """
+    tamano_lote = tamano_lote or getattr(
+        settings, "ENVIOS_IMPORTACION_TAMANO_LOTE", TAMANO_LOTE_DEFAULT
+    )
+    validas, errores = validar_filas(filas)
+    tarifa = obtener_tarifa(empresa)
+    creados = []
+
+    for inicio in range(0, len(validas), tamano_lote):
+        lote = validas[inicio : inicio + tamano_lote]
+        numeros_guia = asignar_numeros_guia(len(lote), empresa)
+
+        with transaction.atomic():
+            envios = Envio.objects.bulk_create(
+                [
+                    Envio(
+                        **datos,
+                        precio=tarifa.cotizar(datos["peso"])["total"],
+                        numero_guia=numero_guia,
+                        empresa=empresa,
+                        creado_por=usuario,
+                        actualizado_por=usuario,
+                    )
+                    for (_, datos), numero_guia in zip(lote, numeros_guia)
+                ]
+            )
+            HistorialEstado.objects.bulk_create(
+                [
+                    HistorialEstado(
+                        envio=envio,
+                        empresa_id=envio.empresa_id,
+                        estado=envio.estado_actual,
+                        comentario="Creación del envío (importación)",
+                        registrado_por=usuario,
+                    )
+                    for envio in envios
+                ]
+            )
+            if notificar:
+                encolar_notificaciones([(envio, None) for envio in envios])
+            registrar_envios(envios)
+            programar_snapshots(*(envio.id for envio in envios))
+
+        creados.extend(
+            {"fila": indice, "id": envio.id, "numero_guia": envio.numero_guia}
+            for (indice, _), envio in zip(lote, envios)
+        )
+
+    return {"creados": len(creados), "envios": creados, "errores": errores}
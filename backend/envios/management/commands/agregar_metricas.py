@@ -0,0 +1,51 @@
+import time
+
+from django.core.management.base import BaseCommand
+from envios.metricas import actualizar_metricas, reconstruir_metricas
+
+
+class Command(BaseCommand):
+    help = (
+        "Agrega el historial de estados en los rollups de métricas por "
+        "hora y día. Por defecto continúa desde la última ejecución"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--lote",
+            type=int,
+            default=5000,
+            help="Registros del historial por lote (default: 5000)",
+        )
+        parser.add_argument(
+            "--reconstruir",
+            action="store_true",
+            help="Borrar los rollups y recalcularlos desde el inicio",
+        )
+        parser.add_argument(
+            "--cada",
+            type=int,
+            metavar="SEGUNDOS",
+            help="Repetir la agregación incremental cada N segundos",
+        )
+
+    def handle(self, *args, **options):
+        if options["reconstruir"]:
+            self.stdout.write("🔄 Reconstruyendo métricas desde el inicio...")
+            self.agregar(reconstruir_metricas, options["lote"])
+        else:
+            self.agregar(actualizar_metricas, options["lote"])
+
+        while options["cada"]:
+            time.sleep(options["cada"])
+            self.agregar(actualizar_metricas, options["lote"])
+
+    def agregar(self, funcion, lote):
+        inicio = time.monotonic()
+        agregados = funcion(lote)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"✅ {agregados} registros del historial agregados "
+                f"({time.monotonic() - inicio:.1f}s)"
+            )
+        )
@@ -0,0 +1,269 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from empresas.models import Empresa
+from envios.busqueda import PESO_DESTINATARIO, PESO_REMITENTE, buscar_envios
+from envios.guias import asignar_numeros_guia
+from envios.models import Envio, HistorialEstado
+
+# Índice GIN de la búsqueda full-text, migración 0008 (solo PostgreSQL)
+INDICES_BUSQUEDA = ("envio_busqueda_gin_idx",)
+
+NOMBRES = (
+    "María",
+    "José",
+    "Yanelis",
+    "Carlos",
+    "Ana",
+    "Luis",
+    "Yoandry",
+    "Daniela",
+    "Pedro",
+    "Lisandra",
+    "Roberto",
+    "Yamila",
+)
+APELLIDOS = (
+    "González",
+    "Rodríguez",
+    "Pérez",
+    "Fernández",
+    "López",
+    "Díaz",
+    "Martínez",
+    "Hernández",
+    "Sánchez",
+    "Ramírez",
+    "Torres",
+    "Castillo",
+)
+
+
+class RollbackBenchmark(Exception):
+    """Deshace los índices eliminados para la medición 'antes'."""
+
+
+class Command(BaseCommand):
+    help = (
+        "Mide planes y tiempos de las consultas principales de envíos, "
+        "opcionalmente comparando sin y con sus índices"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--empresa",
+            default="benchmark",
+            help="Slug de la empresa a consultar (default: benchmark)",
+        )
+        parser.add_argument(
+            "--sembrar",
+            type=int,
+            default=0,
+            help="Crear N envíos de prueba antes de medir (p. ej. 1000000)",
+        )
+        parser.add_argument(
+            "--lote",
+            type=int,
+            default=5000,
+            help="Envíos por bulk_create al sembrar",
+        )
+        parser.add_argument(
+            "--repeticiones",
+            type=int,
+            default=5,
+            help="Ejecuciones por consulta para calcular la mediana",
+        )
+        parser.add_argument(
+            "--comparar",
+            action="store_true",
+            help="Medir primero sin los índices (en una transacción que se "
+            "deshace) y después con ellos",
+        )
+        parser.add_argument(
+            "--planes",
+            action="store_true",
+            help="Mostrar el plan de ejecución de cada consulta",
+        )
+
+    def handle(self, *args, **options):
+        if options["sembrar"]:
+            empresa, _ = Empresa.objects.get_or_create(
+                slug=options["empresa"],
+                defaults={"nombre": f"Benchmark {options['empresa']}"},
+            )
+            self.sembrar(empresa, options["sembrar"], options["lote"])
+        else:
+            try:
+                empresa = Empresa.objects.get(slug=options["empresa"])
+            except Empresa.DoesNotExist:
+                raise CommandError(
+                    f"Empresa '{options['empresa']}' no encontrada "
+                    "(use --sembrar para crearla)"
+                )
+
+        if not Envio.objects.filter(empresa=empresa).exists():
+            raise CommandError(f"La empresa '{empresa.slug}' no tiene envíos")
+
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute("ANALYZE envios_envio")
+                cursor.execute("ANALYZE envios_historialestado")
+
+        consultas = self.consultas(empresa)
+
+        if options["comparar"]:
+            antes = {}
+            try:
+                with transaction.atomic():
+                    self.eliminar_indices()
+                    antes = self.medir(consultas, "sin índices", options)
+                    raise RollbackBenchmark()
+            except RollbackBenchmark:
+                pass
+            despues = self.medir(consultas, "con índices", options)
+            self.resumen(antes, despues)
+        else:
+            self.medir(consultas, "estado actual", options)
+
+    def sembrar(self, empresa, cantidad, tamano_lote):
+        """
+        Crea `cantidad` envíos con su historial inicial, por lotes.
+        """
+        self.stdout.write(
+            f"🌱 Sembrando {cantidad} envíos en {empresa.nombre}..."
+        )
+        inicio = time.monotonic()
+        creados = 0
+
+        while creados < cantidad:
+            tamano = min(tamano_lote, cantidad - creados)
+            numeros_guia = asignar_numeros_guia(tamano, empresa)
+            envios = []
+            for i, numero_guia in enumerate(numeros_guia):
+                n = creados + i
+                envios.append(
+                    Envio(
+                        numero_guia=numero_guia,
+                        empresa=empresa,
+                        descripcion="Paquete de prueba",
+                        peso=1 + n % 20,
+                        remitente_nombre=self.nombre(n),
+                        remitente_direccion="Miami, FL",
+                        remitente_telefono=f"+1305{n % 100000:07d}",
+                        destinatario_nombre=self.nombre(n * 7 + 3),
+                        destinatario_direccion="La Habana, Cuba",
+                        destinatario_telefono=f"+535{n % 100000:07d}",
+                    )
+                )
+
+            with transaction.atomic():
+                envios = Envio.objects.bulk_create(envios)
+                HistorialEstado.objects.bulk_create(
+                    [
+                        HistorialEstado(
+                            envio=envio,
+                            empresa_id=envio.empresa_id,
+                            estado=envio.estado_actual,
+                            comentario="Creación del envío (benchmark)",
+                        )
+                        for envio in envios
+                    ]
+                )
+
+            creados += tamano
+            self.stdout.write(f"   {creados}/{cantidad}", ending="\r")
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"✅ {creados} envíos sembrados "
+                f"({time.monotonic() - inicio:.1f}s)"
+            )
+        )
+
+    def nombre(self, n):
+        return (
+            f"{NOMBRES[n % len(NOMBRES)]} "
+            f"{APELLIDOS[(n // len(NOMBRES)) % len(APELLIDOS)]} {n % 997}"
+        )
+
+    def consultas(self, empresa):
+        """
+        Consultas representativas de los patrones de acceso del API.
+        """
+        muestra = (
+            Envio.objects.filter(empresa=empresa)
+            .order_by("id")
+            .values("id", "remitente_telefono", "destinatario_telefono")
+            .first()
+        )
+        envios = Envio.objects.filter(empresa=empresa)
+
+        return {
+            "listado por fecha": envios.order_by("-fecha_creacion")[:20],
+            "remitente por teléfono": envios.filter(
+                remitente_telefono=muestra["remitente_telefono"]
+            ).order_by("-fecha_creacion")[:20],
+            "destinatario por teléfono": envios.filter(
+                destinatario_telefono=muestra["destinatario_telefono"]
+            ).order_by("-fecha_creacion")[:20],
+            # Mismo camino que buscar_por_remitente/buscar_por_destinatario
+            "búsqueda remitente": buscar_envios(
+                Envio.objects.all(), "yanelis pérez", pesos=PESO_REMITENTE
+            )[:10],
+            "búsqueda destinatario": buscar_envios(
+                Envio.objects.all(), "carlos díaz", pesos=PESO_DESTINATARIO
+            )[:10],
+            "historial de un envío": HistorialEstado.objects.filter(
+                envio_id=muestra["id"]
+            ).order_by("-fecha"),
+        }
+
+    def eliminar_indices(self):
+        nombres = [
+            index.name
+            for model in (Envio, HistorialEstado)
+            for index in model._meta.indexes
+        ]
+        if connection.vendor == "postgresql":
+            nombres += INDICES_BUSQUEDA
+
+        with connection.cursor() as cursor:
+            for nombre in nombres:
+                cursor.execute(f"DROP INDEX IF EXISTS {nombre}")
+
+    def medir(self, consultas, etiqueta, options):
+        self.stdout.write(self.style.MIGRATE_HEADING(f"\n📊 {etiqueta}"))
+        tiempos = {}
+
+        for nombre, queryset in consultas.items():
+            muestras = []
+            for _ in range(max(options["repeticiones"], 1)):
+                inicio = time.perf_counter()
+                list(queryset.all())
+                muestras.append((time.perf_counter() - inicio) * 1000)
+            tiempos[nombre] = statistics.median(muestras)
+
+            self.stdout.write(f"   {nombre}: {tiempos[nombre]:.2f} ms")
+            if options["planes"]:
+                self.stdout.write(self.plan(queryset))
+
+        return tiempos
+
+    def plan(self, queryset):
+        if connection.vendor == "postgresql":
+            plan = queryset.explain(analyze=True, buffers=True)
+        else:
+            plan = queryset.explain()
+        return "\n".join(f"      {linea}" for linea in plan.splitlines())
+
+    def resumen(self, antes, despues):
+        self.stdout.write(self.style.MIGRATE_HEADING("\n📈 Comparación"))
+        for nombre, tiempo in despues.items():
+            previo = antes.get(nombre)
+            mejora = previo / tiempo if previo and tiempo else 0
+            self.stdout.write(
+                f"   {nombre}: {previo:.2f} ms → {tiempo:.2f} ms "
+                f"(x{mejora:.1f})"
+            )
@@ -0,0 +1,48 @@
+import time
+
+from django.core.management.base import BaseCommand
+from envios.notifications import despachar_notificaciones
+
+
+class Command(BaseCommand):
+    help = "Despacha las notificaciones por email pendientes de la bandeja de salida"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--lote",
+            type=int,
+            default=100,
+            help="Número máximo de notificaciones por lote (default: 100)",
+        )
+        parser.add_argument(
+            "--continuo",
+            action="store_true",
+            help="Ejecutar como worker, revisando la bandeja periódicamente",
+        )
+        parser.add_argument(
+            "--intervalo",
+            type=float,
+            default=5.0,
+            help="Segundos de espera cuando la bandeja está vacía (modo continuo)",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            resultado = despachar_notificaciones(limite=options["lote"])
+            procesadas = sum(resultado.values())
+
+            if procesadas:
+                self.stdout.write(
+                    f"📧 Enviadas: {resultado['enviadas']} | "
+                    f"Reintentos: {resultado['reintentos']} | "
+                    f"Fallidas: {resultado['fallidas']}"
+                )
+
+            if not options["continuo"]:
+                if not procesadas:
+                    self.stdout.write("✅ No hay notificaciones pendientes")
+                return
+
+            # Un lote lleno indica que puede haber más pendientes
+            if procesadas < options["lote"]:
+                time.sleep(options["intervalo"])
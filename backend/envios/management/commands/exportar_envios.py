@@ -0,0 +1,70 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from empresas.models import Empresa
+from envios.busqueda import buscar_envios
+from envios.exportacion import FORMATOS, exportar
+from envios.models import Envio
+
+
+class Command(BaseCommand):
+    help = "Exporta los envíos de una empresa a CSV o XLSX"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--empresa", required=True, help="Slug de la empresa"
+        )
+        parser.add_argument(
+            "--formato",
+            choices=list(FORMATOS),
+            default="csv",
+            help="Formato de salida (default: csv)",
+        )
+        parser.add_argument(
+            "--salida",
+            help="Archivo de salida (default: salida estándar)",
+        )
+        parser.add_argument(
+            "--buscar", help="Exportar solo los envíos que coincidan"
+        )
+        parser.add_argument(
+            "--estado",
+            choices=Envio.EstadoChoices.values,
+            help="Exportar solo los envíos en este estado",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            empresa = Empresa.objects.get(slug=options["empresa"])
+        except Empresa.DoesNotExist:
+            raise CommandError(f"Empresa '{options['empresa']}' no encontrada")
+
+        envios = Envio.objects.filter(empresa=empresa).order_by(
+            "-fecha_creacion", "-id"
+        )
+        if options["estado"]:
+            envios = envios.filter(estado_actual=options["estado"])
+        if options["buscar"]:
+            envios = buscar_envios(envios, options["buscar"])
+
+        inicio = time.monotonic()
+        if options["salida"]:
+            with open(options["salida"], "wb") as archivo:
+                tamano = self.escribir(envios, options["formato"], archivo)
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"✅ Exportado a {options['salida']} "
+                    f"({tamano / 1024:.0f} KB, "
+                    f"{time.monotonic() - inicio:.1f}s)"
+                )
+            )
+        else:
+            self.escribir(envios, options["formato"], sys.stdout.buffer)
+
+    def escribir(self, envios, formato, archivo):
+        tamano = 0
+        for bloque in exportar(envios, formato):
+            archivo.write(bloque)
+            tamano += len(bloque)
+        return tamano
@@ -0,0 +1,83 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from empresas.models import Empresa
+from envios.importacion import importar_envios, leer_csv
+from usuarios.models import Usuario
+
+
+class Command(BaseCommand):
+    help = "Importa un manifiesto de envíos (CSV o JSON) para una empresa"
+
+    def add_arguments(self, parser):
+        parser.add_argument("archivo", help="Ruta del archivo .csv o .json")
+        parser.add_argument(
+            "--empresa", required=True, help="Slug de la empresa destino"
+        )
+        parser.add_argument(
+            "--usuario",
+            help="Email del usuario que registra la importación",
+        )
+        parser.add_argument(
+            "--lote",
+            type=int,
+            default=None,
+            help="Envíos por bulk_create (default: ENVIOS_IMPORTACION_TAMANO_LOTE)",
+        )
+        parser.add_argument(
+            "--sin-notificaciones",
+            action="store_true",
+            help="No encolar notificaciones de creación",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            empresa = Empresa.objects.get(slug=options["empresa"], activo=True)
+        except Empresa.DoesNotExist:
+            raise CommandError(
+                f"Empresa '{options['empresa']}' no encontrada o inactiva"
+            )
+
+        usuario = None
+        if options["usuario"]:
+            try:
+                usuario = Usuario.objects.get(email=options["usuario"])
+            except Usuario.DoesNotExist:
+                raise CommandError(
+                    f"Usuario '{options['usuario']}' no encontrado"
+                )
+
+        ruta = options["archivo"]
+        with open(ruta, "rb") as archivo:
+            if ruta.lower().endswith(".json"):
+                filas = json.load(archivo)
+            else:
+                filas = leer_csv(archivo)
+
+        self.stdout.write(
+            f"📦 Importando {len(filas)} envíos en {empresa.nombre}..."
+        )
+        inicio = time.monotonic()
+
+        resultado = importar_envios(
+            filas,
+            empresa=empresa,
+            usuario=usuario,
+            tamano_lote=options["lote"],
+            notificar=not options["sin_notificaciones"],
+        )
+
+        for error in resultado["errores"]:
+            detalle = json.dumps(error["errores"], ensure_ascii=False)
+            self.stdout.write(
+                self.style.WARNING(f"   ❌ Fila {error['fila']}: {detalle}")
+            )
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"✅ {resultado['creados']} envíos creados, "
+                f"{len(resultado['errores'])} filas con errores "
+                f"({time.monotonic() - inicio:.1f}s)"
+            )
+        )
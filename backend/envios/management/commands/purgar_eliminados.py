@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from envios.sincronizacion import purgar_eliminados
+
+
+class Command(BaseCommand):
+    help = (
+        "Borra las marcas de envíos eliminados que ya no necesita la "
+        "sincronización. Pensado para ejecutarse periódicamente (p. ej. cron)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dias",
+            type=int,
+            default=getattr(settings, "SINCRONIZACION_RETENCION_DIAS", 30),
+            help="Días que se conservan las marcas (default: "
+            "SINCRONIZACION_RETENCION_DIAS)",
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write("🔄 Purgando marcas de envíos eliminados...")
+        borradas = purgar_eliminados(options["dias"])
+        self.stdout.write(self.style.SUCCESS(f"✅ {borradas} marcas borradas"))
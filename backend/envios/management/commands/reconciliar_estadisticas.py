@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from empresas.models import Empresa
+from envios.estadisticas import reconciliar_contadores
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcula los contadores de envíos por empresa desde la tabla de "
+        "envíos. Pensado para ejecutarse periódicamente (p. ej. cron)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--empresa", help="Slug de la empresa (default: todas)"
+        )
+
+    def handle(self, *args, **options):
+        empresa_ids = None
+        if options["empresa"]:
+            try:
+                empresa = Empresa.objects.get(slug=options["empresa"])
+            except Empresa.DoesNotExist:
+                raise CommandError(
+                    f"Empresa '{options['empresa']}' no encontrada"
+                )
+            empresa_ids = [empresa.id]
+
+        self.stdout.write("🔄 Reconciliando contadores de envíos...")
+        inicio = time.monotonic()
+        corregidos = reconciliar_contadores(empresa_ids)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"✅ {corregidos} contadores corregidos "
+                f"({time.monotonic() - inicio:.1f}s)"
+            )
+        )
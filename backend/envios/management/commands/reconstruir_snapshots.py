@@ -0,0 +1,58 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from empresas.models import Empresa
+from envios.models import Envio
+from envios.rastreo import actualizar_snapshots
+
+
+class Command(BaseCommand):
+    help = "Reconstruye los snapshots del rastreo público de los envíos"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--empresa", help="Slug de la empresa (default: todas)"
+        )
+        parser.add_argument(
+            "--lote",
+            type=int,
+            default=1000,
+            help="Envíos por lote (default: 1000)",
+        )
+
+    def handle(self, *args, **options):
+        envios = Envio.objects.order_by("id")
+        if options["empresa"]:
+            try:
+                empresa = Empresa.objects.get(slug=options["empresa"])
+            except Empresa.DoesNotExist:
+                raise CommandError(
+                    f"Empresa '{options['empresa']}' no encontrada"
+                )
+            envios = envios.filter(empresa=empresa)
+
+        total = envios.count()
+        self.stdout.write(f"🔄 Reconstruyendo {total} snapshots de rastreo...")
+        inicio = time.monotonic()
+
+        procesados = 0
+        ultimo_id = 0
+        while True:
+            # Recorrido por id para no usar OFFSET en tablas grandes
+            ids = list(
+                envios.filter(id__gt=ultimo_id).values_list("id", flat=True)[
+                    : options["lote"]
+                ]
+            )
+            if not ids:
+                break
+            procesados += len(actualizar_snapshots(ids))
+            ultimo_id = ids[-1]
+            self.stdout.write(f"   {procesados}/{total}", ending="\r")
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"✅ {procesados} snapshots reconstruidos "
+                f"({time.monotonic() - inicio:.1f}s)"
+            )
+        )
@@ -0,0 +1,249 @@
+"""
+Métricas de flujo de envíos agregadas por periodo.
+
+agregar_historial recorre HistorialEstado a partir de una marca de agua
+(ProgresoMetricas) y acumula en MetricaEnvios, por empresa, estado y
+periodo (hora y día):
+
+- entradas: envíos que pasaron al estado (RECIBIDO = creados)
+- salidas y segundos_en_estado: envíos que dejaron el estado y el tiempo
+  que estuvieron en él, para el tiempo medio por estado
+
+Las series de los dashboards se leen de estos rollups (serie_metricas) y no
+del historial. Las semanas se obtienen sumando los días.
+
+Solo se agregan registros con más de METRICAS_MARGEN_SEGUNDOS de
+antigüedad, para no saltar ids de transacciones que aún no han hecho
+commit. Los borrados de envíos no descuentan las métricas ya agregadas;
+reconstruir_metricas las recalcula desde cero.
+"""
+
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import TruncWeek
+from django.utils import timezone
+
+from .models import Envio, HistorialEstado, MetricaEnvios, ProgresoMetricas
+
+PROGRESO_HISTORIAL = "historial"
+
+Granularidad = MetricaEnvios.GranularidadChoices
+
+CAMPOS = ("entradas", "salidas", "segundos_en_estado")
+
+# Entradas de estos estados que se resumen en cada punto de la serie
+RESUMEN = {
+    Envio.EstadoChoices.RECIBIDO: "creados",
+    Envio.EstadoChoices.ENTREGADO: "entregados",
+    Envio.EstadoChoices.DEVUELTO: "devueltos",
+}
+
+
+def inicio_periodo(fecha, granularidad):
+    """
+    Inicio de la hora o del día (en la zona horaria del proyecto) que
+    contiene `fecha`.
+    """
+    local = timezone.localtime(fecha)
+    if granularidad == Granularidad.HORA:
+        return local.replace(minute=0, second=0, microsecond=0)
+    return timezone.make_aware(
+        local.replace(hour=0, minute=0, second=0, microsecond=0, tzinfo=None)
+    )
+
+
+def _historial_con_anterior(ultimo_id):
+    """
+    Registros posteriores a la marca con la fecha y el estado del registro
+    anterior del mismo envío (el índice envio, -fecha, -id resuelve la
+    subconsulta).
+    """
+    anterior = (
+        HistorialEstado.objects.filter(envio=OuterRef("envio"))
+        .filter(
+            Q(fecha__lt=OuterRef("fecha"))
+            | Q(fecha=OuterRef("fecha"), id__lt=OuterRef("id"))
+        )
+        .order_by("-fecha", "-id")
+    )
+    return (
+        HistorialEstado.objects.filter(id__gt=ultimo_id)
+        .order_by("id")
+        .values("id", "fecha", "estado", "empresa_id")
+        .annotate(
+            fecha_anterior=Subquery(anterior.values("fecha")[:1]),
+            estado_anterior=Subquery(anterior.values("estado")[:1]),
+        )
+    )
+
+
+def _acumular(filas):
+    deltas = defaultdict(lambda: [0, 0, 0])
+    for fila in filas:
+        for granularidad in Granularidad.values:
+            periodo = inicio_periodo(fila["fecha"], granularidad)
+            clave = (fila["empresa_id"], granularidad, periodo)
+            deltas[(*clave, fila["estado"])][0] += 1
+            if fila["estado_anterior"]:
+                duracion = fila["fecha"] - fila["fecha_anterior"]
+                delta = deltas[(*clave, fila["estado_anterior"])]
+                delta[1] += 1
+                delta[2] += round(duracion.total_seconds())
+    return deltas
+
+
+def _aplicar(deltas):
+    """
+    Suma los deltas a las filas existentes y crea las que faltan. Solo hay
+    un agregador a la vez (bloqueo de la marca), así que basta con leer y
+    escribir en bloque.
+    """
+    existentes = {
+        (m.empresa_id, m.granularidad, m.inicio, m.estado): m
+        for m in MetricaEnvios.objects.filter(
+            empresa_id__in={clave[0] for clave in deltas},
+            inicio__in={clave[2] for clave in deltas},
+        )
+    }
+
+    nuevas, modificadas = [], []
+    for clave, valores in deltas.items():
+        metrica = existentes.get(clave)
+        if metrica is None:
+            empresa_id, granularidad, inicio, estado = clave
+            metrica = MetricaEnvios(
+                empresa_id=empresa_id,
+                granularidad=granularidad,
+                inicio=inicio,
+                estado=estado,
+            )
+            nuevas.append(metrica)
+        else:
+            modificadas.append(metrica)
+        for campo, valor in zip(CAMPOS, valores):
+            setattr(metrica, campo, getattr(metrica, campo) + valor)
+
+    MetricaEnvios.objects.bulk_create(nuevas)
+    MetricaEnvios.objects.bulk_update(modificadas, CAMPOS)
+
+
+def agregar_historial(lote=5000):
+    """
+    Agrega el siguiente lote de HistorialEstado a partir de la marca de
+    agua y la avanza.
+
+    Returns:
+        int: Registros agregados (0 si no había nada nuevo)
+    """
+    margen = getattr(settings, "METRICAS_MARGEN_SEGUNDOS", 60)
+    limite = timezone.now() - timedelta(seconds=margen)
+
+    with transaction.atomic():
+        # El bloqueo de la marca garantiza un solo agregador a la vez
+        progreso = ProgresoMetricas.objects.select_for_update().get_or_create(
+            nombre=PROGRESO_HISTORIAL
+        )[0]
+        filas = []
+        for fila in _historial_con_anterior(progreso.ultimo_id)[:lote]:
+            # Detenerse en el primer registro demasiado reciente para no
+            # dejar atrás ids menores que aún no son visibles
+            if fila["fecha"] > limite:
+                break
+            filas.append(fila)
+
+        if not filas:
+            return 0
+
+        _aplicar(_acumular(filas))
+        progreso.ultimo_id = filas[-1]["id"]
+        progreso.save()
+
+    return len(filas)
+
+
+def actualizar_metricas(lote=5000):
+    """
+    Agrega todo el historial pendiente, lote a lote.
+
+    Returns:
+        int: Registros agregados
+    """
+    total = 0
+    while True:
+        agregados = agregar_historial(lote)
+        total += agregados
+        if agregados < lote:
+            return total
+
+
+def reconstruir_metricas(lote=5000):
+    """
+    Borra los rollups y los recalcula desde el inicio del historial.
+    """
+    with transaction.atomic():
+        ProgresoMetricas.objects.select_for_update().filter(
+            nombre=PROGRESO_HISTORIAL
+        ).delete()
+        MetricaEnvios.objects.all().delete()
+    return actualizar_metricas(lote)
+
+
+def serie_metricas(empresa, intervalo, desde, hasta, estados=None):
+    """
+    Serie temporal de la empresa entre `desde` (incluido) y `hasta`.
+
+    Args:
+        intervalo (str): 'hora', 'dia' o 'semana'
+        estados (list, optional): Limitar el detalle a estos estados
+
+    Returns:
+        list: Un elemento por periodo con datos, en orden cronológico
+    """
+    granularidad = (
+        Granularidad.HORA if intervalo == "hora" else Granularidad.DIA
+    )
+    metricas = MetricaEnvios.objects.filter(
+        empresa=empresa,
+        granularidad=granularidad,
+        inicio__gte=desde,
+        inicio__lt=hasta,
+    )
+    if estados:
+        metricas = metricas.filter(estado__in=estados)
+
+    periodo = TruncWeek("inicio") if intervalo == "semana" else F("inicio")
+    filas = (
+        metricas.annotate(periodo=periodo)
+        .values("periodo", "estado")
+        .annotate(**{campo: Sum(campo) for campo in CAMPOS})
+        .order_by("periodo", "estado")
+    )
+
+    serie = {}
+    for fila in filas:
+        punto = serie.setdefault(
+            fila["periodo"],
+            {
+                "inicio": fila["periodo"],
+                **{clave: 0 for clave in RESUMEN.values()},
+                "estados": {},
+            },
+        )
+        if fila["estado"] in RESUMEN:
+            punto[RESUMEN[fila["estado"]]] = fila["entradas"]
+
+        salidas = fila["salidas"]
+        punto["estados"][fila["estado"]] = {
+            "entradas": fila["entradas"],
+            "salidas": salidas,
+            "tiempo_medio_horas": (
+                round(fila["segundos_en_estado"] / salidas / 3600, 2)
+                if salidas
+                else None
+            ),
+        }
+    return list(serie.values())
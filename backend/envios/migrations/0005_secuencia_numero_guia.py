@@ -0,0 +1,75 @@
+# Generated manually: secuencia para números de guía
+
+from django.db import migrations, models
+
+SECUENCIA_GUIA = "envios_numero_guia_seq"
+
+
+def valor_inicial(apps):
+    """
+    Último valor ya usado: el mayor entre el id máximo (esquema anterior
+    PKF{id}) y el sufijo numérico de las guías existentes.
+    """
+    Envio = apps.get_model("envios", "Envio")
+
+    ultimo = Envio.objects.aggregate(models.Max("id"))["id__max"] or 0
+    for numero_guia in Envio.objects.values_list("numero_guia", flat=True):
+        sufijo = numero_guia[-8:]
+        if sufijo.isdigit():
+            ultimo = max(ultimo, int(sufijo))
+    return ultimo
+
+
+def crear_secuencia(apps, schema_editor):
+    ultimo = valor_inicial(apps)
+
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(
+            f"CREATE SEQUENCE IF NOT EXISTS {SECUENCIA_GUIA}"
+        )
+        if ultimo:
+            schema_editor.execute(
+                "SELECT setval(%s, %s, true)", [SECUENCIA_GUIA, ultimo]
+            )
+        return
+
+    SecuenciaGuia = apps.get_model("envios", "SecuenciaGuia")
+    SecuenciaGuia.objects.update_or_create(
+        nombre=SECUENCIA_GUIA, defaults={"ultimo_valor": ultimo}
+    )
+
+
+def eliminar_secuencia(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(f"DROP SEQUENCE IF EXISTS {SECUENCIA_GUIA}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("envios", "0004_alter_envio_empresa"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SecuenciaGuia",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("nombre", models.CharField(max_length=50, unique=True)),
+                ("ultimo_valor", models.BigIntegerField(default=0)),
+            ],
+            options={
+                "verbose_name": "Secuencia de Guías",
+                "verbose_name_plural": "Secuencias de Guías",
+            },
+        ),
+        migrations.RunPython(crear_secuencia, eliminar_secuencia),
+    ]
@@ -0,0 +1,72 @@
+# Generated by Django 4.2.30 on 2026-10-18 10:15
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("envios", "0005_secuencia_numero_guia"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="NotificacionEmail",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("destinatario", models.EmailField(max_length=254)),
+                ("asunto", models.CharField(max_length=200)),
+                ("mensaje_html", models.TextField()),
+                ("mensaje_texto", models.TextField()),
+                (
+                    "estado",
+                    models.CharField(
+                        choices=[
+                            ("PENDIENTE", "Pendiente"),
+                            ("ENVIADA", "Enviada"),
+                            ("FALLIDA", "Fallida"),
+                        ],
+                        default="PENDIENTE",
+                        max_length=20,
+                    ),
+                ),
+                ("intentos", models.PositiveSmallIntegerField(default=0)),
+                (
+                    "proximo_intento",
+                    models.DateTimeField(default=django.utils.timezone.now),
+                ),
+                ("ultimo_error", models.TextField(blank=True, null=True)),
+                ("fecha_creacion", models.DateTimeField(auto_now_add=True)),
+                ("fecha_envio", models.DateTimeField(blank=True, null=True)),
+                (
+                    "envio",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="notificaciones",
+                        to="envios.envio",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Notificación por Email",
+                "verbose_name_plural": "Notificaciones por Email",
+                "ordering": ["fecha_creacion"],
+                "indexes": [
+                    models.Index(
+                        fields=["estado", "proximo_intento"],
+                        name="notif_pendientes_idx",
+                    )
+                ],
+            },
+        ),
+    ]
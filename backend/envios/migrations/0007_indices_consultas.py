@@ -0,0 +1,72 @@
+# Generated by Django 4.2.30 on 2026-10-18 10:19
+# Índices trigram añadidos manualmente
+
+from django.db import migrations, models
+
+# Índices trigram para las búsquedas icontains por nombre. Django traduce
+# icontains a UPPER(columna::text) LIKE UPPER(...), así que el índice se
+# crea sobre esa misma expresión.
+INDICES_TRIGRAMA = {
+    "envio_rem_nombre_trgm_idx": "remitente_nombre",
+    "envio_dest_nombre_trgm_idx": "destinatario_nombre",
+}
+
+
+def crear_indices_trigrama(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    for nombre, columna in INDICES_TRIGRAMA.items():
+        schema_editor.execute(
+            f"CREATE INDEX IF NOT EXISTS {nombre} ON envios_envio "
+            f'USING gin ((UPPER("{columna}"::text)) gin_trgm_ops)'
+        )
+
+
+def eliminar_indices_trigrama(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+
+    for nombre in INDICES_TRIGRAMA:
+        schema_editor.execute(f"DROP INDEX IF EXISTS {nombre}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("envios", "0006_notificacionemail"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="envio",
+            index=models.Index(
+                fields=["empresa", "-fecha_creacion"],
+                name="envio_empresa_fecha_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="envio",
+            index=models.Index(
+                fields=["empresa", "remitente_telefono"],
+                name="envio_empresa_rem_tel_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="envio",
+            index=models.Index(
+                fields=["empresa", "destinatario_telefono"],
+                name="envio_empresa_dest_tel_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="historialestado",
+            index=models.Index(
+                fields=["envio", "-fecha"], name="historial_envio_fecha_idx"
+            ),
+        ),
+        migrations.RunPython(
+            crear_indices_trigrama, eliminar_indices_trigrama
+        ),
+    ]
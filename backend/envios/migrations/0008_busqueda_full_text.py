@@ -0,0 +1,81 @@
+# Generated by Django 4.2.30 on 2026-10-18 10:20
+# Trigger e índice GIN añadidos manualmente
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+# Pesos del documento de búsqueda (ver envios.busqueda.CAMPOS_POR_PESO):
+# A = guía y estado, B = remitente, C = destinatario, D = descripción.
+# Los teléfonos se indexan solo con sus dígitos.
+FUNCION_TRIGGER = r"""
+CREATE OR REPLACE FUNCTION envios_envio_busqueda_trigger() RETURNS trigger AS $$
+BEGIN
+    NEW.busqueda :=
+        setweight(to_tsvector('simple',
+            coalesce(NEW.numero_guia, '') || ' ' ||
+            coalesce(NEW.estado_actual, '')), 'A') ||
+        setweight(to_tsvector('simple',
+            coalesce(NEW.remitente_nombre, '') || ' ' ||
+            regexp_replace(coalesce(NEW.remitente_telefono, ''), '\D', '', 'g')), 'B') ||
+        setweight(to_tsvector('simple',
+            coalesce(NEW.destinatario_nombre, '') || ' ' ||
+            regexp_replace(coalesce(NEW.destinatario_telefono, ''), '\D', '', 'g')), 'C') ||
+        setweight(to_tsvector('simple', coalesce(NEW.descripcion, '')), 'D');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql
+"""
+
+TRIGGER = """
+CREATE TRIGGER envios_envio_busqueda_update
+BEFORE INSERT OR UPDATE OF
+    numero_guia, estado_actual, remitente_nombre, remitente_telefono,
+    destinatario_nombre, destinatario_telefono, descripcion, busqueda
+ON envios_envio
+FOR EACH ROW EXECUTE FUNCTION envios_envio_busqueda_trigger()
+"""
+
+
+def crear_trigger(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+
+    schema_editor.execute(FUNCION_TRIGGER)
+    schema_editor.execute(TRIGGER)
+    # Rellenar los envíos existentes disparando el trigger
+    schema_editor.execute("UPDATE envios_envio SET numero_guia = numero_guia")
+    schema_editor.execute(
+        "CREATE INDEX IF NOT EXISTS envio_busqueda_gin_idx "
+        "ON envios_envio USING gin (busqueda)"
+    )
+
+
+def eliminar_trigger(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+
+    schema_editor.execute("DROP INDEX IF EXISTS envio_busqueda_gin_idx")
+    schema_editor.execute(
+        "DROP TRIGGER IF EXISTS envios_envio_busqueda_update ON envios_envio"
+    )
+    schema_editor.execute(
+        "DROP FUNCTION IF EXISTS envios_envio_busqueda_trigger()"
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("envios", "0007_indices_consultas"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="envio",
+            name="busqueda",
+            field=django.contrib.postgres.search.SearchVectorField(
+                editable=False, null=True
+            ),
+        ),
+        migrations.RunPython(crear_trigger, eliminar_trigger),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 4.2.30 on 2026-10-18 10:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("envios", "0008_busqueda_full_text"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="envio",
+            name="envio_empresa_fecha_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="historialestado",
+            name="historial_envio_fecha_idx",
+        ),
+        migrations.AddIndex(
+            model_name="envio",
+            index=models.Index(
+                fields=["empresa", "-fecha_creacion", "-id"],
+                name="envio_empresa_fecha_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="historialestado",
+            index=models.Index(
+                fields=["envio", "-fecha", "-id"],
+                name="historial_envio_fecha_idx",
+            ),
+        ),
+    ]
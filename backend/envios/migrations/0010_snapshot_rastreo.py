@@ -0,0 +1,45 @@
+# Generated by Django 4.2.30 on 2026-10-18 10:26
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("envios", "0009_indices_keyset"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SnapshotRastreo",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("numero_guia", models.CharField(max_length=20, unique=True)),
+                ("datos", models.JSONField()),
+                ("etag", models.CharField(max_length=32)),
+                ("ultima_modificacion", models.DateTimeField()),
+                ("fecha_actualizacion", models.DateTimeField(auto_now=True)),
+                (
+                    "envio",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="snapshot_rastreo",
+                        to="envios.envio",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Snapshot de Rastreo",
+                "verbose_name_plural": "Snapshots de Rastreo",
+            },
+        ),
+    ]
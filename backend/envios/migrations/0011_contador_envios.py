@@ -0,0 +1,110 @@
+# Generated by Django 4.2.30 on 2026-10-18 10:33
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def poblar_contadores(apps, schema_editor):
+    """
+    Carga inicial de los contadores a partir de los envíos existentes.
+    """
+    Envio = apps.get_model("envios", "Envio")
+    ContadorEnvios = apps.get_model("envios", "ContadorEnvios")
+
+    filas = (
+        Envio.objects.order_by()
+        .values("empresa_id", "estado_actual")
+        .annotate(
+            total=models.Count("id"),
+            peso_total=models.Sum("peso"),
+            valor_declarado_total=models.Sum("valor_declarado"),
+        )
+    )
+    ContadorEnvios.objects.bulk_create(
+        [
+            ContadorEnvios(
+                empresa_id=fila["empresa_id"],
+                estado=fila["estado_actual"],
+                total=fila["total"],
+                peso_total=fila["peso_total"] or 0,
+                valor_declarado_total=fila["valor_declarado_total"] or 0,
+            )
+            for fila in filas
+        ]
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("empresas", "0003_fix_usuario_relation"),
+        ("envios", "0010_snapshot_rastreo"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ContadorEnvios",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "estado",
+                    models.CharField(
+                        choices=[
+                            ("RECIBIDO", "Recibido"),
+                            ("EN_TRANSITO", "En tránsito"),
+                            ("EN_REPARTO", "En reparto"),
+                            ("ENTREGADO", "Entregado"),
+                            ("DEVUELTO", "Devuelto"),
+                            ("CANCELADO", "Cancelado"),
+                        ],
+                        max_length=20,
+                    ),
+                ),
+                ("total", models.IntegerField(default=0)),
+                (
+                    "peso_total",
+                    models.DecimalField(
+                        decimal_places=2, default=0, max_digits=14
+                    ),
+                ),
+                (
+                    "valor_declarado_total",
+                    models.DecimalField(
+                        decimal_places=2, default=0, max_digits=16
+                    ),
+                ),
+                (
+                    "fecha_actualizacion",
+                    models.DateTimeField(default=django.utils.timezone.now),
+                ),
+                (
+                    "empresa",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="contadores_envios",
+                        to="empresas.empresa",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Contador de Envíos",
+                "verbose_name_plural": "Contadores de Envíos",
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="contadorenvios",
+            constraint=models.UniqueConstraint(
+                fields=("empresa", "estado"), name="contador_empresa_estado"
+            ),
+        ),
+        migrations.RunPython(poblar_contadores, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,114 @@
+# Generated by Django 4.2.30 on 2026-10-18 10:36
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("empresas", "0003_fix_usuario_relation"),
+        ("envios", "0011_contador_envios"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ProgresoMetricas",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("nombre", models.CharField(max_length=50, unique=True)),
+                ("ultimo_id", models.BigIntegerField(default=0)),
+                ("fecha_actualizacion", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "verbose_name": "Progreso de Métricas",
+                "verbose_name_plural": "Progreso de Métricas",
+            },
+        ),
+        migrations.CreateModel(
+            name="MetricaEnvios",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "granularidad",
+                    models.CharField(
+                        choices=[("hora", "Hora"), ("dia", "Día")],
+                        max_length=4,
+                    ),
+                ),
+                (
+                    "inicio",
+                    models.DateTimeField(help_text="Inicio del periodo"),
+                ),
+                (
+                    "estado",
+                    models.CharField(
+                        choices=[
+                            ("RECIBIDO", "Recibido"),
+                            ("EN_TRANSITO", "En tránsito"),
+                            ("EN_REPARTO", "En reparto"),
+                            ("ENTREGADO", "Entregado"),
+                            ("DEVUELTO", "Devuelto"),
+                            ("CANCELADO", "Cancelado"),
+                        ],
+                        max_length=20,
+                    ),
+                ),
+                (
+                    "entradas",
+                    models.IntegerField(
+                        default=0, help_text="Envíos que pasaron a este estado"
+                    ),
+                ),
+                (
+                    "salidas",
+                    models.IntegerField(
+                        default=0,
+                        help_text="Envíos que salieron de este estado",
+                    ),
+                ),
+                (
+                    "segundos_en_estado",
+                    models.BigIntegerField(
+                        default=0,
+                        help_text="Tiempo total en el estado de las salidas",
+                    ),
+                ),
+                (
+                    "empresa",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="metricas_envios",
+                        to="empresas.empresa",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Métrica de Envíos",
+                "verbose_name_plural": "Métricas de Envíos",
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="metricaenvios",
+            constraint=models.UniqueConstraint(
+                fields=("empresa", "granularidad", "inicio", "estado"),
+                name="metrica_empresa_periodo_estado",
+            ),
+        ),
+    ]
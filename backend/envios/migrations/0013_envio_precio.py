@@ -0,0 +1,24 @@
+# Generated by Django 4.2.30 on 2026-10-18 10:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("envios", "0012_metricas_envios"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="envio",
+            name="precio",
+            field=models.DecimalField(
+                blank=True,
+                decimal_places=2,
+                help_text="Precio según la tarifa de la empresa (envios.tarifas)",
+                max_digits=10,
+                null=True,
+            ),
+        ),
+    ]
@@ -0,0 +1,58 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def poblar_empresa(apps, schema_editor):
+    """
+    Copia la empresa de cada envío a su historial.
+    """
+    Envio = apps.get_model("envios", "Envio")
+    HistorialEstado = apps.get_model("envios", "HistorialEstado")
+
+    HistorialEstado.objects.update(
+        empresa_id=models.Subquery(
+            Envio.objects.filter(id=models.OuterRef("envio_id")).values(
+                "empresa_id"
+            )[:1]
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("empresas", "0003_fix_usuario_relation"),
+        ("envios", "0013_envio_precio"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="historialestado",
+            name="empresa",
+            field=models.ForeignKey(
+                editable=False,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="+",
+                to="empresas.empresa",
+            ),
+        ),
+        migrations.RunPython(poblar_empresa, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="historialestado",
+            name="empresa",
+            field=models.ForeignKey(
+                editable=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="+",
+                to="empresas.empresa",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="historialestado",
+            index=models.Index(
+                fields=["empresa", "-fecha", "-id"],
+                name="historial_empresa_fecha_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,76 @@
+# Generated by Django 4.2.30 on 2026-10-18 10:49
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("empresas", "0003_fix_usuario_relation"),
+        ("envios", "0014_historialestado_empresa"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="EnvioEliminado",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("envio_id", models.BigIntegerField()),
+                ("numero_guia", models.CharField(max_length=20)),
+                ("remitente_telefono", models.CharField(max_length=20)),
+                ("destinatario_telefono", models.CharField(max_length=20)),
+                ("fecha", models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                "verbose_name": "Envío eliminado",
+                "verbose_name_plural": "Envíos eliminados",
+            },
+        ),
+        migrations.AddField(
+            model_name="envio",
+            name="id_cliente",
+            field=models.CharField(
+                blank=True, editable=False, max_length=64, null=True
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="envio",
+            index=models.Index(
+                fields=["empresa", "ultima_actualizacion", "id"],
+                name="envio_empresa_actualizado_idx",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="envio",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("id_cliente__isnull", False)),
+                fields=("empresa", "id_cliente"),
+                name="envio_empresa_id_cliente_uniq",
+            ),
+        ),
+        migrations.AddField(
+            model_name="envioeliminado",
+            name="empresa",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="+",
+                to="empresas.empresa",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="envioeliminado",
+            index=models.Index(
+                fields=["empresa", "fecha", "id"],
+                name="eliminado_empresa_fecha_idx",
+            ),
+        ),
+    ]
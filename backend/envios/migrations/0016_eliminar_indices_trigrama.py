@@ -0,0 +1,45 @@
+# Generated by Django 4.2.30 on 2026-10-18 11:02
+# Eliminación manual de los índices trigram de la migración 0007
+
+from django.db import migrations
+
+# Las búsquedas por nombre usan la columna busqueda (tsvector, migración
+# 0008) y ninguna consulta usa ya estos índices; solo encarecían cada
+# escritura en envios_envio.
+INDICES_TRIGRAMA = {
+    "envio_rem_nombre_trgm_idx": "remitente_nombre",
+    "envio_dest_nombre_trgm_idx": "destinatario_nombre",
+}
+
+
+def eliminar_indices_trigrama(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+
+    for nombre in INDICES_TRIGRAMA:
+        schema_editor.execute(f"DROP INDEX IF EXISTS {nombre}")
+
+
+def crear_indices_trigrama(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    for nombre, columna in INDICES_TRIGRAMA.items():
+        schema_editor.execute(
+            f"CREATE INDEX IF NOT EXISTS {nombre} ON envios_envio "
+            f'USING gin ((UPPER("{columna}"::text)) gin_trgm_ops)'
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("envios", "0015_sincronizacion"),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            eliminar_indices_trigrama, crear_indices_trigrama
+        ),
+    ]
@@ -1,9 +1,68 @@
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from empresas.models import Empresa
 from usuarios.models import Usuario
 
 
+class AlcancePerfilQuerySet(models.QuerySet):
+    """
+    Restricción por empresa y rol: es lo que ve cada perfil en los
+    listados, el detalle, las exportaciones, el historial y la
+    sincronización. Sirve para cualquier modelo con empresa y teléfonos de
+    remitente y destinatario (Envio, EnvioEliminado).
+    """
+
+    def para_perfil(self, perfil, empresa=None):
+        """
+        Filas de la empresa (por defecto la del perfil) visibles para el
+        perfil:
+        - Dueño y operadores: todos los envíos de la empresa
+        - Remitentes: solo los que han enviado
+        - Destinatarios: solo los dirigidos a ellos
+        - Roles no específicos: toda la empresa
+        Sin perfil activo en la empresa no se ve nada. `perfil` puede ser el
+        SimpleLazyObject de request.perfil_usuario, así que se comprueba su
+        valor de verdad y no `is None`.
+
+        Cada filtro corresponde a un índice (empresa, teléfono).
+        """
+        if not perfil:
+            return self.none()
+        empresa_id = empresa.pk if empresa is not None else perfil.empresa_id
+        return self.filter(empresa_id=empresa_id, **_filtro_rol(perfil))
+
+
+class EnvioQuerySet(AlcancePerfilQuerySet):
+    def historial_para_perfil(self, perfil, empresa=None):
+        """
+        Historial de los envíos visibles para el perfil. El filtro por
+        empresa usa HistorialEstado.empresa sin pasar por Envio; solo los
+        remitentes y destinatarios añaden una subconsulta de ids de envío.
+        Sin perfil activo en la empresa no se ve nada.
+        """
+        if not perfil:
+            return HistorialEstado.objects.none()
+        empresa_id = empresa.pk if empresa is not None else perfil.empresa_id
+        historial = HistorialEstado.objects.filter(empresa_id=empresa_id)
+        if _filtro_rol(perfil):
+            historial = historial.filter(
+                envio_id__in=self.para_perfil(perfil, empresa).values("id")
+            )
+        return historial
+
+
+def _filtro_rol(perfil):
+    if perfil.es_dueno or perfil.puede_gestionar_envios:
+        return {}
+    if perfil.rol == "remitente":
+        return {"remitente_telefono": perfil.telefono}
+    if perfil.rol == "destinatario":
+        return {"destinatario_telefono": perfil.telefono}
+    return {}
+
+
 class Envio(models.Model):
     """
     Modelo para gestionar los envíos de paquetes
@@ -38,6 +97,13 @@ class Envio(models.Model):
     valor_declarado = models.DecimalField(
         max_digits=10, decimal_places=2, null=True, blank=True
     )
+    precio = models.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        null=True,
+        blank=True,
+        help_text="Precio según la tarifa de la empresa (envios.tarifas)",
+    )
 
     # Datos del remitente
     remitente_nombre = models.CharField(max_length=100)
@@ -72,21 +138,76 @@ class Envio(models.Model):
         related_name="envios_actualizados",
     )
     ultima_actualizacion = models.DateTimeField(auto_now=True)
+    # Identificador asignado por el cliente al crear el envío sin conexión;
+    # evita duplicados si la PWA reenvía la misma operación
+    id_cliente = models.CharField(
+        max_length=64, null=True, blank=True, editable=False
+    )
+
+    # Documento de búsqueda full-text (envios.busqueda). En PostgreSQL lo
+    # mantiene un trigger al escribir; en otros motores queda vacío.
+    busqueda = SearchVectorField(null=True, editable=False)
+
+    objects = EnvioQuerySet.as_manager()
 
     class Meta:
         verbose_name = "Envío"
         verbose_name_plural = "Envíos"
         ordering = ["-fecha_creacion"]
+        indexes = [
+            # Listados por empresa ordenados por fecha (clave del keyset)
+            models.Index(
+                fields=["empresa", "-fecha_creacion", "-id"],
+                name="envio_empresa_fecha_idx",
+            ),
+            # Filtrado de remitentes/destinatarios por teléfono
+            models.Index(
+                fields=["empresa", "remitente_telefono"],
+                name="envio_empresa_rem_tel_idx",
+            ),
+            models.Index(
+                fields=["empresa", "destinatario_telefono"],
+                name="envio_empresa_dest_tel_idx",
+            ),
+            # Sincronización incremental (envios.sincronizacion)
+            models.Index(
+                fields=["empresa", "ultima_actualizacion", "id"],
+                name="envio_empresa_actualizado_idx",
+            ),
+            # Las búsquedas usan el índice GIN de la columna busqueda,
+            # creado en la migración 0008 (solo PostgreSQL)
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["empresa", "id_cliente"],
+                condition=models.Q(id_cliente__isnull=False),
+                name="envio_empresa_id_cliente_uniq",
+            ),
+        ]
+
+    # Estados a partir de los cuales no se admiten más cambios
+    ESTADOS_FINALES = (EstadoChoices.ENTREGADO, EstadoChoices.CANCELADO)
 
     def __str__(self):
         return f"Envío #{self.numero_guia} - {self.estado_actual}"
 
+    def puede_cambiar_a(self, estado):
+        """
+        Indica si el envío admite la transición al estado indicado.
+        """
+        return (
+            estado != self.estado_actual
+            and self.estado_actual not in self.ESTADOS_FINALES
+        )
+
     def save(self, *args, **kwargs):
         if not self.numero_guia:
             # Generar un número de guía si no existe
-            ultimo_envio = Envio.objects.order_by("-id").first()
-            ultimo_id = ultimo_envio.id if ultimo_envio else 0
-            self.numero_guia = f"PKF{ultimo_id + 1:08d}"
+            from .guias import siguiente_numero_guia
+
+            self.numero_guia = siguiente_numero_guia(
+                self.empresa if self.empresa_id else None
+            )
 
         super().save(*args, **kwargs)
 
@@ -99,6 +220,13 @@ class HistorialEstado(models.Model):
     envio = models.ForeignKey(
         Envio, on_delete=models.CASCADE, related_name="historial"
     )
+    # Copia de envio.empresa para filtrar el historial por empresa sin join
+    empresa = models.ForeignKey(
+        Empresa,
+        on_delete=models.CASCADE,
+        related_name="+",
+        editable=False,
+    )
     estado = models.CharField(
         max_length=20, choices=Envio.EstadoChoices.choices
     )
@@ -113,6 +241,244 @@ class HistorialEstado(models.Model):
         verbose_name = "Historial de Estado"
         verbose_name_plural = "Historial de Estados"
         ordering = ["-fecha"]
+        indexes = [
+            models.Index(
+                fields=["envio", "-fecha", "-id"],
+                name="historial_envio_fecha_idx",
+            ),
+            # Historial de la empresa ordenado por fecha (clave del keyset)
+            models.Index(
+                fields=["empresa", "-fecha", "-id"],
+                name="historial_empresa_fecha_idx",
+            ),
+        ]
 
     def __str__(self):
         return f"{self.envio.numero_guia} - {self.estado} - {self.fecha}"
+
+    def save(self, *args, **kwargs):
+        if not self.empresa_id:
+            # Las altas en bloque (bulk_create) asignan empresa_id ellas mismas
+            self.empresa_id = self.envio.empresa_id
+        super().save(*args, **kwargs)
+
+
+class EnvioEliminado(models.Model):
+    """
+    Marca de un envío borrado, para que los clientes que sincronizan lo
+    eliminen de su copia local. Guarda los teléfonos para aplicar la misma
+    restricción por rol que al envío.
+    """
+
+    empresa = models.ForeignKey(
+        Empresa, on_delete=models.CASCADE, related_name="+"
+    )
+    envio_id = models.BigIntegerField()
+    numero_guia = models.CharField(max_length=20)
+    remitente_telefono = models.CharField(max_length=20)
+    destinatario_telefono = models.CharField(max_length=20)
+    fecha = models.DateTimeField(auto_now_add=True)
+
+    objects = AlcancePerfilQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = "Envío eliminado"
+        verbose_name_plural = "Envíos eliminados"
+        indexes = [
+            models.Index(
+                fields=["empresa", "fecha", "id"],
+                name="eliminado_empresa_fecha_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.numero_guia} (eliminado {self.fecha})"
+
+
+class SecuenciaGuia(models.Model):
+    """
+    Contador de números de guía para bases de datos sin secuencias nativas
+    (SQLite en tests/desarrollo). En PostgreSQL se usa una SEQUENCE.
+    """
+
+    nombre = models.CharField(max_length=50, unique=True)
+    ultimo_valor = models.BigIntegerField(default=0)
+
+    class Meta:
+        verbose_name = "Secuencia de Guías"
+        verbose_name_plural = "Secuencias de Guías"
+
+    def __str__(self):
+        return f"{self.nombre}: {self.ultimo_valor}"
+
+
+class NotificacionEmail(models.Model):
+    """
+    Bandeja de salida (outbox) de notificaciones por email.
+    Se escribe en la misma transacción que el cambio de estado y se
+    despacha después del commit o con el comando despachar_notificaciones.
+    """
+
+    class EstadoChoices(models.TextChoices):
+        PENDIENTE = "PENDIENTE", _("Pendiente")
+        ENVIADA = "ENVIADA", _("Enviada")
+        FALLIDA = "FALLIDA", _("Fallida")
+
+    envio = models.ForeignKey(
+        Envio, on_delete=models.CASCADE, related_name="notificaciones"
+    )
+    destinatario = models.EmailField()
+    asunto = models.CharField(max_length=200)
+    mensaje_html = models.TextField()
+    mensaje_texto = models.TextField()
+
+    estado = models.CharField(
+        max_length=20,
+        choices=EstadoChoices.choices,
+        default=EstadoChoices.PENDIENTE,
+    )
+    intentos = models.PositiveSmallIntegerField(default=0)
+    proximo_intento = models.DateTimeField(default=timezone.now)
+    ultimo_error = models.TextField(null=True, blank=True)
+
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    fecha_envio = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Notificación por Email"
+        verbose_name_plural = "Notificaciones por Email"
+        ordering = ["fecha_creacion"]
+        indexes = [
+            models.Index(
+                fields=["estado", "proximo_intento"],
+                name="notif_pendientes_idx",
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.envio_id} → {self.destinatario} ({self.estado})"
+
+
+class SnapshotRastreo(models.Model):
+    """
+    Respuesta pública de rastreo ya serializada, una por número de guía.
+    Se reconstruye al cambiar el envío o su historial (envios.rastreo) y
+    evita leer el envío y su historial en cada consulta pública.
+    """
+
+    envio = models.OneToOneField(
+        Envio, on_delete=models.CASCADE, related_name="snapshot_rastreo"
+    )
+    numero_guia = models.CharField(max_length=20, unique=True)
+    datos = models.JSONField()
+    etag = models.CharField(max_length=32)
+    ultima_modificacion = models.DateTimeField()
+    fecha_actualizacion = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Snapshot de Rastreo"
+        verbose_name_plural = "Snapshots de Rastreo"
+
+    def __str__(self):
+        return f"Snapshot {self.numero_guia}"
+
+
+class ContadorEnvios(models.Model):
+    """
+    Totales de envíos por empresa y estado para los dashboards. Se
+    actualizan de forma incremental al crear, cambiar de estado o eliminar
+    envíos (envios.estadisticas) y se reconcilian periódicamente con
+    `manage.py reconciliar_estadisticas`.
+    """
+
+    empresa = models.ForeignKey(
+        Empresa, on_delete=models.CASCADE, related_name="contadores_envios"
+    )
+    estado = models.CharField(
+        max_length=20, choices=Envio.EstadoChoices.choices
+    )
+    total = models.IntegerField(default=0)
+    peso_total = models.DecimalField(
+        max_digits=14, decimal_places=2, default=0
+    )
+    valor_declarado_total = models.DecimalField(
+        max_digits=16, decimal_places=2, default=0
+    )
+    fecha_actualizacion = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        verbose_name = "Contador de Envíos"
+        verbose_name_plural = "Contadores de Envíos"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["empresa", "estado"], name="contador_empresa_estado"
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.empresa_id} {self.estado}: {self.total}"
+
+
+class MetricaEnvios(models.Model):
+    """
+    Rollup de transiciones de estado por empresa, estado y periodo (hora o
+    día), para las series de los dashboards. Lo alimenta
+    `manage.py agregar_metricas` a partir de HistorialEstado
+    (envios.metricas).
+    """
+
+    class GranularidadChoices(models.TextChoices):
+        HORA = "hora", _("Hora")
+        DIA = "dia", _("Día")
+
+    empresa = models.ForeignKey(
+        Empresa, on_delete=models.CASCADE, related_name="metricas_envios"
+    )
+    granularidad = models.CharField(
+        max_length=4, choices=GranularidadChoices.choices
+    )
+    inicio = models.DateTimeField(help_text="Inicio del periodo")
+    estado = models.CharField(
+        max_length=20, choices=Envio.EstadoChoices.choices
+    )
+    entradas = models.IntegerField(
+        default=0, help_text="Envíos que pasaron a este estado"
+    )
+    salidas = models.IntegerField(
+        default=0, help_text="Envíos que salieron de este estado"
+    )
+    segundos_en_estado = models.BigIntegerField(
+        default=0, help_text="Tiempo total en el estado de las salidas"
+    )
+
+    class Meta:
+        verbose_name = "Métrica de Envíos"
+        verbose_name_plural = "Métricas de Envíos"
+        constraints = [
+            # Sirve también de índice para las consultas por rango
+            models.UniqueConstraint(
+                fields=["empresa", "granularidad", "inicio", "estado"],
+                name="metrica_empresa_periodo_estado",
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.empresa_id} {self.granularidad} {self.inicio}"
+
+
+class ProgresoMetricas(models.Model):
+    """
+    Marca de agua de la agregación de métricas: último HistorialEstado ya
+    incluido en los rollups.
+    """
+
+    nombre = models.CharField(max_length=50, unique=True)
+    ultimo_id = models.BigIntegerField(default=0)
+    fecha_actualizacion = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Progreso de Métricas"
+        verbose_name_plural = "Progreso de Métricas"
+
+    def __str__(self):
+        return f"{self.nombre}: {self.ultimo_id}"
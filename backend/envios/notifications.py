@@ -1,20 +1,30 @@
-from django.core.mail import send_mail
+import logging
+import threading
+from datetime import timedelta
+
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import close_old_connections, connection, transaction
 from django.template.loader import render_to_string
 from django.conf import settings
+from django.utils import timezone
 from django.utils.html import strip_tags
-from envios.models import Envio
+from envios.models import Envio, NotificacionEmail
 
-def enviar_notificacion_estado(envio, estado_anterior=None):
+logger = logging.getLogger(__name__)
+
+
+def construir_notificacion(envio, estado_anterior=None):
     """
-    Envía notificaciones por email cuando cambia el estado de un envío
+    Prepara asunto, cuerpo y destinatarios de la notificación de estado.
+    Devuelve None si el envío no tiene direcciones válidas.
     """
     # Verificar si se debe enviar notificación al remitente, destinatario o ambos
     enviar_a_remitente = envio.remitente_email and '@' in envio.remitente_email
     enviar_a_destinatario = envio.destinatario_email and '@' in envio.destinatario_email
-    
+
     if not (enviar_a_remitente or enviar_a_destinatario):
-        return False  # No hay direcciones válidas para enviar
-    
+        return None  # No hay direcciones válidas para enviar
+
     # Preparar los datos para la plantilla
     context = {
         'envio': envio,
@@ -24,7 +34,7 @@ def enviar_notificacion_estado(envio, estado_anterior=None):
         'fecha_actualizacion': envio.ultima_actualizacion,
         'url_seguimiento': f"{getattr(settings, 'FRONTEND_URL', '')}/rastrear?guia={envio.numero_guia}"
     }
-    
+
     # Determinar el asunto según el estado
     asunto = f"Envío #{envio.numero_guia} - "
     if envio.estado_actual == Envio.EstadoChoices.RECIBIDO:
@@ -41,30 +51,205 @@ def enviar_notificacion_estado(envio, estado_anterior=None):
         asunto += "Envío cancelado"
     else:
         asunto += "Actualización de estado"
-    
+
     # Renderizar la plantilla HTML
     html_message = render_to_string('emails/notificacion_estado.html', context)
     plain_message = strip_tags(html_message)
-    
+
     # Preparar destinatarios
     destinatarios = []
     if enviar_a_remitente:
         destinatarios.append(envio.remitente_email)
     if enviar_a_destinatario:
         destinatarios.append(envio.destinatario_email)
-    
-    # Enviar el email a cada destinatario por separado
+
+    return asunto, html_message, plain_message, destinatarios
+
+
+def _crear_mensaje(asunto, html_message, plain_message, destinatario, conexion):
+    mensaje = EmailMultiAlternatives(
+        subject=asunto,
+        body=plain_message,
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=[destinatario],
+        connection=conexion,
+    )
+    mensaje.attach_alternative(html_message, 'text/html')
+    return mensaje
+
+
+def enviar_notificacion_estado(envio, estado_anterior=None):
+    """
+    Envía notificaciones por email cuando cambia el estado de un envío.
+    Envío síncrono: las vistas usan encolar_notificacion_estado.
+    """
+    notificacion = construir_notificacion(envio, estado_anterior)
+    if notificacion is None:
+        return False
+    asunto, html_message, plain_message, destinatarios = notificacion
+
+    # Enviar el email a cada destinatario por separado, con una sola conexión
     try:
-        for destinatario in destinatarios:
-            send_mail(
-                subject=asunto,
-                message=plain_message,
-                from_email=settings.DEFAULT_FROM_EMAIL,
-                recipient_list=[destinatario],
-                html_message=html_message,
-                fail_silently=False,
-            )
+        conexion = get_connection(fail_silently=False)
+        conexion.send_messages([
+            _crear_mensaje(asunto, html_message, plain_message, destinatario, conexion)
+            for destinatario in destinatarios
+        ])
         return True
     except Exception as e:
-        print(f"Error enviando notificación: {e}")
+        logger.warning(f"Error enviando notificación: {e}")
         return False
+
+
+def encolar_notificaciones(cambios):
+    """
+    Registra en la bandeja de salida las notificaciones de varios cambios
+    de estado, dentro de la transacción actual. `cambios` es una lista de
+    tuplas (envio, estado_anterior). Tras el commit se despachan en segundo
+    plano si NOTIFICACIONES_DESPACHO_EN_COMMIT está activo.
+    """
+    notificaciones = []
+    for envio, estado_anterior in cambios:
+        notificacion = construir_notificacion(envio, estado_anterior)
+        if notificacion is None:
+            continue
+        asunto, html_message, plain_message, destinatarios = notificacion
+        notificaciones.extend(
+            NotificacionEmail(
+                envio=envio,
+                destinatario=destinatario,
+                asunto=asunto,
+                mensaje_html=html_message,
+                mensaje_texto=plain_message,
+            )
+            for destinatario in destinatarios
+        )
+
+    if not notificaciones:
+        return 0
+
+    creadas = NotificacionEmail.objects.bulk_create(notificaciones)
+
+    if getattr(settings, 'NOTIFICACIONES_DESPACHO_EN_COMMIT', True):
+        ids = [notificacion.id for notificacion in creadas if notificacion.id]
+        transaction.on_commit(lambda: despachar_en_segundo_plano(ids))
+
+    return len(creadas)
+
+
+def encolar_notificacion_estado(envio, estado_anterior=None):
+    """
+    Versión transaccional de enviar_notificacion_estado.
+    """
+    return encolar_notificaciones([(envio, estado_anterior)])
+
+
+def despachar_en_segundo_plano(ids=None):
+    """
+    Despacha las notificaciones indicadas en un hilo aparte para que la
+    latencia del API no dependa del servidor de correo.
+    """
+    def _despachar():
+        try:
+            despachar_notificaciones(limite=len(ids) if ids else 100, ids=ids)
+        except Exception as e:
+            logger.warning(f"Error despachando notificaciones: {e}")
+        finally:
+            close_old_connections()
+            connection.close()
+
+    threading.Thread(target=_despachar, daemon=True).start()
+
+
+def _reclamar_lote(limite, ids=None):
+    """
+    Reserva un lote de notificaciones pendientes. La reserva se hace
+    moviendo proximo_intento hacia el futuro en una transacción corta, de
+    modo que varios workers no envíen la misma notificación.
+    """
+    ahora = timezone.now()
+    reserva = timedelta(
+        seconds=getattr(settings, 'NOTIFICACIONES_RESERVA_SEGUNDOS', 300)
+    )
+
+    with transaction.atomic():
+        queryset = NotificacionEmail.objects.filter(
+            estado=NotificacionEmail.EstadoChoices.PENDIENTE,
+            proximo_intento__lte=ahora,
+        )
+        if ids is not None:
+            queryset = queryset.filter(id__in=ids)
+        if connection.features.has_select_for_update_skip_locked:
+            queryset = queryset.select_for_update(skip_locked=True)
+
+        lote = list(queryset.order_by('proximo_intento')[:limite])
+        NotificacionEmail.objects.filter(
+            id__in=[notificacion.id for notificacion in lote]
+        ).update(proximo_intento=ahora + reserva)
+
+    return lote
+
+
+def despachar_notificaciones(limite=100, ids=None):
+    """
+    Envía un lote de notificaciones pendientes reutilizando una única
+    conexión SMTP. Los fallos se reintentan con backoff exponencial hasta
+    NOTIFICACIONES_MAX_INTENTOS.
+
+    Returns:
+        dict: {'enviadas': int, 'reintentos': int, 'fallidas': int}
+    """
+    resultado = {'enviadas': 0, 'reintentos': 0, 'fallidas': 0}
+
+    lote = _reclamar_lote(limite, ids)
+    if not lote:
+        return resultado
+
+    max_intentos = getattr(settings, 'NOTIFICACIONES_MAX_INTENTOS', 5)
+    backoff = getattr(settings, 'NOTIFICACIONES_BACKOFF_SEGUNDOS', 60)
+
+    conexion = get_connection(fail_silently=False)
+    try:
+        try:
+            conexion.open()
+            error_conexion = None
+        except Exception as e:
+            # Servidor de correo caído: todo el lote cuenta como intento fallido
+            error_conexion = e
+
+        for notificacion in lote:
+            mensaje = _crear_mensaje(
+                notificacion.asunto,
+                notificacion.mensaje_html,
+                notificacion.mensaje_texto,
+                notificacion.destinatario,
+                conexion,
+            )
+            notificacion.intentos += 1
+            try:
+                if error_conexion is not None:
+                    raise error_conexion
+                conexion.send_messages([mensaje])
+            except Exception as e:
+                notificacion.ultimo_error = str(e)
+                if notificacion.intentos >= max_intentos:
+                    notificacion.estado = NotificacionEmail.EstadoChoices.FALLIDA
+                    resultado['fallidas'] += 1
+                else:
+                    notificacion.proximo_intento = timezone.now() + timedelta(
+                        seconds=backoff * 2 ** (notificacion.intentos - 1)
+                    )
+                    resultado['reintentos'] += 1
+            else:
+                notificacion.estado = NotificacionEmail.EstadoChoices.ENVIADA
+                notificacion.fecha_envio = timezone.now()
+                notificacion.ultimo_error = None
+                resultado['enviadas'] += 1
+    finally:
+        conexion.close()
+        NotificacionEmail.objects.bulk_update(
+            lote,
+            ['estado', 'intentos', 'proximo_intento', 'ultimo_error', 'fecha_envio'],
+        )
+
+    return resultado
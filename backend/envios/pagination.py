@@ -0,0 +1,10 @@
+from core.pagination import KeysetPagination
+
+
+class HistorialPagination(KeysetPagination):
+    """
+    Paginación por keyset del historial de estados, del más reciente al
+    más antiguo
+    """
+
+    ordering = ("-fecha", "-id")
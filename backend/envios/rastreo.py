@@ -0,0 +1,269 @@
+"""
+Snapshots del rastreo público.
+
+La respuesta pública de cada guía se guarda ya serializada en
+SnapshotRastreo, con una caché delante, junto con su ETag y su fecha de
+última modificación. Así el rastreo (y sus respuestas 304) es una sola
+búsqueda por clave.
+
+Los snapshots se reconstruyen tras el commit: las señales de
+Envio/HistorialEstado cubren las escrituras normales (vistas, admin) y las
+escrituras en bloque llaman a programar_snapshots.
+"""
+
+import hashlib
+import json
+import threading
+
+from core.instrumentacion import registrar_cache
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Prefetch
+from rest_framework.utils.encoders import JSONEncoder
+
+from .models import Envio, HistorialEstado, SnapshotRastreo
+
+CLAVE_SNAPSHOT = "rastreo:snapshot:{numero_guia}"
+# Marcador de guía inexistente: evita repetir las consultas de cada fallo
+NO_ENCONTRADO = "__missing__"
+
+_local = threading.local()
+
+
+def _cache():
+    return caches[getattr(settings, "RASTREO_CACHE_ALIAS", "default")]
+
+
+def _timeout():
+    return getattr(settings, "RASTREO_SNAPSHOT_TIMEOUT", 300)
+
+
+def _timeout_no_encontrado():
+    return getattr(settings, "RASTREO_NO_ENCONTRADO_TIMEOUT", 30)
+
+
+def _marcar_no_encontradas(numeros_guia):
+    # add y no set: si el envío se creó mientras tanto, su snapshot ya
+    # escrito tras el commit no se pisa con el marcador
+    for numero in numeros_guia:
+        _cache().add(
+            CLAVE_SNAPSHOT.format(numero_guia=numero),
+            NO_ENCONTRADO,
+            _timeout_no_encontrado(),
+        )
+
+
+def datos_rastreo(envio):
+    """
+    Información pública de un envío. Espera el historial precargado.
+    """
+    return {
+        "numero_guia": envio.numero_guia,
+        "estado": envio.estado_actual,
+        "estado_display": envio.get_estado_actual_display(),
+        "remitente_nombre": envio.remitente_nombre,
+        "destinatario_nombre": envio.destinatario_nombre,
+        "fecha_actualizacion": envio.ultima_actualizacion,
+        "historial": [
+            {
+                "estado": h.estado,
+                "fecha": h.fecha,
+                "comentario": h.comentario,
+                "ubicacion": h.ubicacion,
+            }
+            for h in envio.historial.all()
+        ],
+    }
+
+
+def _construir_snapshot(envio):
+    # Serializar como lo haría la respuesta de DRF (fechas ISO 8601)
+    contenido = json.dumps(
+        datos_rastreo(envio), cls=JSONEncoder, ensure_ascii=False
+    )
+    historial = envio.historial.all()
+    fechas = [envio.ultima_actualizacion] + [h.fecha for h in historial[:1]]
+
+    return SnapshotRastreo(
+        envio=envio,
+        numero_guia=envio.numero_guia,
+        datos=json.loads(contenido),
+        etag=hashlib.md5(contenido.encode("utf-8")).hexdigest(),
+        ultima_modificacion=max(fechas),
+    )
+
+
+def _valor_cache(snapshot):
+    return {
+        "datos": snapshot.datos,
+        "etag": snapshot.etag,
+        "last_modified": snapshot.ultima_modificacion.timestamp(),
+    }
+
+
+def _guardar_snapshots(envios):
+    envios = envios.prefetch_related(
+        Prefetch(
+            "historial",
+            queryset=HistorialEstado.objects.order_by("-fecha", "-id"),
+        )
+    )
+    snapshots = [_construir_snapshot(envio) for envio in envios]
+    if not snapshots:
+        return []
+
+    SnapshotRastreo.objects.bulk_create(
+        snapshots,
+        update_conflicts=True,
+        unique_fields=["envio"],
+        update_fields=[
+            "numero_guia",
+            "datos",
+            "etag",
+            "ultima_modificacion",
+            "fecha_actualizacion",
+        ],
+    )
+    _cache().set_many(
+        {
+            CLAVE_SNAPSHOT.format(numero_guia=s.numero_guia): _valor_cache(s)
+            for s in snapshots
+        },
+        _timeout(),
+    )
+    return snapshots
+
+
+def actualizar_snapshots(envio_ids):
+    """
+    Reconstruye los snapshots de los envíos indicados (upsert en bloque) y
+    los escribe en la caché.
+
+    Returns:
+        list: Snapshots actualizados
+    """
+    return _guardar_snapshots(Envio.objects.filter(id__in=list(envio_ids)))
+
+
+def _pendientes():
+    if not hasattr(_local, "pendientes"):
+        _local.pendientes = set()
+    return _local.pendientes
+
+
+def _procesar_pendientes():
+    pendientes = _pendientes()
+    envio_ids = set(pendientes)
+    pendientes.clear()
+    if envio_ids:
+        actualizar_snapshots(envio_ids)
+
+
+def programar_snapshots(*envio_ids):
+    """
+    Reconstruye los snapshots tras el commit de la transacción actual.
+    Los envíos tocados varias veces en la misma transacción se procesan
+    una sola vez.
+    """
+    _pendientes().update(envio_ids)
+    transaction.on_commit(_procesar_pendientes)
+
+
+def invalidar_snapshots(*numeros_guia):
+    """
+    Descarta de la caché los snapshots de las guías indicadas.
+    """
+    _cache().delete_many(
+        [CLAVE_SNAPSHOT.format(numero_guia=numero) for numero in numeros_guia]
+    )
+
+
+def obtener_snapshot(numero_guia):
+    """
+    Devuelve {"datos", "etag", "last_modified"} de la guía, o None si no
+    existe. Si el envío aún no tiene snapshot se construye en el momento.
+    Las guías inexistentes se recuerdan RASTREO_NO_ENCONTRADO_TIMEOUT
+    segundos (los envíos nuevos sobrescriben el marcador tras el commit).
+    """
+    clave = CLAVE_SNAPSHOT.format(numero_guia=numero_guia)
+    valor = _cache().get(clave)
+    registrar_cache(
+        "rastreo", aciertos=valor is not None, fallos=valor is None
+    )
+    if valor == NO_ENCONTRADO:
+        return None
+    if valor is not None:
+        return valor
+
+    snapshot = SnapshotRastreo.objects.filter(numero_guia=numero_guia).first()
+    if snapshot is None:
+        envio_id = (
+            Envio.objects.filter(numero_guia=numero_guia)
+            .values_list("id", flat=True)
+            .first()
+        )
+        snapshots = actualizar_snapshots([envio_id]) if envio_id else []
+        if not snapshots:
+            _marcar_no_encontradas([numero_guia])
+            return None
+        return _valor_cache(snapshots[0])
+
+    valor = _valor_cache(snapshot)
+    _cache().set(clave, valor, _timeout())
+    return valor
+
+
+def obtener_snapshots(numeros_guia):
+    """
+    obtener_snapshot para varias guías con un número fijo de consultas:
+    una lectura múltiple de la caché, una consulta de SnapshotRastreo por
+    numero_guia__in para las que falten y, si algún envío aún no tiene
+    snapshot, una de envíos y otra del historial precargado.
+
+    Returns:
+        dict: {numero_guia: {"datos", "etag", "last_modified"}} solo con
+        las guías que existen
+    """
+    claves = {
+        CLAVE_SNAPSHOT.format(numero_guia=numero): numero
+        for numero in numeros_guia
+    }
+    encontrados = {
+        claves[clave]: valor
+        for clave, valor in _cache().get_many(list(claves)).items()
+    }
+    faltan = [
+        numero for numero in claves.values() if numero not in encontrados
+    ]
+    registrar_cache("rastreo", aciertos=len(encontrados), fallos=len(faltan))
+    encontrados = {
+        numero: valor
+        for numero, valor in encontrados.items()
+        if valor != NO_ENCONTRADO
+    }
+    if not faltan:
+        return encontrados
+
+    snapshots = list(SnapshotRastreo.objects.filter(numero_guia__in=faltan))
+    if snapshots:
+        valores = {s.numero_guia: _valor_cache(s) for s in snapshots}
+        _cache().set_many(
+            {
+                CLAVE_SNAPSHOT.format(numero_guia=numero): valor
+                for numero, valor in valores.items()
+            },
+            _timeout(),
+        )
+        encontrados.update(valores)
+
+    sin_snapshot = [numero for numero in faltan if numero not in encontrados]
+    if sin_snapshot:
+        nuevos = _guardar_snapshots(
+            Envio.objects.filter(numero_guia__in=sin_snapshot)
+        )
+        encontrados.update({s.numero_guia: _valor_cache(s) for s in nuevos})
+        _marcar_no_encontradas(
+            [numero for numero in sin_snapshot if numero not in encontrados]
+        )
+    return encontrados
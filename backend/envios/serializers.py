@@ -1,11 +1,16 @@
+from datetime import timedelta
+from decimal import Decimal
+from core.campos import CamposDinamicosMixin
+from django.utils import timezone
 from rest_framework import serializers
+from .etiquetas import DISENOS
 from .models import Envio, HistorialEstado
 import re
 from django.core.validators import validate_email
 from django.core.exceptions import ValidationError as DjangoValidationError
 from usuarios.serializers import UsuarioSerializer
 
-class HistorialEstadoSerializer(serializers.ModelSerializer):
+class HistorialEstadoSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     """
     Serializer para el modelo HistorialEstado
     """
@@ -18,7 +23,7 @@ class HistorialEstadoSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'fecha']
 
 
-class EnvioSerializer(serializers.ModelSerializer):
+class EnvioSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     """
     Serializer para el modelo Envio
     """
@@ -34,14 +39,15 @@ class EnvioSerializer(serializers.ModelSerializer):
         model = Envio
         fields = ['id', 'numero_guia', 'estado_actual', 'estado_display', 'fecha_creacion', 
                   'fecha_estimada_entrega', 'descripcion', 'peso', 
-                  'valor_declarado', 'remitente_nombre', 'remitente_direccion',
+                  'valor_declarado', 'precio', 'remitente_nombre',
+                  'remitente_direccion',
                   'remitente_telefono', 'remitente_email', 'destinatario_nombre',
                   'destinatario_direccion', 'destinatario_telefono', 
                   'destinatario_email', 'notas', 'creado_por', 'actualizado_por',
-                  'ultima_actualizacion', 'historial']
-        read_only_fields = ['id', 'numero_guia', 'fecha_creacion', 
+                  'ultima_actualizacion', 'id_cliente', 'historial']
+        read_only_fields = ['id', 'numero_guia', 'precio', 'fecha_creacion',
                             'ultima_actualizacion', 'creado_por', 
-                            'actualizado_por', 'historial']
+                            'actualizado_por', 'id_cliente', 'historial']
     
     def validate_remitente_telefono(self, value):
         if not re.match(r'^\+?[0-9]{7,15}$', value):
@@ -110,6 +116,17 @@ class EnvioSerializer(serializers.ModelSerializer):
         return value
 
 
+class EnvioListSerializer(EnvioSerializer):
+    """
+    Serializer ligero para listados de envíos (sin el historial anidado,
+    salvo con ?expand=historial)
+    """
+    class Meta(EnvioSerializer.Meta):
+        fields = [field for field in EnvioSerializer.Meta.fields
+                  if field != 'historial']
+        expandibles = ['historial']
+
+
 class CambioEstadoSerializer(serializers.Serializer):
     """
     Serializer para cambiar el estado de un envío y registrarlo en el historial
@@ -117,3 +134,193 @@ class CambioEstadoSerializer(serializers.Serializer):
     estado = serializers.ChoiceField(choices=Envio.EstadoChoices.choices)
     comentario = serializers.CharField(required=False, allow_blank=True)
     ubicacion = serializers.CharField(required=False, allow_blank=True)
+
+
+class CambioEstadoLoteSerializer(CambioEstadoSerializer):
+    """
+    Serializer para cambiar el estado de varios envíos a la vez,
+    identificados por número de guía y/o ID
+    """
+    MAX_ENVIOS = 1000
+
+    numeros_guia = serializers.ListField(
+        child=serializers.CharField(max_length=20), required=False
+    )
+    ids = serializers.ListField(
+        child=serializers.IntegerField(), required=False
+    )
+
+    def validate(self, data):
+        total = len(data.get('numeros_guia', [])) + len(data.get('ids', []))
+        if not total:
+            raise serializers.ValidationError(
+                "Se requiere al menos un número de guía o ID"
+            )
+        if total > self.MAX_ENVIOS:
+            raise serializers.ValidationError(
+                f"No se pueden cambiar más de {self.MAX_ENVIOS} envíos a la vez"
+            )
+        return data
+
+
+class MetricasQuerySerializer(serializers.Serializer):
+    """
+    Parámetros de consulta de las series de métricas de envíos
+    """
+    # Rango por defecto y máximo de cada intervalo
+    RANGOS = {
+        'hora': (timedelta(days=2), timedelta(days=31)),
+        'dia': (timedelta(days=30), timedelta(days=366)),
+        'semana': (timedelta(weeks=26), timedelta(weeks=260)),
+    }
+
+    intervalo = serializers.ChoiceField(
+        choices=list(RANGOS), default='dia'
+    )
+    desde = serializers.DateTimeField(required=False)
+    hasta = serializers.DateTimeField(required=False)
+    estados = serializers.MultipleChoiceField(
+        choices=Envio.EstadoChoices.choices, required=False
+    )
+
+    def validate(self, data):
+        por_defecto, maximo = self.RANGOS[data['intervalo']]
+        data.setdefault('hasta', timezone.now())
+        data.setdefault('desde', data['hasta'] - por_defecto)
+        if data['desde'] >= data['hasta']:
+            raise serializers.ValidationError(
+                "'desde' debe ser anterior a 'hasta'"
+            )
+        if data['hasta'] - data['desde'] > maximo:
+            raise serializers.ValidationError(
+                f"El rango máximo para '{data['intervalo']}' es de "
+                f"{maximo.days} días"
+            )
+        return data
+
+
+class CotizacionSerializer(serializers.Serializer):
+    """
+    Paquete a cotizar: peso en kg y, opcionalmente, dimensiones en cm
+    """
+    ref = serializers.CharField(required=False, max_length=100)
+    peso = serializers.DecimalField(
+        max_digits=8, decimal_places=3, min_value=Decimal('0.001')
+    )
+    largo = serializers.DecimalField(
+        max_digits=8, decimal_places=2, min_value=Decimal('0'), required=False
+    )
+    ancho = serializers.DecimalField(
+        max_digits=8, decimal_places=2, min_value=Decimal('0'), required=False
+    )
+    alto = serializers.DecimalField(
+        max_digits=8, decimal_places=2, min_value=Decimal('0'), required=False
+    )
+    seguro = serializers.BooleanField(default=False)
+
+
+class CotizacionLoteSerializer(serializers.Serializer):
+    """
+    Serializer para cotizar varios paquetes (p. ej. un manifiesto) a la vez
+    """
+    MAX_PAQUETES = 1000
+
+    paquetes = CotizacionSerializer(many=True, allow_empty=False)
+    moneda = serializers.CharField(required=False, max_length=3)
+
+    def validate_paquetes(self, value):
+        if len(value) > self.MAX_PAQUETES:
+            raise serializers.ValidationError(
+                f"No se pueden cotizar más de {self.MAX_PAQUETES} paquetes a la vez"
+            )
+        return value
+
+    def validate_moneda(self, value):
+        return value.upper()
+
+
+class EtiquetasLoteSerializer(serializers.Serializer):
+    """
+    Serializer para imprimir las etiquetas de varios envíos en un PDF,
+    identificados por número de guía y/o ID
+    """
+    MAX_ENVIOS = 500
+
+    numeros_guia = serializers.ListField(
+        child=serializers.CharField(max_length=20), required=False
+    )
+    ids = serializers.ListField(
+        child=serializers.IntegerField(), required=False
+    )
+    diseno = serializers.ChoiceField(
+        choices=list(DISENOS), default='etiqueta'
+    )
+
+    def validate(self, data):
+        total = len(data.get('numeros_guia', [])) + len(data.get('ids', []))
+        if not total:
+            raise serializers.ValidationError(
+                "Se requiere al menos un número de guía o ID"
+            )
+        if total > self.MAX_ENVIOS:
+            raise serializers.ValidationError(
+                f"No se pueden imprimir más de {self.MAX_ENVIOS} etiquetas a la vez"
+            )
+        return data
+
+
+class OperacionSincronizacionSerializer(serializers.Serializer):
+    """
+    Operación hecha sin conexión: alta de un envío ('crear', con sus
+    'datos') o cambio de estado ('cambiar_estado') de un envío identificado
+    por 'id', 'numero_guia' o 'id_cliente'
+    """
+    id_local = serializers.CharField(max_length=64)
+    tipo = serializers.ChoiceField(choices=['crear', 'cambiar_estado'])
+    datos = serializers.DictField(required=False)
+    id = serializers.IntegerField(required=False)
+    numero_guia = serializers.CharField(max_length=20, required=False)
+    id_cliente = serializers.CharField(max_length=64, required=False)
+    estado = serializers.ChoiceField(
+        choices=Envio.EstadoChoices.choices, required=False
+    )
+    comentario = serializers.CharField(required=False, allow_blank=True)
+    ubicacion = serializers.CharField(
+        required=False, allow_blank=True, max_length=100
+    )
+    # ultima_actualizacion del envío cuando se hizo el cambio
+    version = serializers.DateTimeField(required=False)
+
+    def validate(self, data):
+        if data['tipo'] == 'crear':
+            if 'datos' not in data:
+                raise serializers.ValidationError(
+                    "Se requieren los datos del envío"
+                )
+        elif 'estado' not in data:
+            raise serializers.ValidationError("Se requiere el estado")
+        elif not any(
+            campo in data for campo in ('id', 'numero_guia', 'id_cliente')
+        ):
+            raise serializers.ValidationError(
+                "Se requiere el id, número de guía o id_cliente del envío"
+            )
+        return data
+
+
+class SincronizacionSerializer(serializers.Serializer):
+    """
+    Serializer para subir en lote las operaciones hechas sin conexión
+    """
+    MAX_OPERACIONES = 500
+
+    operaciones = OperacionSincronizacionSerializer(
+        many=True, allow_empty=False
+    )
+
+    def validate_operaciones(self, value):
+        if len(value) > self.MAX_OPERACIONES:
+            raise serializers.ValidationError(
+                f"No se pueden subir más de {self.MAX_OPERACIONES} operaciones a la vez"
+            )
+        return value
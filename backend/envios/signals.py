@@ -0,0 +1,96 @@
+"""
+Señales de la app envios.
+
+Mantienen al día los snapshots del rastreo público, los contadores de
+envíos por empresa y las marcas de envíos borrados de la sincronización.
+La reconstrucción de snapshots espera al commit para no publicar datos de
+una transacción que puede deshacerse; los contadores se actualizan dentro
+de la misma transacción.
+"""
+
+from django.db import transaction
+from django.db.models.signals import (
+    post_delete,
+    post_init,
+    post_save,
+    pre_save,
+)
+from django.dispatch import receiver
+from empresas.models import Empresa
+
+from .estadisticas import registrar_cambio, valores_envio
+from .models import Envio, EnvioEliminado, HistorialEstado
+from .rastreo import invalidar_snapshots, programar_snapshots
+
+CAMPOS_CONTADOR = ("empresa_id", "estado_actual", "peso", "valor_declarado")
+
+
+@receiver(post_save, sender=Envio)
+def actualizar_snapshot_envio(sender, instance, **kwargs):
+    programar_snapshots(instance.id)
+
+
+@receiver(post_delete, sender=Envio)
+def invalidar_snapshot_envio(sender, instance, **kwargs):
+    numero_guia = instance.numero_guia
+    transaction.on_commit(lambda: invalidar_snapshots(numero_guia))
+
+
+@receiver(post_save, sender=HistorialEstado)
+@receiver(post_delete, sender=HistorialEstado)
+def actualizar_snapshot_historial(sender, instance, **kwargs):
+    # Cubre cambiar_estado, perform_create y los inlines del admin
+    programar_snapshots(instance.envio_id)
+
+
+@receiver(post_init, sender=Envio)
+def recordar_valores_contador(sender, instance, **kwargs):
+    # Valores con los que se cargó el envío, para calcular el delta de los
+    # contadores al guardar. Con campos diferidos se leen en pre_save.
+    if instance.pk is None or any(
+        campo not in instance.__dict__ for campo in CAMPOS_CONTADOR
+    ):
+        instance._valores_contador = None
+    else:
+        instance._valores_contador = valores_envio(instance)
+
+
+@receiver(pre_save, sender=Envio)
+def leer_valores_contador(sender, instance, **kwargs):
+    if instance._state.adding or instance._valores_contador is not None:
+        return
+    original = (
+        Envio.objects.filter(pk=instance.pk).only(*CAMPOS_CONTADOR).first()
+    )
+    instance._valores_contador = original and valores_envio(original)
+
+
+@receiver(post_save, sender=Envio)
+def actualizar_contadores_envio(sender, instance, created, **kwargs):
+    anteriores = None if created else instance._valores_contador
+    actuales = valores_envio(instance)
+    if anteriores != actuales:
+        registrar_cambio(anteriores, actuales)
+    instance._valores_contador = actuales
+
+
+@receiver(post_delete, sender=Envio)
+def descontar_envio(sender, instance, origin=None, **kwargs):
+    # Al borrar la empresa sus contadores se eliminan en cascada
+    if isinstance(origin, Empresa):
+        return
+    registrar_cambio(instance._valores_contador, None)
+
+
+@receiver(post_delete, sender=Envio)
+def marcar_envio_eliminado(sender, instance, origin=None, **kwargs):
+    # Al borrar la empresa no queda nadie que sincronice sus envíos
+    if isinstance(origin, Empresa):
+        return
+    EnvioEliminado.objects.create(
+        empresa_id=instance.empresa_id,
+        envio_id=instance.id,
+        numero_guia=instance.numero_guia,
+        remitente_telefono=instance.remitente_telefono,
+        destinatario_telefono=instance.destinatario_telefono,
+    )
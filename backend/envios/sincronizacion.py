@@ -0,0 +1,276 @@
+"""
+Sincronización incremental de envíos para la PWA.
+
+Los cambios se leen como tres flujos ordenados por (fecha, id), cada uno
+con su posición en el cursor:
+
+- envios: envíos creados o modificados (ultima_actualizacion)
+- historial: registros nuevos del historial (fecha)
+- eliminados: marcas de envíos borrados (EnvioEliminado.fecha)
+
+Cada respuesta trae como mucho SINCRONIZACION_MAX_FILAS filas por flujo y
+el cursor con el que pedir la siguiente; el cliente repite mientras
+hay_mas sea verdadero. Solo se leen filas con más de
+SINCRONIZACION_MARGEN_SEGUNDOS de antigüedad, para no adelantar el cursor
+por encima de transacciones que aún no han hecho commit.
+
+Las marcas de borrado se conservan SINCRONIZACION_RETENCION_DIAS; un
+cursor más antiguo ya no garantiza ver todos los borrados y la respuesta
+pide al cliente que descargue todo de nuevo (reiniciar).
+
+Las operaciones hechas sin conexión se suben en lote y se aplican una a
+una: las altas llevan un id_local que se guarda en Envio.id_cliente (un
+reenvío devuelve el envío ya creado) y los cambios de estado pueden
+indicar la versión (ultima_actualizacion) sobre la que se hicieron para
+detectar conflictos con cambios del servidor.
+"""
+
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as BinasciiError
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from .estados import cambiar_estado_lote
+from .models import EnvioEliminado
+
+# Campo de fecha que ordena cada flujo
+FLUJOS = {
+    "envios": "ultima_actualizacion",
+    "historial": "fecha",
+    "eliminados": "fecha",
+}
+
+
+def codificar_cursor(posiciones):
+    """
+    Cursor opaco a partir de {flujo: (fecha, id)}. Un id None indica que
+    el flujo se leyó completo hasta esa fecha.
+    """
+    datos = {
+        flujo: [fecha.isoformat(), ultimo_id]
+        for flujo, (fecha, ultimo_id) in posiciones.items()
+    }
+    return urlsafe_b64encode(
+        json.dumps(datos, separators=(",", ":")).encode("utf-8")
+    ).decode("ascii")
+
+
+def leer_cursor(cursor):
+    """
+    Posiciones {flujo: (fecha, id)} de un cursor (None si no hay cursor).
+
+    Raises:
+        ValueError: Si el cursor no es válido
+    """
+    if not cursor:
+        return None
+    try:
+        datos = json.loads(urlsafe_b64decode(cursor.encode("ascii")))
+        posiciones = {}
+        for flujo in FLUJOS:
+            fecha, ultimo_id = datos[flujo]
+            fecha = datetime.fromisoformat(fecha)
+            if timezone.is_naive(fecha) or not (
+                ultimo_id is None or isinstance(ultimo_id, int)
+            ):
+                raise ValueError(cursor)
+            posiciones[flujo] = (fecha, ultimo_id)
+    except (BinasciiError, UnicodeError, KeyError, TypeError) as error:
+        raise ValueError(cursor) from error
+    return posiciones
+
+
+def cursor_caducado(posiciones):
+    """
+    Indica si las marcas de borrado posteriores al cursor pueden haberse
+    purgado ya.
+    """
+    dias = getattr(settings, "SINCRONIZACION_RETENCION_DIAS", 30)
+    fecha, _ = posiciones["eliminados"]
+    return fecha < timezone.now() - timedelta(days=dias)
+
+
+def _despues_de(campo, fecha, ultimo_id):
+    if ultimo_id is None:
+        return Q(**{f"{campo}__gt": fecha})
+    return Q(**{f"{campo}__gt": fecha}) | Q(
+        **{campo: fecha, "id__gt": ultimo_id}
+    )
+
+
+def cambios_desde(querysets, posiciones=None, limite=None):
+    """
+    Lee los cambios posteriores a `posiciones`.
+
+    Args:
+        querysets (dict): {flujo: queryset} ya restringidos al perfil
+        posiciones (dict, optional): Posiciones del cursor recibido; sin
+            él se devuelve todo menos los borrados, que un cliente sin
+            copia local no necesita
+
+    Returns:
+        dict: Las filas de cada flujo, el nuevo cursor y hay_mas
+    """
+    limite = limite or getattr(settings, "SINCRONIZACION_MAX_FILAS", 500)
+    margen = getattr(settings, "SINCRONIZACION_MARGEN_SEGUNDOS", 10)
+    hasta = timezone.now() - timedelta(seconds=margen)
+
+    if posiciones is None:
+        posiciones = {"eliminados": (hasta, None)}
+
+    resultado = {"hay_mas": False}
+    nuevas = {}
+    for flujo, campo in FLUJOS.items():
+        posicion = posiciones.get(flujo)
+        if (
+            posicion is not None
+            and posicion[1] is None
+            and posicion[0] >= hasta
+        ):
+            # Flujo ya leído completo hasta después de `hasta`
+            resultado[flujo] = []
+            nuevas[flujo] = posicion
+            continue
+
+        queryset = querysets[flujo].filter(**{f"{campo}__lte": hasta})
+        if posicion is not None:
+            queryset = queryset.filter(_despues_de(campo, *posicion))
+        filas = list(queryset.order_by(campo, "id")[: limite + 1])
+
+        if len(filas) > limite:
+            filas = filas[:limite]
+            nuevas[flujo] = (getattr(filas[-1], campo), filas[-1].id)
+            resultado["hay_mas"] = True
+        else:
+            nuevas[flujo] = (hasta, None)
+        resultado[flujo] = filas
+
+    resultado["cursor"] = codificar_cursor(nuevas)
+    return resultado
+
+
+def aplicar_cambio_estado(queryset, operacion, usuario=None, modificados=()):
+    """
+    Aplica un cambio de estado hecho sin conexión.
+
+    El envío se identifica por 'id', 'numero_guia' o 'id_cliente'. Si la
+    operación trae 'version' y el envío ha cambiado desde entonces (salvo
+    por operaciones anteriores del mismo lote, en `modificados`), no se
+    aplica y se devuelve un conflicto con el estado actual del servidor.
+
+    Returns:
+        tuple: (resultado, envio) con resultado['estado'] 'aplicado',
+        'sin_cambios', 'conflicto' o 'error'
+    """
+    filtro = {
+        campo: operacion[campo]
+        for campo in ("id", "numero_guia", "id_cliente")
+        if campo in operacion
+    }
+    estado = operacion["estado"]
+
+    with transaction.atomic():
+        envio = (
+            queryset.filter(**filtro).select_for_update(of=("self",)).first()
+        )
+        if envio is None:
+            return {"estado": "error", "error": "Envío no encontrado"}, None
+        if envio.estado_actual == estado:
+            # Ya aplicado (p. ej. reenvío de una operación confirmada)
+            return {"estado": "sin_cambios"}, envio
+
+        version = operacion.get("version")
+        if (
+            version is not None
+            and envio.id not in modificados
+            and version != envio.ultima_actualizacion
+        ):
+            return {
+                "estado": "conflicto",
+                "error": "El envío ha cambiado en el servidor",
+            }, envio
+
+        resultado = cambiar_estado_lote(
+            queryset,
+            estado,
+            ids=[envio.id],
+            comentario=operacion.get("comentario", ""),
+            ubicacion=operacion.get("ubicacion", ""),
+            usuario=usuario,
+        )["resultados"][0]
+        if "error" in resultado:
+            return {"estado": "error", "error": resultado["error"]}, envio
+
+    envio.refresh_from_db()
+    return {"estado": "aplicado"}, envio
+
+
+def crear_envio(queryset, operacion, crear):
+    """
+    Da de alta un envío creado sin conexión con `crear(datos, id_cliente)`,
+    salvo que ya exista uno con el mismo id_local.
+
+    Returns:
+        tuple: (resultado, envio) con resultado['estado'] 'creado',
+        'duplicado' o 'error'
+    """
+    id_cliente = operacion["id_local"]
+    existente = queryset.filter(id_cliente=id_cliente).first()
+    if existente is not None:
+        return {"estado": "duplicado"}, existente
+
+    try:
+        with transaction.atomic():
+            envio = crear(operacion["datos"], id_cliente)
+    except ValidationError as error:
+        return {"estado": "error", "errores": error.detail}, None
+    except IntegrityError:
+        # Otra subida con el mismo id_local se adelantó
+        return {"estado": "duplicado"}, queryset.get(id_cliente=id_cliente)
+    return {"estado": "creado"}, envio
+
+
+def aplicar_operaciones(queryset, operaciones, crear, usuario=None):
+    """
+    Aplica en orden las operaciones subidas por un cliente ('crear' o
+    'cambiar_estado'). Cada una se confirma por separado: un error o un
+    conflicto no impide aplicar las demás.
+
+    Returns:
+        list: (resultado, envio) por operación, en el mismo orden
+    """
+    modificados = set()
+    resultados = []
+    for operacion in operaciones:
+        if operacion["tipo"] == "crear":
+            resultado, envio = crear_envio(queryset, operacion, crear)
+        else:
+            resultado, envio = aplicar_cambio_estado(
+                queryset, operacion, usuario, modificados
+            )
+        if resultado["estado"] in ("creado", "aplicado"):
+            modificados.add(envio.id)
+        resultados.append(
+            ({"id_local": operacion["id_local"], **resultado}, envio)
+        )
+    return resultados
+
+
+def purgar_eliminados(dias=None):
+    """
+    Borra las marcas de envíos eliminados más antiguas que la retención.
+
+    Returns:
+        int: Marcas borradas
+    """
+    if dias is None:
+        dias = getattr(settings, "SINCRONIZACION_RETENCION_DIAS", 30)
+    limite = timezone.now() - timedelta(days=dias)
+    borradas, _ = EnvioEliminado.objects.filter(fecha__lt=limite).delete()
+    return borradas
@@ -0,0 +1,326 @@
+"""
+Endpoint ASGI de Server-Sent Events para cambios de estado de envíos.
+
+Rutas (montadas en config/asgi.py, fuera del ciclo request/response de
+Django para no ocupar un hilo por conexión):
+
+- /api/eventos/guia/<numero_guia>/ — público, eventos de rastreo de una guía
+- /api/eventos/empresa/ — eventos de todos los envíos del tenant; solo
+  dueño y operadores. Como EventSource no permite cabeceras, el navegador
+  pide antes un ticket (POST /api/envios/eventos_ticket/, autenticado como
+  cualquier otra petición) y abre ?ticket=<ticket>. El ticket vale para
+  una sola conexión, caduca a los EVENTOS_TICKET_SEGUNDOS y solo sirve
+  para este stream, así que no importa que quede en logs o en el
+  historial. Los clientes que sí pueden enviar cabeceras usan
+  Authorization (JWT) y X-Tenant-Slug.
+
+Los clientes reanudan con la cabecera Last-Event-ID (o ?ultimo_id=).
+
+Como estas rutas no pasan por los middlewares ni por DRF, aquí se aplican:
+- el canal de una guía solo se abre si la guía existe, y con los mismos
+  límites por IP que el resto de endpoints públicos (core.throttling)
+- un máximo de streams abiertos por proceso (EVENTOS_MAX_CONEXIONES) y
+  por IP (EVENTOS_MAX_CONEXIONES_IP)
+
+Requiere un servidor ASGI: en producción gunicorn con workers de uvicorn
+(gunicorn.conf.py); en desarrollo `uvicorn config.asgi:application`, ya
+que runserver sirve WSGI y no monta estas rutas.
+"""
+
+import asyncio
+import json
+import secrets
+from collections import Counter
+from types import SimpleNamespace
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from core.throttling import PublicoIPRafagaThrottle, PublicoIPThrottle
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.http import QueryDict
+from empresas.tenancy import perfil_resolver, tenant_registry
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .eventos import canal_empresa, canal_guia, obtener_broker
+from .rastreo import obtener_snapshot
+
+PREFIJO = "/api/eventos/"
+
+CLAVE_TICKET = "eventos:ticket:{ticket}"
+
+# Streams abiertos en este proceso por IP del cliente. Solo se modifica
+# desde el event loop, así que no necesita lock.
+_conexiones = Counter()
+
+
+def _cabeceras_cors(cabeceras):
+    origen = cabeceras.get("origin")
+    if not origen:
+        return []
+    permitido = getattr(settings, "CORS_ALLOW_ALL_ORIGINS", False) or (
+        origen in getattr(settings, "CORS_ALLOWED_ORIGINS", [])
+    )
+    if not permitido:
+        return []
+    return [
+        (b"access-control-allow-origin", origen.encode("latin-1")),
+        (b"access-control-allow-credentials", b"true"),
+        (b"vary", b"Origin"),
+    ]
+
+
+async def _responder_json(send, status, datos, cabeceras=()):
+    cuerpo = json.dumps(datos).encode("utf-8")
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(cuerpo)).encode()),
+                *cabeceras,
+            ],
+        }
+    )
+    await send({"type": "http.response.body", "body": cuerpo})
+
+
+def _peticion(scope, cabeceras):
+    """
+    Lo que core.throttling lee de una petición de DRF (META y
+    query_params), para aplicar los mismos límites públicos.
+    """
+    meta = {"REMOTE_ADDR": (scope.get("client") or ("",))[0]}
+    if "x-forwarded-for" in cabeceras:
+        meta["HTTP_X_FORWARDED_FOR"] = cabeceras["x-forwarded-for"]
+    return SimpleNamespace(META=meta, query_params=QueryDict())
+
+
+def _espera_throttle(peticion):
+    """
+    Aplica los límites públicos por IP. Devuelve los segundos de espera si
+    se superan, o None.
+    """
+    esperas = []
+    for clase in (PublicoIPRafagaThrottle, PublicoIPThrottle):
+        throttle = clase()
+        if not throttle.allow_request(peticion, None):
+            esperas.append(throttle.wait())
+    return max(esperas) if esperas else None
+
+
+def _guia_existe(numero_guia):
+    return obtener_snapshot(numero_guia) is not None
+
+
+def crear_ticket(usuario, empresa):
+    """
+    Ticket de un solo uso para abrir el stream de eventos de `empresa`.
+    """
+    ticket = secrets.token_urlsafe(32)
+    cache.set(
+        CLAVE_TICKET.format(ticket=ticket),
+        {"usuario": usuario.pk, "empresa": empresa.slug},
+        getattr(settings, "EVENTOS_TICKET_SEGUNDOS", 30),
+    )
+    return ticket
+
+
+def _canjear_ticket(ticket):
+    # delete() dice si la clave existía: solo una conexión puede usarlo
+    clave = CLAVE_TICKET.format(ticket=ticket[:64])
+    datos = cache.get(clave)
+    if datos is None or not cache.delete(clave):
+        return None
+    return datos
+
+
+def _resolver_canal_empresa(ticket, token, slug, host):
+    """
+    Valida el ticket (o el JWT de la cabecera) y el perfil del usuario en
+    la empresa. Devuelve (canal, None) o (None, (status, error)).
+    """
+    if ticket:
+        datos = _canjear_ticket(ticket)
+        if datos is None:
+            return None, (401, "Ticket inválido o expirado")
+        usuario_id, slug = datos["usuario"], datos["empresa"]
+    elif token:
+        try:
+            usuario_id = AccessToken(token)[jwt_settings.USER_ID_CLAIM]
+        except (TokenError, KeyError):
+            return None, (401, "Token inválido o expirado")
+    else:
+        return None, (401, "Se requiere autenticación")
+    try:
+        usuario = get_user_model().objects.get(pk=usuario_id, is_active=True)
+    except get_user_model().DoesNotExist:
+        return None, (401, "Token inválido o expirado")
+
+    empresa = tenant_registry.get_by_slug(slug) if slug else None
+    if empresa is None and host:
+        empresa = tenant_registry.get_by_host(host)
+
+    perfil = perfil_resolver.resolver(usuario, empresa)
+    if perfil is None or not perfil.puede_gestionar_envios:
+        return None, (403, "No tiene permisos para los eventos de la empresa")
+
+    # Como en el middleware, el tenant efectivo es el del perfil resuelto
+    return canal_empresa(perfil.empresa_id), None
+
+
+async def aplicacion_sse(scope, receive, send):
+    cabeceras = {
+        clave.decode("latin-1").lower(): valor.decode("latin-1")
+        for clave, valor in scope.get("headers", [])
+    }
+    parametros = {
+        clave: valores[-1]
+        for clave, valores in parse_qs(
+            scope.get("query_string", b"").decode("latin-1")
+        ).items()
+    }
+    cors = _cabeceras_cors(cabeceras)
+
+    if scope["method"] != "GET":
+        await _responder_json(
+            send, 405, {"error": "Método no permitido"}, cors
+        )
+        return
+
+    peticion = _peticion(scope, cabeceras)
+    ip = PublicoIPThrottle().get_ident(peticion)
+    if sum(_conexiones.values()) >= getattr(
+        settings, "EVENTOS_MAX_CONEXIONES", 1000
+    ):
+        await _responder_json(
+            send, 503, {"error": "Demasiadas conexiones abiertas"}, cors
+        )
+        return
+    if _conexiones[ip] >= getattr(settings, "EVENTOS_MAX_CONEXIONES_IP", 10):
+        await _responder_json(
+            send, 429, {"error": "Demasiadas conexiones desde esta IP"}, cors
+        )
+        return
+
+    ruta = scope["path"][len(PREFIJO) :].strip("/").split("/")
+    if len(ruta) == 2 and ruta[0] == "guia" and ruta[1]:
+        numero_guia = ruta[1][:50]
+        espera = await sync_to_async(_espera_throttle)(peticion)
+        if espera is not None:
+            await _responder_json(
+                send,
+                429,
+                {"error": "Demasiadas peticiones"},
+                [(b"retry-after", str(int(espera) + 1).encode()), *cors],
+            )
+            return
+        if not await sync_to_async(_guia_existe)(numero_guia):
+            await _responder_json(
+                send, 404, {"error": "Envío no encontrado"}, cors
+            )
+            return
+        canal = canal_guia(numero_guia)
+    elif ruta == ["empresa"]:
+        token = None
+        autorizacion = cabeceras.get("authorization", "")
+        if autorizacion.startswith("Bearer "):
+            token = autorizacion[len("Bearer ") :]
+        canal, error = await sync_to_async(_resolver_canal_empresa)(
+            parametros.get("ticket"),
+            token,
+            parametros.get("empresa") or cabeceras.get("x-tenant-slug"),
+            cabeceras.get("host"),
+        )
+        if error:
+            await _responder_json(send, error[0], {"error": error[1]}, cors)
+            return
+    else:
+        await _responder_json(
+            send, 404, {"error": "Canal no encontrado"}, cors
+        )
+        return
+
+    ultimo_id = cabeceras.get("last-event-id") or parametros.get("ultimo_id")
+    _conexiones[ip] += 1
+    try:
+        await _enviar_stream(receive, send, canal, ultimo_id, cors)
+    finally:
+        _conexiones[ip] -= 1
+        if not _conexiones[ip]:
+            del _conexiones[ip]
+
+
+async def _enviar_stream(receive, send, canal, ultimo_id, cors):
+    eventos = obtener_broker().suscribir(
+        canal,
+        ultimo_id=ultimo_id,
+        espera=getattr(settings, "EVENTOS_KEEPALIVE_SEGUNDOS", 15),
+    )
+
+    await send(
+        {
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [
+                (b"content-type", b"text/event-stream"),
+                (b"cache-control", b"no-cache"),
+                # Desactivar el buffering de nginx para este stream
+                (b"x-accel-buffering", b"no"),
+                *cors,
+            ],
+        }
+    )
+
+    async def transmitir():
+        await send(
+            {
+                "type": "http.response.body",
+                "body": b"retry: 5000\n\n",
+                "more_body": True,
+            }
+        )
+        async for evento in eventos:
+            if evento is None:
+                mensaje = ": ping\n\n"
+            else:
+                mensaje = (
+                    f"id: {evento['id']}\n"
+                    f"event: {evento['tipo']}\n"
+                    f"data: {evento['datos']}\n\n"
+                )
+            await send(
+                {
+                    "type": "http.response.body",
+                    "body": mensaje.encode("utf-8"),
+                    "more_body": True,
+                }
+            )
+
+    async def esperar_desconexion():
+        while True:
+            mensaje = await receive()
+            if mensaje["type"] == "http.disconnect":
+                return
+
+    tareas = [
+        asyncio.ensure_future(transmitir()),
+        asyncio.ensure_future(esperar_desconexion()),
+    ]
+    try:
+        terminadas, _ = await asyncio.wait(
+            tareas, return_when=asyncio.FIRST_COMPLETED
+        )
+    finally:
+        for tarea in tareas:
+            tarea.cancel()
+        await asyncio.gather(*tareas, return_exceptions=True)
+        await eventos.aclose()
+
+    for tarea in terminadas:
+        if not tarea.cancelled() and tarea.exception() is not None:
+            raise tarea.exception()
@@ -0,0 +1,195 @@
+"""
+Motor de tarifas de envío.
+
+Cada empresa define su tarifa en Empresa.configuracion["tarifas"]; las
+claves ausentes toman el valor de TARIFA_DEFAULT (la tabla que antes
+calculaba el frontend):
+
+    {
+        "moneda": "USD",
+        "tramos": [{"hasta": 1, "precio": "8.50"}, ...],
+        "precio_kg_adicional": "4.50",
+        "divisor_volumetrico": 5000,
+        "manejo_porcentaje": "15",
+        "seguro_porcentaje": "5",
+        "tasas_cambio": {"CUP": "320"}
+    }
+
+El precio base es el del primer tramo cuyo límite ('hasta', kg) cubre el
+peso facturable (el mayor entre el real y el volumétrico, largo × ancho ×
+alto en cm / divisor); por encima del último tramo se suma
+precio_kg_adicional por kg. Manejo y seguro son porcentajes del precio
+base. tasas_cambio indica cuántas unidades de cada moneda equivalen a una
+de la moneda de la tarifa.
+
+La tarifa se compila una vez (importes en Decimal y límites ordenados para
+búsqueda binaria) y se guarda por empresa en memoria hasta que la empresa
+cambia.
+"""
+
+import threading
+from bisect import bisect_left
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+
+from django.core.exceptions import ImproperlyConfigured
+
+TARIFA_DEFAULT = {
+    "moneda": "USD",
+    "tramos": [
+        {"hasta": 1, "precio": "8.50"},
+        {"hasta": 2, "precio": "15.00"},
+        {"hasta": 5, "precio": "28.00"},
+        {"hasta": 10, "precio": "45.00"},
+        {"hasta": 20, "precio": "85.00"},
+    ],
+    "precio_kg_adicional": "4.50",
+    "divisor_volumetrico": 5000,
+    "manejo_porcentaje": "15",
+    "seguro_porcentaje": "5",
+    "tasas_cambio": {"CUP": "320.00", "EUR": "0.91", "CAD": "1.33"},
+}
+
+CENTAVOS = Decimal("0.01")
+
+
+def _redondear(valor):
+    return valor.quantize(CENTAVOS, rounding=ROUND_HALF_UP)
+
+
+def _decimal(valor, nombre):
+    try:
+        resultado = Decimal(str(valor))
+    except (InvalidOperation, ValueError):
+        resultado = None
+    if resultado is None or not resultado.is_finite() or resultado < 0:
+        raise ImproperlyConfigured(f"Tarifa inválida: '{nombre}' = {valor!r}")
+    return resultado
+
+
+class Tarifa:
+    """
+    Tarifa compilada de una empresa.
+    """
+
+    def __init__(self, configuracion=None):
+        datos = {**TARIFA_DEFAULT, **(configuracion or {})}
+
+        try:
+            tramos = sorted(
+                (
+                    _decimal(tramo["hasta"], "tramos.hasta"),
+                    _decimal(tramo["precio"], "tramos.precio"),
+                )
+                for tramo in datos["tramos"]
+            )
+        except (KeyError, TypeError):
+            raise ImproperlyConfigured(
+                "Tarifa inválida: cada tramo requiere 'hasta' y 'precio'"
+            )
+        if not tramos:
+            raise ImproperlyConfigured("Tarifa inválida: sin tramos de peso")
+
+        self.moneda = datos["moneda"]
+        self.limites = [hasta for hasta, _ in tramos]
+        self.precios = [precio for _, precio in tramos]
+        self.precio_kg_adicional = _decimal(
+            datos["precio_kg_adicional"], "precio_kg_adicional"
+        )
+        self.divisor_volumetrico = _decimal(
+            datos["divisor_volumetrico"], "divisor_volumetrico"
+        )
+        if not self.divisor_volumetrico:
+            raise ImproperlyConfigured(
+                "Tarifa inválida: 'divisor_volumetrico' = 0"
+            )
+        self.manejo = (
+            _decimal(datos["manejo_porcentaje"], "manejo_porcentaje") / 100
+        )
+        self.seguro = (
+            _decimal(datos["seguro_porcentaje"], "seguro_porcentaje") / 100
+        )
+        self.tasas_cambio = {
+            moneda: _decimal(tasa, f"tasas_cambio.{moneda}")
+            for moneda, tasa in datos["tasas_cambio"].items()
+        }
+        self.tasas_cambio[self.moneda] = Decimal("1")
+
+    def precio_base(self, peso):
+        """
+        Precio del tramo que cubre `peso` (kg, Decimal).
+        """
+        indice = bisect_left(self.limites, peso)
+        if indice < len(self.limites):
+            return self.precios[indice]
+        exceso = peso - self.limites[-1]
+        return self.precios[-1] + exceso * self.precio_kg_adicional
+
+    def cotizar(
+        self,
+        peso,
+        largo=None,
+        ancho=None,
+        alto=None,
+        seguro=False,
+        moneda=None,
+    ):
+        """
+        Cotiza un paquete. Peso en kg y dimensiones en cm (Decimal).
+
+        Returns:
+            dict: Peso facturable, desglose y total en la moneda pedida
+            (por defecto la de la tarifa)
+        """
+        moneda = moneda or self.moneda
+        if moneda not in self.tasas_cambio:
+            raise ValueError(f"Moneda no soportada: {moneda}")
+
+        peso_facturable = peso
+        if largo and ancho and alto:
+            volumetrico = largo * ancho * alto / self.divisor_volumetrico
+            peso_facturable = max(peso, volumetrico)
+
+        base = self.precio_base(peso_facturable)
+        manejo = base * self.manejo
+        seguro = base * self.seguro if seguro else Decimal("0")
+
+        tasa = self.tasas_cambio[moneda]
+        desglose = {
+            "base": _redondear(base * tasa),
+            "manejo": _redondear(manejo * tasa),
+            "seguro": _redondear(seguro * tasa),
+        }
+        return {
+            "peso_facturable": _redondear(peso_facturable),
+            "moneda": moneda,
+            "tasa_cambio": tasa,
+            **desglose,
+            "total": sum(desglose.values()),
+        }
+
+
+_compiladas = {}
+_lock = threading.Lock()
+
+
+def obtener_tarifa(empresa):
+    """
+    Tarifa compilada de la empresa. Se recompila cuando cambia
+    ultima_actualizacion (cualquier guardado de la empresa).
+    """
+    version = empresa.ultima_actualizacion
+    cacheada = _compiladas.get(empresa.id)
+    if cacheada is not None and cacheada[0] == version:
+        return cacheada[1]
+
+    tarifa = Tarifa((empresa.configuracion or {}).get("tarifas"))
+    with _lock:
+        _compiladas[empresa.id] = (version, tarifa)
+    return tarifa
+
+
+def precio_envio(empresa, peso):
+    """
+    Precio de un envío de `peso` kg en la moneda de la tarifa.
+    """
+    return obtener_tarifa(empresa).cotizar(Decimal(str(peso)))["total"]
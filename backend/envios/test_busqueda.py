@@ -0,0 +1,103 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from empresas.models import Empresa, PerfilUsuario
+from envios.busqueda import buscar_envios, tokens_busqueda
+from envios.models import Envio
+from envios.test_importacion import fila_envio
+
+Usuario = get_user_model()
+
+
+class BusquedaEnviosTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.empresa = Empresa.objects.create(
+            nombre="Empresa Búsqueda", slug="busqueda"
+        )
+        self.usuario = Usuario.objects.create_user(
+            email="dueno@example.com", password="password123"
+        )
+        PerfilUsuario.objects.create(
+            usuario=self.usuario,
+            empresa=self.empresa,
+            rol=PerfilUsuario.RolChoices.DUENO,
+        )
+        self.maria = Envio.objects.create(
+            empresa=self.empresa,
+            **fila_envio(
+                peso=1,
+                remitente_nombre="María González",
+                destinatario_nombre="Pedro Castillo",
+                descripcion="Medicinas",
+            ),
+        )
+        self.pedro = Envio.objects.create(
+            empresa=self.empresa,
+            **fila_envio(
+                peso=1,
+                remitente_nombre="Pedro Castillo",
+                destinatario_nombre="Ana López",
+                destinatario_telefono="+5355999888",
+                descripcion="Ropa y zapatos",
+            ),
+        )
+
+    def test_tokens_busqueda(self):
+        """Probar que los tokens no contienen operadores de tsquery"""
+        self.assertEqual(
+            tokens_busqueda("María & (Pérez) | !+53:*"),
+            ["maría", "pérez", "53"],
+        )
+        self.assertEqual(tokens_busqueda("  "), [])
+
+    def test_todos_los_tokens_deben_coincidir(self):
+        """Probar que cada token debe aparecer en algún campo"""
+        envios = Envio.objects.filter(empresa=self.empresa)
+
+        self.assertEqual(
+            set(buscar_envios(envios, "pedro")), {self.maria, self.pedro}
+        )
+        self.assertEqual(
+            list(buscar_envios(envios, "pedro ropa")), [self.pedro]
+        )
+        self.assertEqual(list(buscar_envios(envios, "5355999")), [self.pedro])
+        self.assertEqual(list(buscar_envios(envios, "&|")), [])
+
+    def test_busqueda_por_peso(self):
+        """Probar que los pesos restringen la búsqueda al remitente"""
+        envios = Envio.objects.filter(empresa=self.empresa)
+        self.assertEqual(
+            list(buscar_envios(envios, "pedro", pesos="B")), [self.pedro]
+        )
+
+    def test_search_filter_api(self):
+        """Probar el parámetro ?search= del listado de envíos"""
+        client = APIClient()
+        client.force_authenticate(self.usuario)
+
+        response = client.get(
+            "/api/envios/",
+            {"search": self.maria.numero_guia},
+            HTTP_X_TENANT_SLUG="busqueda",
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [envio["id"] for envio in response.json()["results"]],
+            [self.maria.id],
+        )
+
+    def test_buscar_por_remitente_publico(self):
+        """Probar que la búsqueda pública solo mira al remitente"""
+        response = APIClient().get(
+            "/api/envios/buscar_por_remitente/", {"nombre": "Pedro"}
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [envio["numero_guia"] for envio in response.json()["results"]],
+            [self.pedro.numero_guia],
+        )
@@ -0,0 +1,143 @@
+import gzip
+
+import brotli
+import msgpack
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from empresas.models import Empresa, PerfilUsuario
+from envios.importacion import importar_envios
+from envios.models import Envio
+from envios.test_importacion import fila_envio
+
+Usuario = get_user_model()
+
+
+@override_settings(NOTIFICACIONES_DESPACHO_EN_COMMIT=False)
+class CamposDinamicosTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.empresa = Empresa.objects.create(
+            nombre="Empresa Campos", slug="campos"
+        )
+        self.usuario = Usuario.objects.create_user(
+            email="dueno@example.com", password="password123"
+        )
+        PerfilUsuario.objects.create(
+            usuario=self.usuario,
+            empresa=self.empresa,
+            rol=PerfilUsuario.RolChoices.DUENO,
+        )
+        importar_envios(
+            [fila_envio() for _ in range(5)],
+            self.empresa,
+            self.usuario,
+            notificar=False,
+        )
+        self.envio = Envio.objects.order_by("id").first()
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+        # Calentar las cachés de tenant y perfil
+        self.get("/api/envios/")
+
+    def get(self, url, **extra):
+        return self.client.get(url, HTTP_X_TENANT_SLUG="campos", **extra)
+
+    def test_fields_y_omit(self):
+        """Probar que ?fields= y ?omit= recortan la representación"""
+        response = self.get(
+            "/api/envios/?fields=numero_guia,estado_actual,destinatario_nombre"
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            set(response.data["results"][0]),
+            {"numero_guia", "estado_actual", "destinatario_nombre"},
+        )
+
+        response = self.get(f"/api/envios/{self.envio.id}/?omit=historial")
+        self.assertNotIn("historial", response.data)
+        self.assertIn("creado_por", response.data)
+
+    def test_expand_historial_en_listado(self):
+        """Probar que el listado solo incluye el historial si se expande"""
+        response = self.get("/api/envios/")
+        self.assertNotIn("historial", response.data["results"][0])
+
+        response = self.get("/api/envios/?expand=historial")
+        self.assertEqual(len(response.data["results"][0]["historial"]), 1)
+
+    def test_campos_no_pedidos_no_se_consultan(self):
+        """Probar que las relaciones que no se piden no se precargan"""
+        with CaptureQueriesContext(connection) as completo:
+            self.get(f"/api/envios/{self.envio.id}/")
+        with CaptureQueriesContext(connection) as recortado:
+            self.get(f"/api/envios/{self.envio.id}/?fields=id,numero_guia")
+        self.assertLess(
+            len(recortado.captured_queries), len(completo.captured_queries)
+        )
+        self.assertFalse(
+            any(
+                "envios_historialestado" in consulta["sql"]
+                for consulta in recortado.captured_queries
+            )
+        )
+
+    def test_escrituras_no_se_ven_afectadas(self):
+        """Probar que ?fields= no cambia la validación de las escrituras"""
+        response = self.client.patch(
+            f"/api/envios/{self.envio.id}/?fields=id",
+            {"peso": "0"},
+            format="json",
+            HTTP_X_TENANT_SLUG="campos",
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.patch(
+            f"/api/envios/{self.envio.id}/?fields=id,peso",
+            {"peso": "2.00", "notas": "Frágil"},
+            format="json",
+            HTTP_X_TENANT_SLUG="campos",
+        )
+        self.assertEqual(response.data, {"id": self.envio.id, "peso": "2.00"})
+        self.envio.refresh_from_db()
+        self.assertEqual(self.envio.notas, "Frágil")
+
+    def test_otros_viewsets(self):
+        """Probar los parámetros en historial, usuarios y empresas"""
+        response = self.get("/api/historial-estados/?fields=id,estado")
+        self.assertEqual(set(response.data["results"][0]), {"id", "estado"})
+
+        response = self.get("/api/usuarios/?omit=empresas")
+        self.assertNotIn("empresas", response.data["results"][0])
+
+        response = self.get(f"/api/empresas/{self.empresa.id}/?fields=slug")
+        self.assertEqual(response.data, {"slug": "campos"})
+
+    def test_messagepack(self):
+        """Probar la respuesta en MessagePack"""
+        response = self.get(
+            "/api/envios/?fields=numero_guia,peso",
+            HTTP_ACCEPT="application/msgpack",
+        )
+        self.assertEqual(response["Content-Type"], "application/msgpack")
+        datos = msgpack.unpackb(response.content)
+        self.assertEqual(datos["results"][0]["peso"], "3.50")
+
+    def test_compresion_negociada(self):
+        """Probar brotli si el cliente lo acepta y gzip en otro caso"""
+        response = self.get("/api/envios/", HTTP_ACCEPT_ENCODING="gzip, br")
+        self.assertEqual(response["Content-Encoding"], "br")
+        self.assertIn("Accept-Encoding", response["Vary"])
+        self.assertEqual(brotli.decompress(response.content)[:1], b"{")
+
+        response = self.get("/api/envios/", HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(response.content)[:1], b"{")
+
+        response = self.get("/api/envios/")
+        self.assertFalse(response.has_header("Content-Encoding"))
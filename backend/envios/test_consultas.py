@@ -0,0 +1,238 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from empresas.models import Empresa, PerfilUsuario
+from envios.models import Envio, HistorialEstado
+
+Usuario = get_user_model()
+
+
+class ConsultasEnviosTest(TestCase):
+    """
+    Regresión de número de consultas: listado y detalle de envíos deben
+    ejecutar un número constante de consultas sin importar el volumen.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.empresa = Empresa.objects.create(
+            nombre="Empresa Consultas", slug="consultas"
+        )
+        self.usuario = Usuario.objects.create_user(
+            email="operador@example.com", password="password123"
+        )
+        PerfilUsuario.objects.create(
+            usuario=self.usuario,
+            empresa=self.empresa,
+            rol=PerfilUsuario.RolChoices.OPERADOR_MIAMI,
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+
+        # Calentar las cachés de tenant y perfil
+        self.client.get("/api/envios/", HTTP_X_TENANT_SLUG="consultas")
+
+    def crear_envio(self, registros_historial=1):
+        envio = Envio.objects.create(
+            empresa=self.empresa,
+            descripcion="Envío de prueba",
+            peso=2.5,
+            remitente_nombre="Remitente Prueba",
+            remitente_direccion="Miami",
+            remitente_telefono="+13055551234",
+            destinatario_nombre="Destinatario Prueba",
+            destinatario_direccion="La Habana",
+            destinatario_telefono="+5355123456",
+            creado_por=self.usuario,
+            actualizado_por=self.usuario,
+        )
+        for _ in range(registros_historial):
+            HistorialEstado.objects.create(
+                envio=envio,
+                estado=envio.estado_actual,
+                registrado_por=self.usuario,
+            )
+        return envio
+
+    def contar_consultas(self, url):
+        with CaptureQueriesContext(connection) as contexto:
+            response = self.client.get(url, HTTP_X_TENANT_SLUG="consultas")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(contexto.captured_queries), response.json()
+
+    def test_listado_consultas_constantes(self):
+        """Probar que el listado no crece en consultas con el tamaño de página"""
+        for _ in range(2):
+            self.crear_envio()
+        consultas_pocos, data = self.contar_consultas("/api/envios/")
+        self.assertEqual(len(data["results"]), 2)
+        self.assertNotIn("historial", data["results"][0])
+
+        for _ in range(8):
+            self.crear_envio()
+        consultas_muchos, data = self.contar_consultas("/api/envios/")
+        self.assertEqual(len(data["results"]), 10)
+
+        self.assertEqual(consultas_pocos, consultas_muchos)
+
+    def test_detalle_consultas_constantes(self):
+        """Probar que el detalle no crece en consultas con el historial"""
+        envio_corto = self.crear_envio(registros_historial=1)
+        envio_largo = self.crear_envio(registros_historial=6)
+
+        consultas_corto, _ = self.contar_consultas(
+            f"/api/envios/{envio_corto.id}/"
+        )
+        consultas_largo, data = self.contar_consultas(
+            f"/api/envios/{envio_largo.id}/"
+        )
+
+        self.assertEqual(len(data["historial"]), 6)
+        self.assertEqual(
+            data["historial"][0]["registrado_por"]["empresas"][0]["slug"],
+            "consultas",
+        )
+        self.assertEqual(consultas_corto, consultas_largo)
+
+
+class AlcancePerfilTest(TestCase):
+    """
+    Restricción por empresa y rol de EnvioQuerySet (envíos e historial).
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.empresa = Empresa.objects.create(
+            nombre="Empresa Alcance", slug="alcance"
+        )
+        self.otra = Empresa.objects.create(nombre="Otra Empresa", slug="otra")
+        self.perfiles = {}
+        for rol, telefono in (
+            (PerfilUsuario.RolChoices.OPERADOR_CUBA, ""),
+            (PerfilUsuario.RolChoices.REMITENTE, "+13055551234"),
+            (PerfilUsuario.RolChoices.DESTINATARIO, "+5355000000"),
+        ):
+            usuario = Usuario.objects.create_user(
+                email=f"{rol}@example.com", password="password123"
+            )
+            self.perfiles[rol] = PerfilUsuario.objects.create(
+                usuario=usuario,
+                empresa=self.empresa,
+                rol=rol,
+                telefono=telefono,
+            )
+
+        self.envios = [
+            self.crear_envio(self.empresa, "+13055551234", "+5355123456"),
+            self.crear_envio(self.empresa, "+13055559999", "+5355000000"),
+            self.crear_envio(self.otra, "+13055551234", "+5355000000"),
+        ]
+
+    def crear_envio(self, empresa, remitente, destinatario):
+        envio = Envio.objects.create(
+            empresa=empresa,
+            descripcion="Envío de prueba",
+            peso=1,
+            remitente_nombre="Remitente",
+            remitente_direccion="Miami",
+            remitente_telefono=remitente,
+            destinatario_nombre="Destinatario",
+            destinatario_direccion="La Habana",
+            destinatario_telefono=destinatario,
+        )
+        HistorialEstado.objects.create(envio=envio, estado=envio.estado_actual)
+        return envio
+
+    def test_envios_para_perfil(self):
+        """Probar que cada rol ve solo los envíos de su empresa y rol"""
+        esperados = {
+            PerfilUsuario.RolChoices.OPERADOR_CUBA: self.envios[:2],
+            PerfilUsuario.RolChoices.REMITENTE: self.envios[:1],
+            PerfilUsuario.RolChoices.DESTINATARIO: self.envios[1:2],
+        }
+        for rol, envios in esperados.items():
+            self.assertCountEqual(
+                Envio.objects.para_perfil(self.perfiles[rol]), envios
+            )
+        # Sin perfil no se ve nada de la empresa
+        self.assertFalse(Envio.objects.para_perfil(None, empresa=self.otra))
+        self.assertFalse(
+            Envio.objects.historial_para_perfil(None, empresa=self.otra)
+        )
+
+    def test_historial_para_perfil(self):
+        """Probar que el historial se restringe igual que los envíos y que
+        los operadores lo filtran sin join con la tabla de envíos"""
+        self.assertEqual(
+            HistorialEstado.objects.get(envio=self.envios[2]).empresa,
+            self.otra,
+        )
+
+        operador = self.perfiles[PerfilUsuario.RolChoices.OPERADOR_CUBA]
+        historial = Envio.objects.historial_para_perfil(operador)
+        self.assertNotIn("JOIN", str(historial.query))
+        self.assertCountEqual(
+            historial.values_list("envio_id", flat=True),
+            [self.envios[0].id, self.envios[1].id],
+        )
+
+        remitente = self.perfiles[PerfilUsuario.RolChoices.REMITENTE]
+        self.assertCountEqual(
+            Envio.objects.historial_para_perfil(remitente).values_list(
+                "envio_id", flat=True
+            ),
+            [self.envios[0].id],
+        )
+
+    def test_api_historial_por_rol(self):
+        """Probar el endpoint de historial con un destinatario"""
+        destinatario = self.perfiles[PerfilUsuario.RolChoices.DESTINATARIO]
+        client = APIClient()
+        client.force_authenticate(destinatario.usuario)
+
+        response = client.get(
+            "/api/historial-estados/", HTTP_X_TENANT_SLUG="alcance"
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [fila["envio"] for fila in response.json()["results"]],
+            [self.envios[1].id],
+        )
+
+    def test_api_usuario_sin_perfil(self):
+        """Probar que un usuario sin perfil activo en la empresa no ve
+        ningún envío (antes: error 500 con el perfil perezoso vacío)"""
+        usuario = Usuario.objects.create_user(
+            email="sinperfil@example.com", password="password123"
+        )
+        PerfilUsuario.objects.create(
+            usuario=usuario,
+            empresa=self.empresa,
+            rol=PerfilUsuario.RolChoices.REMITENTE,
+            activo=False,
+        )
+        client = APIClient()
+        client.force_authenticate(usuario)
+
+        for url in (
+            "/api/envios/",
+            "/api/envios/sync/",
+            "/api/envios/exportar/",
+            "/api/historial-estados/",
+        ):
+            response = client.get(url, HTTP_X_TENANT_SLUG="alcance")
+            self.assertLess(response.status_code, 500, url)
+            if response.status_code == status.HTTP_200_OK:
+                contenido = (
+                    b"".join(response.streaming_content)
+                    if response.streaming
+                    else response.content
+                )
+                self.assertNotIn(
+                    self.envios[0].numero_guia.encode(), contenido, url
+                )
@@ -0,0 +1,191 @@
+from decimal import Decimal
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from empresas.models import Empresa, PerfilUsuario
+from empresas.utils import TenantUtils
+from envios.estados import cambiar_estado_lote
+from envios.estadisticas import estadisticas_envios, reconciliar_contadores
+from envios.importacion import importar_envios
+from envios.models import ContadorEnvios, Envio
+from envios.test_importacion import fila_envio
+
+Usuario = get_user_model()
+
+RECIBIDO = Envio.EstadoChoices.RECIBIDO
+EN_TRANSITO = Envio.EstadoChoices.EN_TRANSITO
+
+
+@override_settings(NOTIFICACIONES_DESPACHO_EN_COMMIT=False)
+class ContadoresEnviosTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.empresa = Empresa.objects.create(
+            nombre="Empresa Estadísticas", slug="estadisticas"
+        )
+        self.usuario = Usuario.objects.create_user(
+            email="dueno@example.com", password="password123"
+        )
+        PerfilUsuario.objects.create(
+            usuario=self.usuario,
+            empresa=self.empresa,
+            rol=PerfilUsuario.RolChoices.DUENO,
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+
+    def crear_envio(self, **extra):
+        return Envio.objects.create(
+            empresa=self.empresa,
+            numero_guia=f"EST{Envio.objects.count():05d}",
+            **fila_envio(**extra),
+        )
+
+    def contador(self, estado):
+        return estadisticas_envios(self.empresa)["por_estado"][estado]
+
+    def test_contadores_incrementales(self):
+        """Probar que alta, edición, cambio de estado y baja ajustan los
+        contadores"""
+        envio = self.crear_envio(peso="2.00", valor_declarado="10.00")
+        self.crear_envio(peso="3.00")
+        self.assertEqual(
+            self.contador(RECIBIDO),
+            {
+                "total": 2,
+                "peso_total": Decimal("5.00"),
+                "valor_declarado_total": Decimal("10.00"),
+            },
+        )
+
+        envio = Envio.objects.get(pk=envio.pk)
+        envio.peso = Decimal("4.00")
+        envio.save()
+        self.assertEqual(self.contador(RECIBIDO)["peso_total"], Decimal("7"))
+
+        envio.estado_actual = EN_TRANSITO
+        envio.save()
+        self.assertEqual(self.contador(RECIBIDO)["total"], 1)
+        self.assertEqual(self.contador(EN_TRANSITO)["total"], 1)
+        self.assertEqual(
+            self.contador(EN_TRANSITO)["peso_total"], Decimal("4")
+        )
+
+        envio.delete()
+        estadisticas = estadisticas_envios(self.empresa)
+        self.assertEqual(estadisticas["total"], 1)
+        self.assertEqual(estadisticas["peso_total"], Decimal("3"))
+        self.assertEqual(estadisticas["por_estado"][EN_TRANSITO]["total"], 0)
+
+    def test_contadores_con_campos_diferidos(self):
+        """Probar que guardar un envío cargado con only() no pierde el delta"""
+        envio = self.crear_envio()
+        envio = Envio.objects.only("id", "estado_actual").get(pk=envio.pk)
+        envio.estado_actual = EN_TRANSITO
+        envio.save()
+
+        self.assertEqual(self.contador(RECIBIDO)["total"], 0)
+        self.assertEqual(self.contador(EN_TRANSITO)["total"], 1)
+
+    def test_importacion_y_cambio_en_lote(self):
+        """Probar que las escrituras en bloque actualizan los contadores"""
+        importar_envios(
+            [fila_envio() for _ in range(3)],
+            self.empresa,
+            self.usuario,
+            notificar=False,
+        )
+        self.assertEqual(self.contador(RECIBIDO)["total"], 3)
+
+        ids = list(Envio.objects.values_list("id", flat=True)[:2])
+        cambiar_estado_lote(Envio.objects.all(), EN_TRANSITO, ids=ids)
+
+        self.assertEqual(self.contador(RECIBIDO)["total"], 1)
+        self.assertEqual(
+            self.contador(EN_TRANSITO),
+            {
+                "total": 2,
+                "peso_total": Decimal("7.00"),
+                "valor_declarado_total": Decimal("0"),
+            },
+        )
+
+    def test_reconciliar(self):
+        """Probar que la reconciliación corrige contadores desviados"""
+        self.crear_envio()
+        self.crear_envio()
+        Envio.objects.filter(empresa=self.empresa).update(
+            estado_actual=EN_TRANSITO
+        )
+        ContadorEnvios.objects.create(
+            empresa=self.empresa, estado=Envio.EstadoChoices.DEVUELTO, total=5
+        )
+
+        call_command("reconciliar_estadisticas", stdout=StringIO())
+
+        estadisticas = estadisticas_envios(self.empresa)
+        self.assertEqual(estadisticas["total"], 2)
+        self.assertEqual(estadisticas["por_estado"][EN_TRANSITO]["total"], 2)
+        self.assertEqual(estadisticas["por_estado"][RECIBIDO]["total"], 0)
+        self.assertEqual(reconciliar_contadores([self.empresa.id]), 0)
+
+    def test_endpoint_estadisticas(self):
+        """Probar el endpoint de estadísticas de la empresa"""
+        self.crear_envio(peso="1.50")
+        self.crear_envio(peso="2.50")
+
+        # Primera llamada para calentar las cachés del tenant
+        self.client.get(
+            "/api/empresas/estadisticas/", HTTP_X_TENANT_SLUG="estadisticas"
+        )
+        with CaptureQueriesContext(connection) as consultas:
+            response = self.client.get(
+                "/api/empresas/estadisticas/",
+                HTTP_X_TENANT_SLUG="estadisticas",
+            )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # Contadores de envíos y usuarios por rol: una consulta cada uno
+        self.assertEqual(len(consultas), 2)
+        self.assertEqual(response.data["envios"]["total"], 2)
+        self.assertEqual(response.data["envios"]["activos"], 2)
+        self.assertEqual(response.data["envios"]["peso_total"], Decimal("4"))
+        self.assertEqual(response.data["usuarios"]["total_usuarios"], 1)
+        self.assertEqual(response.data["usuarios"]["duenos"], 1)
+
+    def test_endpoint_estadisticas_requiere_operador(self):
+        """Probar que los remitentes no acceden a las estadísticas"""
+        remitente = Usuario.objects.create_user(
+            email="remitente@example.com", password="password123"
+        )
+        PerfilUsuario.objects.create(
+            usuario=remitente,
+            empresa=self.empresa,
+            rol=PerfilUsuario.RolChoices.REMITENTE,
+        )
+        self.client.force_authenticate(remitente)
+
+        response = self.client.get(
+            "/api/empresas/estadisticas/", HTTP_X_TENANT_SLUG="estadisticas"
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_estadisticas_usuarios_una_consulta(self):
+        """Probar que las estadísticas de usuarios usan una sola consulta"""
+        with self.assertNumQueries(1):
+            estadisticas = TenantUtils.obtener_estadisticas_empresa(
+                self.empresa
+            )
+
+        self.assertEqual(estadisticas["total_usuarios"], 1)
+        self.assertEqual(estadisticas["duenos"], 1)
+        self.assertEqual(estadisticas["remitentes"], 0)
@@ -0,0 +1,186 @@
+import io
+import json
+import re
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from PIL import Image
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from empresas.models import Empresa, PerfilUsuario
+from envios import etiquetas
+from envios.importacion import importar_envios
+from envios.models import Envio
+from envios.test_importacion import fila_envio
+
+Usuario = get_user_model()
+
+
+def paginas_pdf(contenido):
+    return len(re.findall(rb"/Type\s*/Page\b", contenido))
+
+
+@override_settings(NOTIFICACIONES_DESPACHO_EN_COMMIT=False)
+class EtiquetasTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.empresa = Empresa.objects.create(
+            nombre="Empresa Etiquetas", slug="etiquetas"
+        )
+        self.operador = Usuario.objects.create_user(
+            email="operador@example.com", password="password123"
+        )
+        PerfilUsuario.objects.create(
+            usuario=self.operador,
+            empresa=self.empresa,
+            rol=PerfilUsuario.RolChoices.OPERADOR_MIAMI,
+        )
+        self.remitente = Usuario.objects.create_user(
+            email="remitente@example.com", password="password123"
+        )
+        PerfilUsuario.objects.create(
+            usuario=self.remitente,
+            empresa=self.empresa,
+            rol=PerfilUsuario.RolChoices.REMITENTE,
+            telefono="+13055550000",
+        )
+        importar_envios(
+            [
+                fila_envio(destinatario_nombre=f"Destinatario {i}")
+                for i in range(5)
+            ],
+            self.empresa,
+            self.operador,
+            notificar=False,
+        )
+        self.envios = list(Envio.objects.order_by("id"))
+        self.client = APIClient()
+        self.client.force_authenticate(self.operador)
+
+    def get(self, url, **params):
+        return self.client.get(url, params, HTTP_X_TENANT_SLUG="etiquetas")
+
+    def imprimir(self, datos):
+        return self.client.post(
+            "/api/envios/etiquetas/",
+            datos,
+            format="json",
+            HTTP_X_TENANT_SLUG="etiquetas",
+        )
+
+    def test_contenido_qr(self):
+        """Probar que el QR lleva el JSON compacto que valida el frontend"""
+        envio = self.envios[0]
+        contenido = etiquetas.contenido_qr(envio)
+
+        # Sin espacios entre claves y valores: el QR cabe en menos módulos
+        self.assertNotIn('": ', contenido)
+        self.assertNotIn(', "', contenido)
+        datos = json.loads(contenido)
+        self.assertEqual(datos["t"], envio.numero_guia)
+        self.assertEqual(datos["r"], "Destinatario 0")
+        self.assertEqual(datos["s"], "Remitente Manifiesto")
+        self.assertEqual(datos["w"], 3.5)
+
+    def test_qr_png(self):
+        """Probar que el endpoint de QR devuelve un PNG del tamaño pedido"""
+        envio = self.envios[0]
+        response = self.get(f"/api/envios/{envio.id}/qr/", tamano=200)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["Content-Type"], "image/png")
+        imagen = Image.open(io.BytesIO(response.content))
+        self.assertEqual(imagen.width, imagen.height)
+        self.assertTrue(150 <= imagen.width <= 200)
+
+        response = self.get(f"/api/envios/{envio.id}/qr/", tamano=5000)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_etiqueta_png_y_pdf(self):
+        """Probar la etiqueta individual en PNG y PDF"""
+        envio = self.envios[0]
+        response = self.get(f"/api/envios/{envio.id}/etiqueta/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        imagen = Image.open(io.BytesIO(response.content))
+        # 100 × 150 mm a 150 ppp
+        self.assertEqual(imagen.size, (591, 886))
+
+        response = self.get(f"/api/envios/{envio.id}/etiqueta/", formato="pdf")
+        self.assertEqual(response["Content-Type"], "application/pdf")
+        self.assertTrue(response.content.startswith(b"%PDF"))
+        self.assertEqual(paginas_pdf(response.content), 1)
+
+        response = self.get(f"/api/envios/{envio.id}/etiqueta/", diseno="x")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_lote_en_un_pdf(self):
+        """Probar que el lote genera un PDF con las páginas del diseño"""
+        guias = [envio.numero_guia for envio in self.envios]
+
+        response = self.imprimir({"numeros_guia": guias})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.content.startswith(b"%PDF"))
+        self.assertEqual(paginas_pdf(response.content), 5)
+
+        # Cuatro etiquetas por página A4
+        response = self.imprimir({"numeros_guia": guias, "diseno": "a4"})
+        self.assertEqual(paginas_pdf(response.content), 2)
+
+    def test_lote_errores(self):
+        """Probar envíos inexistentes, lotes vacíos y exceso de envíos"""
+        response = self.imprimir({"numeros_guia": ["NOEXISTE"], "ids": [0]})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(response.data["no_encontrados"], ["NOEXISTE", 0])
+
+        response = self.imprimir({})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.imprimir({"ids": list(range(501))})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_cache_de_etiquetas(self):
+        """Probar que una etiqueta sin cambios no se vuelve a dibujar"""
+        envio = self.envios[0]
+        url = f"/api/envios/{envio.id}/etiqueta/"
+
+        with mock.patch.object(
+            etiquetas,
+            "dibujar_etiqueta",
+            wraps=etiquetas.dibujar_etiqueta,
+        ) as dibujar:
+            primera = self.get(url).content
+            self.assertEqual(self.get(url).content, primera)
+            self.assertEqual(dibujar.call_count, 1)
+
+            envio.destinatario_nombre = "Otro Destinatario"
+            envio.save()
+            segunda = self.get(url).content
+            self.assertNotEqual(segunda, primera)
+            self.assertEqual(dibujar.call_count, 2)
+
+            # El nombre de la empresa también se imprime en la etiqueta
+            envio.empresa.nombre = "Empresa Renombrada"
+            envio.empresa.save()
+            self.assertNotEqual(self.get(url).content, segunda)
+            self.assertEqual(dibujar.call_count, 3)
+
+    def test_permisos(self):
+        """Probar que el lote es solo para operadores y que cada rol solo
+        ve las etiquetas de sus envíos"""
+        self.client.force_authenticate(self.remitente)
+        envio = self.envios[0]
+
+        response = self.imprimir({"ids": [envio.id]})
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        response = self.get(f"/api/envios/{envio.id}/etiqueta/")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        Envio.objects.filter(id=envio.id).update(
+            remitente_telefono="+13055550000"
+        )
+        response = self.get(f"/api/envios/{envio.id}/qr/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
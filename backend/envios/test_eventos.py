@@ -0,0 +1,251 @@
+import asyncio
+import json
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from empresas.models import Empresa, PerfilUsuario
+from envios import eventos, sse
+from envios.eventos import MemoriaBroker, canal_empresa, canal_guia
+from envios.models import Envio
+from envios.sse import aplicacion_sse
+from envios.test_importacion import fila_envio
+
+Usuario = get_user_model()
+
+
+async def abrir_stream(path, query_string=b"", headers=(), publicar=None):
+    """
+    Ejecuta aplicacion_sse hasta recibir un evento (o la respuesta
+    completa) y devuelve (status, cuerpo).
+    """
+    mensajes = []
+    recibido = asyncio.Event()
+
+    async def receive():
+        await recibido.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(mensaje):
+        mensajes.append(mensaje)
+        # Publicar cuando el stream ya está suscrito (tras el 'retry')
+        if mensaje.get("body", b"").startswith(b"retry:") and publicar:
+            asyncio.get_running_loop().call_soon(publicar)
+        if mensaje["type"] == "http.response.body" and (
+            b"event:" in mensaje["body"] or not mensaje.get("more_body")
+        ):
+            recibido.set()
+
+    scope = {
+        "type": "http",
+        "method": "GET",
+        "path": path,
+        "query_string": query_string,
+        "headers": list(headers),
+        "client": ("10.0.9.1", 50000),
+    }
+    await asyncio.wait_for(aplicacion_sse(scope, receive, send), timeout=5)
+
+    cuerpo = b"".join(
+        m["body"] for m in mensajes if m["type"] == "http.response.body"
+    )
+    return mensajes[0]["status"], cuerpo.decode("utf-8")
+
+
+class EventosTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        eventos._broker = MemoriaBroker()
+        self.empresa = Empresa.objects.create(
+            nombre="Empresa Eventos", slug="eventos"
+        )
+        self.operador = Usuario.objects.create_user(
+            email="operador@example.com", password="password123"
+        )
+        PerfilUsuario.objects.create(
+            usuario=self.operador,
+            empresa=self.empresa,
+            rol=PerfilUsuario.RolChoices.OPERADOR_CUBA,
+        )
+        self.envio = Envio.objects.create(
+            empresa=self.empresa, **fila_envio(peso=1)
+        )
+
+    def tearDown(self):
+        eventos._broker = None
+
+    def test_reanudar_con_ultimo_id(self):
+        """Probar que el broker reenvía lo posterior a Last-Event-ID"""
+        broker = eventos._broker
+        ids = [broker.publicar("guia:X", "estado", {"n": n}) for n in range(3)]
+
+        async def leer():
+            recibidos = []
+            suscripcion = broker.suscribir("guia:X", ultimo_id=ids[0])
+            async for evento in suscripcion:
+                recibidos.append(json.loads(evento["datos"])["n"])
+                if len(recibidos) == 2:
+                    broker.publicar("guia:X", "estado", {"n": 3})
+                if len(recibidos) == 3:
+                    break
+            await suscripcion.aclose()
+            return recibidos
+
+        self.assertEqual(async_to_sync(leer)(), [1, 2, 3])
+
+    def test_stream_publico_de_guia(self):
+        """Probar que el canal de la guía entrega el cambio de estado"""
+        envio = self.envio
+        envio.estado_actual = Envio.EstadoChoices.EN_TRANSITO
+        with self.captureOnCommitCallbacks(execute=True):
+            eventos.publicar_cambios_estado(
+                [(envio, Envio.EstadoChoices.RECIBIDO)]
+            )
+
+        # Un cliente que reanuda desde el inicio recibe el historial
+        status, cuerpo = async_to_sync(abrir_stream)(
+            f"/api/eventos/guia/{envio.numero_guia}/", b"ultimo_id=0"
+        )
+
+        self.assertEqual(status, 200)
+        self.assertIn("event: estado", cuerpo)
+        datos = json.loads(cuerpo.split("data: ")[1].split("\n")[0])
+        self.assertEqual(datos["estado"], Envio.EstadoChoices.EN_TRANSITO)
+        self.assertNotIn("estado_anterior", datos)
+
+    def test_stream_de_guia_inexistente(self):
+        """Probar que no se abre el canal de una guía que no existe ni se
+        crea nada para ella en el broker"""
+        status, _ = async_to_sync(abrir_stream)("/api/eventos/guia/NOEXISTE/")
+
+        self.assertEqual(status, 404)
+        self.assertNotIn(canal_guia("NOEXISTE"), eventos._broker._historial)
+
+    @override_settings(
+        REST_FRAMEWORK={
+            "DEFAULT_THROTTLE_RATES": {
+                "publico_ip": "100/hour",
+                "publico_ip_rafaga": "1/min",
+            }
+        }
+    )
+    def test_stream_de_guia_limitado(self):
+        """Probar los límites públicos por IP y de streams abiertos"""
+        path = f"/api/eventos/guia/{self.envio.numero_guia}/"
+        eventos._broker.publicar(
+            canal_guia(self.envio.numero_guia), "estado", {}
+        )
+
+        status, _ = async_to_sync(abrir_stream)(path, b"ultimo_id=0")
+        self.assertEqual(status, 200)
+        self.assertEqual(sse._conexiones, {})
+        status, _ = async_to_sync(abrir_stream)(path, b"ultimo_id=0")
+        self.assertEqual(status, 429)
+
+        cache.clear()
+        with mock.patch.dict(sse._conexiones, {"10.0.9.1": 1}):
+            with self.settings(EVENTOS_MAX_CONEXIONES_IP=1):
+                status, _ = async_to_sync(abrir_stream)(path)
+        self.assertEqual(status, 429)
+
+    def test_broker_libera_canales_sin_suscriptores(self):
+        """Probar que el broker en memoria no guarda los canales a los que
+        solo se suscribe un cliente"""
+        broker = eventos._broker
+
+        async def suscribir_y_salir():
+            suscripcion = broker.suscribir("guia:X", espera=0)
+            self.assertIsNone(await suscripcion.__anext__())
+            self.assertIn("guia:X", broker._suscriptores)
+            await suscripcion.aclose()
+
+        async_to_sync(suscribir_y_salir)()
+        self.assertEqual(dict(broker._suscriptores), {})
+        self.assertEqual(dict(broker._historial), {})
+
+    def ticket(self, usuario):
+        client = APIClient()
+        client.force_authenticate(usuario)
+        return client.post(
+            "/api/envios/eventos_ticket/", HTTP_X_TENANT_SLUG="eventos"
+        )
+
+    def test_stream_empresa_requiere_operador(self):
+        """Probar la autenticación del canal de la empresa con tickets de
+        un solo uso"""
+        status, _ = async_to_sync(abrir_stream)("/api/eventos/empresa/")
+        self.assertEqual(status, 401)
+
+        remitente = Usuario.objects.create_user(
+            email="remitente@example.com", password="password123"
+        )
+        PerfilUsuario.objects.create(
+            usuario=remitente,
+            empresa=self.empresa,
+            rol=PerfilUsuario.RolChoices.REMITENTE,
+        )
+        self.assertEqual(self.ticket(remitente).status_code, 403)
+        status, _ = async_to_sync(abrir_stream)(
+            "/api/eventos/empresa/",
+            headers=[
+                (
+                    b"authorization",
+                    f"Bearer {AccessToken.for_user(remitente)}".encode(),
+                ),
+                (b"x-tenant-slug", b"eventos"),
+            ],
+        )
+        self.assertEqual(status, 403)
+
+        response = self.ticket(self.operador)
+        self.assertEqual(response.status_code, 200)
+        ticket = response.json()["ticket"]
+        status, cuerpo = async_to_sync(abrir_stream)(
+            "/api/eventos/empresa/",
+            f"ticket={ticket}".encode(),
+            publicar=lambda: eventos._broker.publicar(
+                canal_empresa(self.empresa.id), "estado", {"id": 1}
+            ),
+        )
+        self.assertEqual(status, 200)
+        self.assertIn('data: {"id": 1}', cuerpo)
+
+        # El ticket no se puede reutilizar y el JWT ya no va en la URL
+        status, _ = async_to_sync(abrir_stream)(
+            "/api/eventos/empresa/", f"ticket={ticket}".encode()
+        )
+        self.assertEqual(status, 401)
+        token = str(AccessToken.for_user(self.operador))
+        status, _ = async_to_sync(abrir_stream)(
+            "/api/eventos/empresa/",
+            f"token={token}&empresa=eventos".encode(),
+        )
+        self.assertEqual(status, 401)
+
+    def test_cambiar_estado_publica_eventos(self):
+        """Probar que cambiar_estado publica en los canales tras el commit"""
+        client = APIClient()
+        client.force_authenticate(self.operador)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client.post(
+                f"/api/envios/{self.envio.id}/cambiar_estado/",
+                {"estado": Envio.EstadoChoices.EN_TRANSITO},
+                format="json",
+                HTTP_X_TENANT_SLUG="eventos",
+            )
+
+        self.assertEqual(response.status_code, 200)
+        historial = eventos._broker._historial
+        self.assertEqual(len(historial[canal_guia(self.envio.numero_guia)]), 1)
+        evento = json.loads(
+            historial[canal_empresa(self.empresa.id)][0]["datos"]
+        )
+        self.assertEqual(
+            evento["estado_anterior"], Envio.EstadoChoices.RECIBIDO
+        )
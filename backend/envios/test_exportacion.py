@@ -0,0 +1,200 @@
+import io
+import os
+import tempfile
+import zipfile
+from unittest import mock
+from xml.etree import ElementTree
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import AsyncClient, TestCase, override_settings
+from rest_framework import status
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from empresas.models import Empresa, PerfilUsuario
+from envios import exportacion
+from envios.exportacion import COLUMNAS
+from envios.importacion import importar_envios, leer_csv
+from envios.models import Envio
+from envios.test_importacion import fila_envio
+
+Usuario = get_user_model()
+
+XLSX_NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+
+
+class ExportacionEnviosTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.empresa = Empresa.objects.create(
+            nombre="Empresa Exportación", slug="exportacion"
+        )
+        self.operador = Usuario.objects.create_user(
+            email="operador@example.com", password="password123"
+        )
+        PerfilUsuario.objects.create(
+            usuario=self.operador,
+            empresa=self.empresa,
+            rol=PerfilUsuario.RolChoices.OPERADOR_MIAMI,
+        )
+        importar_envios(
+            [
+                fila_envio(remitente_nombre="Ana Pérez", peso="1.25"),
+                fila_envio(
+                    remitente_nombre="Luis Gómez",
+                    remitente_telefono="+13055550000",
+                    descripcion='=HYPERLINK("http://x")',
+                ),
+                fila_envio(remitente_nombre="Marta Ruiz"),
+            ],
+            self.empresa,
+            self.operador,
+            notificar=False,
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.operador)
+
+    def exportar(self, **parametros):
+        response = self.client.get(
+            "/api/envios/exportar/",
+            parametros,
+            HTTP_X_TENANT_SLUG="exportacion",
+        )
+        contenido = b"".join(response.streaming_content)
+        return response, contenido
+
+    def test_exportar_csv(self):
+        """Probar la exportación CSV por streaming, reimportable"""
+        response, contenido = self.exportar()
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        self.assertIn("text/csv", response["Content-Type"])
+        self.assertIn(
+            'attachment; filename="envios-exportacion-',
+            response["Content-Disposition"],
+        )
+        self.assertTrue(contenido.startswith(b"\xef\xbb\xbf"))
+
+        filas = leer_csv(contenido)
+        self.assertEqual(len(filas), 3)
+        self.assertEqual(list(filas[0])[:2], ["numero_guia", "estado_actual"])
+        # Orden por defecto: más recientes primero
+        self.assertEqual(filas[0]["remitente_nombre"], "Marta Ruiz")
+        self.assertEqual(filas[2]["peso"], "1.25")
+
+        # Las fórmulas se neutralizan; los teléfonos quedan intactos
+        luis = filas[1]
+        self.assertEqual(luis["descripcion"], '\'=HYPERLINK("http://x")')
+        self.assertEqual(luis["remitente_telefono"], "+13055550000")
+
+    def test_exportar_respeta_busqueda_orden_y_rol(self):
+        """Probar que se aplican ?search=, ?ordering= y el filtro por rol"""
+        _, contenido = self.exportar(search="Luis")
+        self.assertEqual(
+            [f["remitente_nombre"] for f in leer_csv(contenido)],
+            ["Luis Gómez"],
+        )
+
+        _, contenido = self.exportar(ordering="fecha_creacion")
+        self.assertEqual(
+            leer_csv(contenido)[0]["remitente_nombre"], "Ana Pérez"
+        )
+
+        remitente = Usuario.objects.create_user(
+            email="luis@example.com", password="password123"
+        )
+        PerfilUsuario.objects.create(
+            usuario=remitente,
+            empresa=self.empresa,
+            rol=PerfilUsuario.RolChoices.REMITENTE,
+            telefono="+13055550000",
+        )
+        self.client.force_authenticate(remitente)
+        _, contenido = self.exportar()
+        self.assertEqual(len(leer_csv(contenido)), 1)
+
+    def test_exportar_xlsx(self):
+        """Probar que el XLSX es un libro válido con todas las filas"""
+        response, contenido = self.exportar(formato="xlsx")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn("spreadsheetml", response["Content-Type"])
+
+        with zipfile.ZipFile(io.BytesIO(contenido)) as libro:
+            self.assertIsNone(libro.testzip())
+            hoja = ElementTree.fromstring(
+                libro.read("xl/worksheets/sheet1.xml")
+            )
+        filas = hoja.findall(f"{XLSX_NS}sheetData/{XLSX_NS}row")
+        self.assertEqual(len(filas), 4)
+        encabezados = [t.text for t in filas[0].iter(f"{XLSX_NS}t")]
+        self.assertEqual(encabezados, list(COLUMNAS))
+        # El peso se escribe como número
+        valores = [v.text for v in filas[3].iter(f"{XLSX_NS}v")]
+        self.assertIn("1.25", valores)
+
+    @override_settings(EXPORTACION_CHUNK_SIZE=1)
+    async def test_exportar_por_streaming_en_asgi(self):
+        """Probar que bajo ASGI el export se envía bloque a bloque en lugar
+        de generarse entero antes del primer byte"""
+        leidas = []
+        filas_envios = exportacion.filas_envios
+
+        def contar_filas(*args, **kwargs):
+            for fila in filas_envios(*args, **kwargs):
+                leidas.append(fila)
+                yield fila
+
+        token = AccessToken.for_user(self.operador)
+        with mock.patch.object(exportacion, "filas_envios", contar_filas):
+            response = await AsyncClient().get(
+                "/api/envios/exportar/",
+                headers={
+                    "Authorization": f"Bearer {token}",
+                    "X-Tenant-Slug": "exportacion",
+                },
+            )
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertTrue(response.is_async)
+
+            bloques = []
+            async for bloque in response.streaming_content:
+                bloques.append(bloque)
+                if len(bloques) == 2:
+                    # Encabezado y primera fila: el resto sin leer aún
+                    self.assertEqual(len(leidas), 1)
+
+        self.assertEqual(len(leidas), 3)
+        self.assertEqual(len(leer_csv(b"".join(bloques))), 3)
+
+    def test_formato_no_soportado(self):
+        """Probar que un formato desconocido devuelve 400"""
+        response = self.client.get(
+            "/api/envios/exportar/",
+            {"formato": "pdf"},
+            HTTP_X_TENANT_SLUG="exportacion",
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_comando_exportar_envios(self):
+        """Probar el comando exportar_envios con filtro de estado"""
+        Envio.objects.filter(remitente_nombre="Ana Pérez").update(
+            estado_actual=Envio.EstadoChoices.EN_TRANSITO
+        )
+        with tempfile.TemporaryDirectory() as directorio:
+            ruta = os.path.join(directorio, "envios.csv")
+            call_command(
+                "exportar_envios",
+                empresa="exportacion",
+                estado=Envio.EstadoChoices.EN_TRANSITO,
+                salida=ruta,
+                stdout=io.StringIO(),
+            )
+            with open(ruta, "rb") as archivo:
+                filas = leer_csv(archivo)
+
+        self.assertEqual([f["remitente_nombre"] for f in filas], ["Ana Pérez"])
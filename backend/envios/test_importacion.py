@@ -0,0 +1,137 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from empresas.models import Empresa, PerfilUsuario
+from envios.importacion import importar_envios
+from envios.models import Envio, HistorialEstado
+
+Usuario = get_user_model()
+
+
+def fila_envio(**extra):
+    fila = {
+        "descripcion": "Paquete importado",
+        "peso": "3.50",
+        "remitente_nombre": "Remitente Manifiesto",
+        "remitente_direccion": "Miami",
+        "remitente_telefono": "+13055551234",
+        "destinatario_nombre": "Destinatario Manifiesto",
+        "destinatario_direccion": "La Habana",
+        "destinatario_telefono": "+5355123456",
+    }
+    fila.update(extra)
+    return fila
+
+
+@override_settings(NOTIFICACIONES_DESPACHO_EN_COMMIT=False)
+class ImportacionEnviosTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.empresa = Empresa.objects.create(
+            nombre="Empresa Manifiestos", slug="manifiestos"
+        )
+        self.usuario = Usuario.objects.create_user(
+            email="miami@example.com", password="password123"
+        )
+        PerfilUsuario.objects.create(
+            usuario=self.usuario,
+            empresa=self.empresa,
+            rol=PerfilUsuario.RolChoices.OPERADOR_MIAMI,
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+
+    def test_importar_json_con_errores_por_fila(self):
+        """Probar que las filas válidas se crean y las inválidas se reportan"""
+        filas = [fila_envio(), fila_envio(peso="0"), fila_envio()]
+
+        response = self.client.post(
+            "/api/envios/importar/",
+            filas,
+            format="json",
+            HTTP_X_TENANT_SLUG="manifiestos",
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        data = response.json()
+        self.assertEqual(data["creados"], 2)
+        self.assertEqual(data["errores"][0]["fila"], 1)
+        self.assertIn("peso", data["errores"][0]["errores"])
+        self.assertEqual(Envio.objects.filter(empresa=self.empresa).count(), 2)
+        self.assertEqual(
+            HistorialEstado.objects.filter(
+                envio__empresa=self.empresa
+            ).count(),
+            2,
+        )
+
+    def test_importar_csv(self):
+        """Probar la importación de un manifiesto CSV"""
+        columnas = list(fila_envio().keys()) + ["valor_declarado"]
+        lineas = [",".join(columnas)]
+        for _ in range(3):
+            lineas.append(",".join(list(fila_envio().values()) + [""]))
+        archivo = SimpleUploadedFile(
+            "manifiesto.csv",
+            "\n".join(lineas).encode("utf-8"),
+            content_type="text/csv",
+        )
+
+        response = self.client.post(
+            "/api/envios/importar/",
+            {"archivo": archivo},
+            format="multipart",
+            HTTP_X_TENANT_SLUG="manifiestos",
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.json()["creados"], 3)
+
+    def test_importar_csv_invalido(self):
+        """Probar que un CSV con otra codificación o mal formado devuelve
+        400 en lugar de un error del servidor"""
+        columnas = ",".join(fila_envio().keys())
+        for contenido, mensaje in (
+            (f"{columnas}\nCamión".encode("latin-1"), "UTF-8"),
+            (f'{columnas}\n"{"x" * 200000}"'.encode("utf-8"), "formato"),
+        ):
+            archivo = SimpleUploadedFile(
+                "manifiesto.csv", contenido, content_type="text/csv"
+            )
+            response = self.client.post(
+                "/api/envios/importar/",
+                {"archivo": archivo},
+                format="multipart",
+                HTTP_X_TENANT_SLUG="manifiestos",
+            )
+
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn(mensaje, response.json()["error"])
+
+    def test_consultas_por_lotes(self):
+        """Probar que las consultas dependen del número de lotes, no de filas"""
+
+        def contar(filas, tamano_lote):
+            with CaptureQueriesContext(connection) as contexto:
+                resultado = importar_envios(
+                    [fila_envio() for _ in range(filas)],
+                    self.empresa,
+                    self.usuario,
+                    tamano_lote=tamano_lote,
+                    notificar=False,
+                )
+            self.assertEqual(resultado["creados"], filas)
+            return len(contexto.captured_queries)
+
+        # La primera importación crea además el contador de la empresa
+        contar(1, 1)
+        self.assertEqual(contar(20, 10), contar(80, 40))
+        self.assertEqual(
+            Envio.objects.values("numero_guia").distinct().count(), 101
+        )
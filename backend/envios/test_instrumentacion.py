@@ -0,0 +1,161 @@
+import tempfile
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from prometheus_client import REGISTRY
+from rest_framework.test import APIClient
+
+from empresas.models import Empresa, PerfilUsuario
+from envios.importacion import importar_envios
+from envios.models import Envio
+from envios.test_importacion import fila_envio
+
+Usuario = get_user_model()
+
+
+def muestra(nombre, **etiquetas):
+    return REGISTRY.get_sample_value(nombre, etiquetas) or 0
+
+
+@override_settings(
+    NOTIFICACIONES_DESPACHO_EN_COMMIT=False, INSTRUMENTACION_TOKEN="secreto"
+)
+class InstrumentacionTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.empresa = Empresa.objects.create(
+            nombre="Empresa Métricas", slug="metricas"
+        )
+        self.usuario = Usuario.objects.create_user(
+            email="dueno@example.com", password="password123"
+        )
+        PerfilUsuario.objects.create(
+            usuario=self.usuario,
+            empresa=self.empresa,
+            rol=PerfilUsuario.RolChoices.DUENO,
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            importar_envios(
+                [fila_envio()], self.empresa, self.usuario, notificar=False
+            )
+        self.envio = Envio.objects.get()
+        self.client = APIClient()
+
+    def test_metricas_por_ruta_y_tenant(self):
+        """Probar latencia, consultas y tamaño por ruta y tenant"""
+        etiquetas = {
+            "metodo": "GET",
+            "ruta": "api/envios/",
+            "tenant": "metricas",
+        }
+        antes = muestra("packfy_peticion_consultas_count", **etiquetas)
+        consultas = muestra("packfy_peticion_consultas_sum", **etiquetas)
+
+        self.client.force_authenticate(self.usuario)
+        response = self.client.get(
+            "/api/envios/", HTTP_X_TENANT_SLUG="metricas"
+        )
+
+        self.assertEqual(
+            muestra("packfy_peticion_consultas_count", **etiquetas), antes + 1
+        )
+        self.assertGreater(
+            muestra("packfy_peticion_consultas_sum", **etiquetas), consultas
+        )
+        self.assertGreater(
+            muestra(
+                "packfy_peticion_duracion_segundos_count",
+                estado="200",
+                **etiquetas,
+            ),
+            0,
+        )
+        self.assertGreaterEqual(
+            muestra("packfy_respuesta_bytes_sum", **etiquetas),
+            len(response.content),
+        )
+
+        response = self.client.get(
+            "/api/metrics", HTTP_AUTHORIZATION="Bearer secreto"
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Content-Type"].startswith("text/plain"))
+        self.assertIn(
+            'packfy_peticion_duracion_segundos_bucket{estado="200"',
+            response.content.decode(),
+        )
+
+    def test_aciertos_y_fallos_de_cache(self):
+        """Probar que las lecturas de caché se atribuyen a la ruta"""
+        etiquetas = {
+            "ruta": "api/envios/rastrear/",
+            "tenant": "",
+            "uso": "rastreo",
+        }
+        aciertos = muestra(
+            "packfy_cache_operaciones_total", resultado="acierto", **etiquetas
+        )
+        fallos = muestra(
+            "packfy_cache_operaciones_total", resultado="fallo", **etiquetas
+        )
+
+        cache.clear()
+        for _ in range(2):
+            self.client.get(
+                "/api/envios/rastrear/",
+                {"numero_guia": self.envio.numero_guia},
+            )
+
+        self.assertEqual(
+            muestra(
+                "packfy_cache_operaciones_total",
+                resultado="fallo",
+                **etiquetas,
+            ),
+            fallos + 1,
+        )
+        self.assertEqual(
+            muestra(
+                "packfy_cache_operaciones_total",
+                resultado="acierto",
+                **etiquetas,
+            ),
+            aciertos + 1,
+        )
+
+    def test_token(self):
+        """Probar que con token configurado se exige en la cabecera"""
+        self.assertEqual(self.client.get("/api/metrics").status_code, 401)
+        response = self.client.get(
+            "/api/metrics", HTTP_AUTHORIZATION="Bearer otro"
+        )
+        self.assertEqual(response.status_code, 401)
+
+        response = self.client.get(
+            "/api/metrics", HTTP_AUTHORIZATION="Bearer secreto"
+        )
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(INSTRUMENTACION_TOKEN=None)
+    def test_sin_token_cerrado(self):
+        """Probar que sin token configurado el endpoint solo se sirve con
+        DEBUG activo"""
+        self.assertEqual(self.client.get("/api/metrics").status_code, 401)
+        with self.settings(DEBUG=True):
+            self.assertEqual(self.client.get("/api/metrics").status_code, 200)
+
+    def test_modo_multiproceso(self):
+        """Probar que con PROMETHEUS_MULTIPROC_DIR se agregan los ficheros
+        de los workers en lugar del registro del proceso"""
+        with tempfile.TemporaryDirectory() as directorio:
+            with mock.patch.dict(
+                "os.environ", {"PROMETHEUS_MULTIPROC_DIR": directorio}
+            ):
+                response = self.client.get(
+                    "/api/metrics", HTTP_AUTHORIZATION="Bearer secreto"
+                )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn(b"packfy_peticion", response.content)
@@ -0,0 +1,168 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from empresas.models import Empresa, PerfilUsuario
+from envios.importacion import importar_envios
+from envios.models import Envio, HistorialEstado, NotificacionEmail
+from envios.test_importacion import fila_envio
+
+Usuario = get_user_model()
+
+
+@override_settings(NOTIFICACIONES_DESPACHO_EN_COMMIT=False)
+class CambioEstadoLoteTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.empresa = Empresa.objects.create(
+            nombre="Empresa Lotes", slug="lotes"
+        )
+        self.usuario = Usuario.objects.create_user(
+            email="habana@example.com", password="password123"
+        )
+        PerfilUsuario.objects.create(
+            usuario=self.usuario,
+            empresa=self.empresa,
+            rol=PerfilUsuario.RolChoices.OPERADOR_CUBA,
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+
+    def crear_envios(self, cantidad):
+        filas = [
+            fila_envio(remitente_email="remitente@example.com")
+            for _ in range(cantidad)
+        ]
+        importar_envios(filas, self.empresa, self.usuario, notificar=False)
+        return list(Envio.objects.filter(empresa=self.empresa).order_by("id"))
+
+    def cambiar(self, **datos):
+        return self.client.post(
+            "/api/envios/cambiar_estado_lote/",
+            datos,
+            format="json",
+            HTTP_X_TENANT_SLUG="lotes",
+        )
+
+    def test_cambiar_estado_lote(self):
+        """Probar el cambio de estado de varios envíos con historial"""
+        envios = self.crear_envios(3)
+
+        response = self.cambiar(
+            estado=Envio.EstadoChoices.EN_TRANSITO,
+            numeros_guia=[envio.numero_guia for envio in envios[:2]],
+            ids=[envios[2].id],
+            ubicacion="Aeropuerto de Miami",
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()["actualizados"], 3)
+        self.assertEqual(
+            Envio.objects.filter(
+                empresa=self.empresa,
+                estado_actual=Envio.EstadoChoices.EN_TRANSITO,
+            ).count(),
+            3,
+        )
+        self.assertEqual(
+            HistorialEstado.objects.filter(
+                envio__empresa=self.empresa,
+                estado=Envio.EstadoChoices.EN_TRANSITO,
+                ubicacion="Aeropuerto de Miami",
+            ).count(),
+            3,
+        )
+        self.assertEqual(
+            NotificacionEmail.objects.filter(
+                envio__empresa=self.empresa
+            ).count(),
+            3,
+        )
+
+    def test_errores_por_envio(self):
+        """Probar que los envíos inválidos se reportan sin bloquear el lote"""
+        envios = self.crear_envios(2)
+        Envio.objects.filter(pk=envios[1].pk).update(
+            estado_actual=Envio.EstadoChoices.ENTREGADO
+        )
+        otra_empresa = Empresa.objects.create(nombre="Otra", slug="otra")
+        ajeno = Envio.objects.create(
+            empresa=otra_empresa, **fila_envio(peso=1)
+        )
+
+        response = self.cambiar(
+            estado=Envio.EstadoChoices.EN_TRANSITO,
+            numeros_guia=[envios[0].numero_guia, "NOEXISTE"],
+            ids=[envios[1].id, ajeno.id],
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.json()
+        self.assertEqual(data["actualizados"], 1)
+        errores = [r for r in data["resultados"] if "error" in r]
+        self.assertEqual(len(errores), 3)
+        ajeno.refresh_from_db()
+        self.assertEqual(ajeno.estado_actual, Envio.EstadoChoices.RECIBIDO)
+
+    def test_cambio_individual_con_las_mismas_reglas(self):
+        """Probar que el cambio de un solo envío aplica las mismas reglas de
+        transición que el lote"""
+        envio = self.crear_envios(1)[0]
+        url = f"/api/envios/{envio.id}/cambiar_estado/"
+
+        response = self.client.post(
+            url,
+            {"estado": Envio.EstadoChoices.ENTREGADO},
+            format="json",
+            HTTP_X_TENANT_SLUG="lotes",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response.json()["estado_actual"], Envio.EstadoChoices.ENTREGADO
+        )
+        self.assertEqual(NotificacionEmail.objects.count(), 1)
+
+        # Desde un estado final se rechaza, igual que en el lote
+        response = self.client.post(
+            url,
+            {"estado": Envio.EstadoChoices.EN_TRANSITO},
+            format="json",
+            HTTP_X_TENANT_SLUG="lotes",
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("Transición inválida", response.json()["error"])
+        envio.refresh_from_db()
+        self.assertEqual(envio.estado_actual, Envio.EstadoChoices.ENTREGADO)
+        self.assertEqual(
+            HistorialEstado.objects.filter(envio=envio).count(), 2
+        )
+
+    def test_validacion(self):
+        """Probar que se exige al menos un identificador"""
+        response = self.cambiar(estado=Envio.EstadoChoices.EN_TRANSITO)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_consultas_constantes(self):
+        """Probar que las consultas no crecen con el tamaño del lote"""
+        envios = self.crear_envios(30)
+        self.cambiar(
+            estado=Envio.EstadoChoices.EN_TRANSITO,
+            ids=[envios[0].id],
+        )
+
+        def contar(lote, estado):
+            with CaptureQueriesContext(connection) as consultas:
+                response = self.cambiar(
+                    estado=estado, ids=[envio.id for envio in lote]
+                )
+            self.assertEqual(response.json()["actualizados"], len(lote))
+            return len(consultas)
+
+        self.assertEqual(
+            contar(envios[1:6], Envio.EstadoChoices.EN_TRANSITO),
+            contar(envios[6:30], Envio.EstadoChoices.EN_TRANSITO),
+        )
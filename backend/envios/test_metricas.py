@@ -0,0 +1,191 @@
+from datetime import datetime, timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from empresas.models import Empresa, PerfilUsuario
+from envios.metricas import (
+    actualizar_metricas,
+    reconstruir_metricas,
+    serie_metricas,
+)
+from envios.models import Envio, HistorialEstado, MetricaEnvios
+from envios.test_importacion import fila_envio
+
+Usuario = get_user_model()
+
+Estado = Envio.EstadoChoices
+
+
+class MetricasEnviosTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.empresa = Empresa.objects.create(
+            nombre="Empresa Métricas", slug="metricas"
+        )
+        self.usuario = Usuario.objects.create_user(
+            email="dueno@example.com", password="password123"
+        )
+        PerfilUsuario.objects.create(
+            usuario=self.usuario,
+            empresa=self.empresa,
+            rol=PerfilUsuario.RolChoices.DUENO,
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+
+        # Lunes 5 de octubre, 08:00 hora local
+        self.t0 = timezone.make_aware(datetime(2026, 10, 5, 8))
+        horas = lambda n: self.t0 + timedelta(hours=n)  # noqa: E731
+        self.crear_envio(
+            (Estado.RECIBIDO, horas(0)),
+            (Estado.EN_TRANSITO, horas(2)),
+            (Estado.ENTREGADO, horas(26)),
+        )
+        self.crear_envio(
+            (Estado.RECIBIDO, horas(1)), (Estado.DEVUELTO, horas(3))
+        )
+
+    def crear_envio(self, *transiciones):
+        envio = Envio.objects.create(
+            empresa=self.empresa,
+            numero_guia=f"MET{Envio.objects.count():05d}",
+            **fila_envio(),
+        )
+        for estado, fecha in transiciones:
+            historial = HistorialEstado.objects.create(
+                envio=envio, estado=estado
+            )
+            # fecha es auto_now_add
+            HistorialEstado.objects.filter(pk=historial.pk).update(fecha=fecha)
+        return envio
+
+    def dia(self, dia, estado):
+        return MetricaEnvios.objects.get(
+            empresa=self.empresa,
+            granularidad=MetricaEnvios.GranularidadChoices.DIA,
+            inicio=timezone.make_aware(datetime(2026, 10, dia)),
+            estado=estado,
+        )
+
+    def test_agregar_por_dia_y_hora(self):
+        """Probar los rollups de entradas, salidas y tiempo en estado"""
+        self.assertEqual(actualizar_metricas(), 5)
+
+        recibido = self.dia(5, Estado.RECIBIDO)
+        self.assertEqual(recibido.entradas, 2)
+        self.assertEqual(recibido.salidas, 2)
+        self.assertEqual(recibido.segundos_en_estado, 4 * 3600)
+
+        # La salida de EN_TRANSITO cae en el día siguiente
+        self.assertEqual(self.dia(5, Estado.EN_TRANSITO).salidas, 0)
+        en_transito = self.dia(6, Estado.EN_TRANSITO)
+        self.assertEqual(en_transito.salidas, 1)
+        self.assertEqual(en_transito.segundos_en_estado, 24 * 3600)
+
+        horas = MetricaEnvios.objects.filter(
+            granularidad=MetricaEnvios.GranularidadChoices.HORA,
+            estado=Estado.RECIBIDO,
+        ).order_by("inicio")
+        self.assertEqual([m.entradas for m in horas], [1, 1, 0, 0])
+        self.assertEqual([m.inicio for m in horas][0], self.t0)
+
+    def test_agregacion_incremental(self):
+        """Probar que la agregación continúa desde la marca de agua y deja
+        para después el historial reciente"""
+        actualizar_metricas()
+        self.crear_envio(
+            (Estado.RECIBIDO, self.t0 + timedelta(hours=5)),
+        )
+        # Recién creado: queda fuera del margen de seguridad
+        HistorialEstado.objects.create(
+            envio=Envio.objects.first(), estado=Estado.ENTREGADO
+        )
+
+        self.assertEqual(actualizar_metricas(), 1)
+        self.assertEqual(actualizar_metricas(), 0)
+        self.assertEqual(self.dia(5, Estado.RECIBIDO).entradas, 3)
+
+        with self.settings(METRICAS_MARGEN_SEGUNDOS=-60):
+            self.assertEqual(actualizar_metricas(), 1)
+
+    def test_reconstruir(self):
+        """Probar que reconstruir da el mismo resultado que la agregación"""
+        actualizar_metricas()
+        esperado = list(
+            MetricaEnvios.objects.order_by("id").values(
+                "granularidad", "inicio", "estado", "entradas", "salidas"
+            )
+        )
+        MetricaEnvios.objects.update(entradas=99)
+
+        self.assertEqual(reconstruir_metricas(lote=2), 5)
+        self.assertEqual(
+            list(
+                MetricaEnvios.objects.order_by("id").values(
+                    "granularidad", "inicio", "estado", "entradas", "salidas"
+                )
+            ),
+            esperado,
+        )
+
+    def test_serie_semanal(self):
+        """Probar que la serie semanal suma los días de la semana"""
+        actualizar_metricas()
+
+        serie = serie_metricas(
+            self.empresa,
+            "semana",
+            self.t0 - timedelta(days=7),
+            self.t0 + timedelta(days=7),
+        )
+
+        self.assertEqual(len(serie), 1)
+        self.assertEqual(serie[0]["creados"], 2)
+        self.assertEqual(serie[0]["entregados"], 1)
+        self.assertEqual(serie[0]["devueltos"], 1)
+        self.assertEqual(
+            serie[0]["estados"][Estado.RECIBIDO]["tiempo_medio_horas"], 2.0
+        )
+
+    def test_endpoint_metricas(self):
+        """Probar el endpoint de series de métricas"""
+        actualizar_metricas()
+
+        response = self.client.get(
+            "/api/empresas/metricas/",
+            {
+                "intervalo": "dia",
+                "desde": "2026-10-01T00:00:00",
+                "hasta": "2026-10-10T00:00:00",
+                "estados": [Estado.ENTREGADO, Estado.RECIBIDO],
+            },
+            HTTP_X_TENANT_SLUG="metricas",
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        serie = response.data["serie"]
+        self.assertEqual([p["creados"] for p in serie], [2, 0])
+        self.assertEqual([p["entregados"] for p in serie], [0, 1])
+        self.assertEqual(set(serie[0]["estados"]), {Estado.RECIBIDO})
+
+    def test_endpoint_metricas_rango_invalido(self):
+        """Probar que se rechazan rangos invertidos o demasiado largos"""
+        for parametros in (
+            {"desde": "2026-10-10T00:00:00", "hasta": "2026-10-01T00:00:00"},
+            {
+                "intervalo": "hora",
+                "desde": "2026-01-01T00:00:00",
+                "hasta": "2026-10-01T00:00:00",
+            },
+        ):
+            response = self.client.get(
+                "/api/empresas/metricas/",
+                parametros,
+                HTTP_X_TENANT_SLUG="metricas",
+            )
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,147 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from empresas.models import Empresa, PerfilUsuario
+from envios.importacion import importar_envios
+from envios.models import Envio
+from envios.test_importacion import fila_envio
+
+Usuario = get_user_model()
+
+
+class KeysetPaginationTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.empresa = Empresa.objects.create(
+            nombre="Empresa Paginación", slug="paginacion"
+        )
+        self.usuario = Usuario.objects.create_user(
+            email="dueno@example.com", password="password123"
+        )
+        PerfilUsuario.objects.create(
+            usuario=self.usuario,
+            empresa=self.empresa,
+            rol=PerfilUsuario.RolChoices.DUENO,
+        )
+        importar_envios(
+            [fila_envio() for _ in range(12)], self.empresa, notificar=False
+        )
+        # Varios envíos con la misma fecha: el id desempata
+        envios = Envio.objects.filter(empresa=self.empresa).order_by("id")
+        Envio.objects.filter(id__in=[e.id for e in envios[:5]]).update(
+            fecha_creacion=timezone.now()
+        )
+        self.esperados = list(
+            Envio.objects.filter(empresa=self.empresa)
+            .order_by("-fecha_creacion", "-id")
+            .values_list("id", flat=True)
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+
+    def get(self, url, **params):
+        return self.client.get(url, params, HTTP_X_TENANT_SLUG="paginacion")
+
+    def test_recorrer_hacia_adelante_y_atras(self):
+        """Probar que el cursor recorre todos los envíos sin repetir"""
+        paginas = []
+        response = self.get("/api/envios/", page_size=5)
+        while True:
+            data = response.json()
+            self.assertNotIn("count", data)
+            paginas.append([envio["id"] for envio in data["results"]])
+            if not data["next"]:
+                break
+            response = self.get(data["next"])
+
+        self.assertEqual(sum(paginas, []), self.esperados)
+        self.assertEqual([len(pagina) for pagina in paginas], [5, 5, 2])
+
+        anterior = self.get(data["previous"]).json()
+        self.assertEqual(
+            [envio["id"] for envio in anterior["results"]], paginas[1]
+        )
+        primera = self.get(anterior["previous"]).json()
+        self.assertEqual(
+            [envio["id"] for envio in primera["results"]], paginas[0]
+        )
+        self.assertIsNone(primera["previous"])
+
+    def test_conteo_opcional(self):
+        """Probar el total exacto y aproximado bajo demanda"""
+        data = self.get("/api/envios/", count="exacto").json()
+        self.assertEqual(data["count"], 12)
+        data = self.get("/api/envios/", count="aprox").json()
+        self.assertIn("count", data)
+
+    def test_tamano_maximo(self):
+        """Probar que page_size se limita a PAGINACION_MAX_PAGE_SIZE"""
+        with self.settings(PAGINACION_MAX_PAGE_SIZE=3):
+            data = self.get("/api/envios/", page_size=50).json()
+        self.assertEqual(len(data["results"]), 3)
+
+    def test_paginacion_por_numero_compatible(self):
+        """Probar que ?page= mantiene la respuesta con count"""
+        data = self.get("/api/envios/", page=2, page_size=10).json()
+        self.assertEqual(data["count"], 12)
+        self.assertEqual(len(data["results"]), 2)
+
+    def test_ordering(self):
+        """Probar que ?ordering= se respeta al recorrer con el cursor"""
+        envios = list(Envio.objects.filter(empresa=self.empresa))
+        for i, envio in enumerate(envios):
+            envio.estado_actual = Envio.EstadoChoices.values[i % 3]
+        Envio.objects.bulk_update(envios, ["estado_actual"])
+
+        for ordering in ("estado_actual", "-estado_actual"):
+            descendente = ordering.startswith("-")
+            esperados = [
+                envio.id
+                for envio in sorted(
+                    envios,
+                    key=lambda envio: (envio.estado_actual, envio.id),
+                    reverse=descendente,
+                )
+            ]
+            recibidos = []
+            response = self.get("/api/envios/", page_size=5, ordering=ordering)
+            while True:
+                data = response.json()
+                self.assertNotIn("count", data)
+                recibidos += [envio["id"] for envio in data["results"]]
+                if not data["next"]:
+                    break
+                response = self.get(data["next"])
+            self.assertEqual(recibidos, esperados)
+
+    def test_busqueda_y_ordering_sin_keyset_por_paginas(self):
+        """Probar que ?search= y las ordenaciones sin keyset posible usan
+        la paginación por número de página"""
+        envio = Envio.objects.filter(empresa=self.empresa).first()
+        data = self.get("/api/envios/", search=envio.numero_guia).json()
+        self.assertEqual(data["count"], 1)
+        self.assertEqual(data["results"][0]["id"], envio.id)
+
+        data = self.get(
+            "/api/envios/",
+            page_size=5,
+            ordering="fecha_estimada_entrega,estado_actual",
+        ).json()
+        self.assertEqual(data["count"], 12)
+        self.assertIn("page=2", data["next"])
+
+    def test_cursor_invalido(self):
+        """Probar que un cursor manipulado devuelve 404"""
+        response = self.get("/api/envios/", cursor="no-es-un-cursor")
+        self.assertEqual(response.status_code, 404)
+
+    def test_historial(self):
+        """Probar la paginación por keyset del historial"""
+        data = self.get("/api/historial-estados/", page_size=10).json()
+        self.assertEqual(len(data["results"]), 10)
+        siguiente = self.get(data["next"]).json()
+        self.assertEqual(len(siguiente["results"]), 2)
+        self.assertIsNone(siguiente["next"])
@@ -0,0 +1,232 @@
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from empresas.models import Empresa
+from envios.estados import cambiar_estado_lote
+from envios.models import Envio, HistorialEstado, SnapshotRastreo
+from envios.test_importacion import fila_envio
+
+
+class RastreoCondicionalTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.empresa = Empresa.objects.create(
+            nombre="Empresa Rastreo", slug="rastreo"
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            self.envio = Envio.objects.create(
+                empresa=self.empresa, **fila_envio(peso=1)
+            )
+            HistorialEstado.objects.create(
+                envio=self.envio, estado=self.envio.estado_actual
+            )
+        self.client = APIClient()
+
+    def rastrear(self, **headers):
+        return self.client.get(
+            "/api/envios/rastrear/",
+            {"numero_guia": self.envio.numero_guia},
+            **headers,
+        )
+
+    def test_cabeceras_de_cache(self):
+        """Probar que la respuesta lleva ETag, Last-Modified y Cache-Control"""
+        response = self.rastrear()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["ETag"])
+        self.assertIn("Last-Modified", response)
+        self.assertIn("public", response["Cache-Control"])
+        self.assertIn("max-age=", response["Cache-Control"])
+
+    def test_304_sin_consultas(self):
+        """Probar que If-None-Match responde 304 sin tocar la BD"""
+        etag = self.rastrear()["ETag"]
+
+        with self.assertNumQueries(0):
+            response = self.rastrear(HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+
+        last_modified = self.rastrear()["Last-Modified"]
+        response = self.rastrear(HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+    def test_etag_por_renderer(self):
+        """Probar que JSON y MessagePack no comparten ETag"""
+        json_etag = self.rastrear()["ETag"]
+
+        response = self.rastrear(
+            HTTP_ACCEPT="application/msgpack", HTTP_IF_NONE_MATCH=json_etag
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "application/msgpack")
+        self.assertNotEqual(response["ETag"], json_etag)
+        self.assertIn("Accept", response["Vary"])
+
+        response = self.rastrear(
+            HTTP_ACCEPT="application/msgpack",
+            HTTP_IF_NONE_MATCH=response["ETag"],
+        )
+        self.assertEqual(response.status_code, 304)
+
+    def test_guia_inexistente_cacheada(self):
+        """Probar que una guía inexistente solo consulta la BD la primera
+        vez y que crear el envío reemplaza el marcador"""
+
+        def rastrear():
+            return self.client.get(
+                "/api/envios/rastrear/", {"numero_guia": "PKF-NUEVA"}
+            )
+
+        with self.assertNumQueries(2):
+            self.assertEqual(rastrear().status_code, 404)
+        with self.assertNumQueries(0):
+            self.assertEqual(rastrear().status_code, 404)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Envio.objects.create(
+                empresa=self.empresa,
+                numero_guia="PKF-NUEVA",
+                **fila_envio(peso=1),
+            )
+        self.assertEqual(rastrear().status_code, 200)
+
+    def test_cambio_de_estado_reconstruye_snapshot(self):
+        """Probar que un cambio de estado produce un ETag nuevo"""
+        etag = self.rastrear()["ETag"]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            HistorialEstado.objects.create(
+                envio=self.envio,
+                estado=Envio.EstadoChoices.EN_TRANSITO,
+            )
+
+        response = self.rastrear(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_cambio_en_lote_reconstruye_snapshot(self):
+        """Probar que el cambio de estado en lote también reconstruye"""
+        etag = self.rastrear()["ETag"]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            cambiar_estado_lote(
+                Envio.objects.filter(empresa=self.empresa),
+                Envio.EstadoChoices.EN_TRANSITO,
+                ids=[self.envio.id],
+            )
+
+        response = self.rastrear(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json()["estado"], Envio.EstadoChoices.EN_TRANSITO
+        )
+
+    def test_snapshot_tras_commit(self):
+        """Probar que crear el envío deja su snapshot en la tabla"""
+        snapshot = SnapshotRastreo.objects.get(envio=self.envio)
+        self.assertEqual(snapshot.numero_guia, self.envio.numero_guia)
+        self.assertEqual(len(snapshot.datos["historial"]), 1)
+
+        cache.clear()
+        with self.assertNumQueries(1):
+            response = self.rastrear()
+        self.assertEqual(response.json(), snapshot.datos)
+
+    def test_reconstruir_snapshots(self):
+        """Probar el comando de backfill de snapshots"""
+        SnapshotRastreo.objects.all().delete()
+
+        call_command("reconstruir_snapshots", "--lote", "1", stdout=StringIO())
+
+        self.assertTrue(
+            SnapshotRastreo.objects.filter(envio=self.envio).exists()
+        )
+
+
+class RastreoLoteTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        empresa = Empresa.objects.create(
+            nombre="Empresa Rastreo", slug="rastreo"
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            self.envios = [
+                Envio.objects.create(empresa=empresa, **fila_envio(peso=1))
+                for _ in range(3)
+            ]
+        self.client = APIClient()
+
+    def rastrear(self, numeros_guia, **headers):
+        return self.client.get(
+            "/api/envios/rastrear_lote/",
+            {"numeros_guia": ",".join(numeros_guia)},
+            **headers,
+        )
+
+    def test_resultados_en_orden_con_no_encontrados(self):
+        """Probar un resultado por guía, en orden y sin duplicados"""
+        guias = [e.numero_guia for e in self.envios]
+        response = self.rastrear([guias[2], "NOEXISTE", guias[0], guias[2]])
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["encontrados"], 2)
+        resultados = response.data["resultados"]
+        self.assertEqual(
+            [(r["numero_guia"], r["encontrado"]) for r in resultados],
+            [(guias[2], True), ("NOEXISTE", False), (guias[0], True)],
+        )
+        self.assertIn("error", resultados[1])
+        self.assertEqual(resultados[0]["estado"], self.envios[2].estado_actual)
+
+    def test_consultas_fijas(self):
+        """Probar que las guías se resuelven con un número fijo de
+        consultas, con y sin snapshots guardados"""
+        guias = [e.numero_guia for e in self.envios]
+
+        cache.clear()
+        with self.assertNumQueries(1):
+            response = self.rastrear(guias)
+        self.assertEqual(response.data["encontrados"], 3)
+
+        # Con la caché caliente no se toca la BD
+        with self.assertNumQueries(0):
+            self.rastrear(guias)
+
+        # Sin snapshots: snapshots, envíos, historial y upsert
+        cache.clear()
+        SnapshotRastreo.objects.all().delete()
+        with self.assertNumQueries(4):
+            response = self.rastrear(guias)
+        self.assertEqual(response.data["encontrados"], 3)
+        self.assertEqual(SnapshotRastreo.objects.count(), 3)
+
+    def test_etag_del_conjunto(self):
+        """Probar el 304 del lote y que un cambio en una guía lo invalida"""
+        guias = [e.numero_guia for e in self.envios]
+        etag = self.rastrear(guias)["ETag"]
+
+        response = self.rastrear(guias, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            cambiar_estado_lote(
+                Envio.objects.all(),
+                Envio.EstadoChoices.EN_TRANSITO,
+                ids=[self.envios[1].id],
+            )
+        response = self.rastrear(guias, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_validacion(self):
+        """Probar que se exige al menos una guía y se limita el total"""
+        self.assertEqual(self.rastrear([]).status_code, 400)
+        with self.settings(RASTREO_LOTE_MAX_GUIAS=2):
+            response = self.rastrear([e.numero_guia for e in self.envios])
+        self.assertEqual(response.status_code, 400)
@@ -0,0 +1,138 @@
+import json
+import logging
+import sys
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from core import registro
+from core.registro import (
+    FormateadorJSON,
+    ManejadorEnCola,
+    request_id_actual,
+)
+from empresas.models import Empresa, PerfilUsuario
+from envios.importacion import importar_envios
+from envios.test_importacion import fila_envio
+
+Usuario = get_user_model()
+
+
+@override_settings(NOTIFICACIONES_DESPACHO_EN_COMMIT=False)
+class RegistroPeticionesTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.empresa = Empresa.objects.create(
+            nombre="Empresa Registro", slug="registro"
+        )
+        self.usuario = Usuario.objects.create_user(
+            email="dueno@example.com", password="password123"
+        )
+        PerfilUsuario.objects.create(
+            usuario=self.usuario,
+            empresa=self.empresa,
+            rol=PerfilUsuario.RolChoices.DUENO,
+        )
+        importar_envios(
+            [fila_envio()], self.empresa, self.usuario, notificar=False
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+
+    def get(self, url, **extra):
+        return self.client.get(url, HTTP_X_TENANT_SLUG="registro", **extra)
+
+    def test_resumen_de_la_peticion(self):
+        """Probar un único registro por petición con el contexto completo"""
+        with self.assertLogs("peticiones", "INFO") as logs:
+            response = self.get("/api/envios/")
+
+        self.assertEqual(len(logs.records), 1)
+        registro = logs.records[0]
+        self.assertEqual(registro.estado, 200)
+        self.assertEqual(registro.tenant, "registro")
+        self.assertEqual(registro.usuario, self.usuario.pk)
+        self.assertEqual(registro.ruta, "api/envios/")
+        self.assertGreater(registro.consultas, 0)
+        self.assertGreaterEqual(registro.duracion_ms, 0)
+        self.assertEqual(registro.request_id, response["X-Request-ID"])
+
+    def test_request_id(self):
+        """Probar que se respeta un X-Request-ID válido y se genera uno
+        nuevo si no llega o no es válido"""
+        response = self.get("/api/envios/", HTTP_X_REQUEST_ID="nginx-123")
+        self.assertEqual(response["X-Request-ID"], "nginx-123")
+
+        response = self.get("/api/envios/", HTTP_X_REQUEST_ID="a b\n")
+        self.assertRegex(response["X-Request-ID"], r"^[0-9a-f]{32}$")
+        self.assertIsNone(request_id_actual.get())
+
+    @override_settings(REGISTRO_PETICIONES_MUESTREO=0)
+    def test_muestreo(self):
+        """Probar que el muestreo omite las peticiones correctas pero no
+        los errores ni las peticiones lentas"""
+        with self.assertNoLogs("peticiones", "INFO"):
+            self.get("/api/envios/")
+
+        with self.assertLogs("peticiones", "WARNING") as logs:
+            self.get("/api/envios/0/")
+        self.assertEqual(logs.records[0].estado, 404)
+
+        with self.settings(REGISTRO_PETICIONES_LENTAS_MS=0):
+            with self.assertLogs("peticiones", "WARNING") as logs:
+                self.get("/api/envios/")
+        self.assertEqual(logs.records[0].estado, 200)
+
+    def test_nivel_desactivado(self):
+        """Probar que con el logger por encima de INFO no se registra nada"""
+        with mock.patch.object(registro.logger, "log") as log:
+            with mock.patch.object(registro.logger, "level", logging.WARNING):
+                self.get("/api/envios/")
+                self.get("/api/envios/0/")
+        self.assertEqual(log.call_count, 1)
+        self.assertEqual(log.call_args.args[0], logging.WARNING)
+
+
+class FormatoJSONTest(TestCase):
+    def registro(self, mensaje, *args, **kwargs):
+        return logging.getLogger("prueba").makeRecord(
+            "prueba", logging.INFO, __file__, 1, mensaje, args, None, **kwargs
+        )
+
+    def test_formato(self):
+        """Probar una línea JSON con request_id y campos de `extra`"""
+        registro = self.registro(
+            "Hola %s", "mundo", extra={"request_id": "abc", "estado": 200}
+        )
+        datos = json.loads(FormateadorJSON().format(registro))
+
+        self.assertEqual(datos["mensaje"], "Hola mundo")
+        self.assertEqual(datos["nivel"], "INFO")
+        self.assertEqual(datos["request_id"], "abc")
+        self.assertEqual(datos["estado"], 200)
+
+    def test_manejador_en_cola(self):
+        """Probar que el manejador escribe desde el hilo del listener con
+        el request_id de la petición en curso"""
+        salida = StringIO()
+        manejador = ManejadorEnCola(stream=salida)
+        token = request_id_actual.set("req-1")
+        try:
+            try:
+                raise ValueError("fallo")
+            except ValueError:
+                registro = self.registro("Error %d", 1)
+                registro.exc_info = sys.exc_info()
+                manejador.handle(registro)
+        finally:
+            request_id_actual.reset(token)
+            manejador.close()
+
+        datos = json.loads(salida.getvalue())
+        self.assertEqual(datos["mensaje"], "Error 1")
+        self.assertEqual(datos["request_id"], "req-1")
+        self.assertIn("ValueError: fallo", datos["excepcion"])
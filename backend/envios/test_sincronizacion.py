@@ -0,0 +1,257 @@
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from empresas.models import Empresa, PerfilUsuario
+from envios.importacion import importar_envios
+from envios.models import Envio, EnvioEliminado
+from envios.sincronizacion import codificar_cursor
+from envios.test_importacion import fila_envio
+
+Usuario = get_user_model()
+
+Estado = Envio.EstadoChoices
+
+
+@override_settings(
+    NOTIFICACIONES_DESPACHO_EN_COMMIT=False,
+    SINCRONIZACION_MARGEN_SEGUNDOS=0,
+)
+class SincronizacionTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.empresa = Empresa.objects.create(
+            nombre="Empresa Sincronización", slug="sync"
+        )
+        self.operador = Usuario.objects.create_user(
+            email="operador@example.com", password="password123"
+        )
+        PerfilUsuario.objects.create(
+            usuario=self.operador,
+            empresa=self.empresa,
+            rol=PerfilUsuario.RolChoices.OPERADOR_CUBA,
+        )
+        self.remitente = Usuario.objects.create_user(
+            email="remitente@example.com", password="password123"
+        )
+        PerfilUsuario.objects.create(
+            usuario=self.remitente,
+            empresa=self.empresa,
+            rol=PerfilUsuario.RolChoices.REMITENTE,
+            telefono="+13055550000",
+        )
+        importar_envios(
+            [fila_envio() for _ in range(3)]
+            + [fila_envio(remitente_telefono="+13055550000")],
+            self.empresa,
+            self.operador,
+            notificar=False,
+        )
+        self.envios = list(Envio.objects.order_by("id"))
+        self.client = APIClient()
+        self.client.force_authenticate(self.operador)
+
+    def sincronizar(self, since=None):
+        parametros = {"since": since} if since else {}
+        response = self.client.get(
+            "/api/envios/sync/", parametros, HTTP_X_TENANT_SLUG="sync"
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def subir(self, operaciones):
+        return self.client.post(
+            "/api/envios/sync/",
+            {"operaciones": operaciones},
+            format="json",
+            HTTP_X_TENANT_SLUG="sync",
+        )
+
+    def test_cambios_incrementales(self):
+        """Probar que tras la carga inicial solo llega lo que cambia"""
+        datos = self.sincronizar()
+        self.assertEqual(len(datos["envios"]), 4)
+        self.assertEqual(len(datos["historial"]), 4)
+        self.assertEqual(datos["eliminados"], [])
+        self.assertFalse(datos["hay_mas"])
+
+        datos = self.sincronizar(datos["cursor"])
+        self.assertEqual(
+            (datos["envios"], datos["historial"], datos["eliminados"]),
+            ([], [], []),
+        )
+
+        envio, borrado = self.envios[0], self.envios[1]
+        self.client.post(
+            f"/api/envios/{envio.id}/cambiar_estado/",
+            {"estado": Estado.EN_TRANSITO},
+            format="json",
+            HTTP_X_TENANT_SLUG="sync",
+        )
+        borrado.delete()
+
+        datos = self.sincronizar(datos["cursor"])
+        self.assertEqual([e["id"] for e in datos["envios"]], [envio.id])
+        self.assertEqual(
+            [h["estado"] for h in datos["historial"]], [Estado.EN_TRANSITO]
+        )
+        self.assertEqual(
+            [e["numero_guia"] for e in datos["eliminados"]],
+            [borrado.numero_guia],
+        )
+
+    @override_settings(SINCRONIZACION_MAX_FILAS=3)
+    def test_paginas_hasta_completar(self):
+        """Probar que el cursor recorre todos los cambios por páginas"""
+        datos = self.sincronizar()
+        self.assertTrue(datos["hay_mas"])
+        ids = [e["id"] for e in datos["envios"]]
+
+        datos = self.sincronizar(datos["cursor"])
+        self.assertFalse(datos["hay_mas"])
+        ids += [e["id"] for e in datos["envios"]]
+        self.assertEqual(ids, [envio.id for envio in self.envios])
+
+    def test_margen_de_transacciones(self):
+        """Probar que los cambios más recientes que el margen esperan a la
+        siguiente sincronización"""
+        with override_settings(SINCRONIZACION_MARGEN_SEGUNDOS=60):
+            datos = self.sincronizar()
+        self.assertEqual(datos["envios"], [])
+
+        datos = self.sincronizar(datos["cursor"])
+        self.assertEqual(len(datos["envios"]), 4)
+
+    def test_alcance_por_rol(self):
+        """Probar que un remitente solo sincroniza sus envíos y borrados"""
+        self.client.force_authenticate(self.remitente)
+        propio = self.envios[3]
+        propio_id = propio.id
+
+        inicial = self.sincronizar()
+        self.assertEqual([e["id"] for e in inicial["envios"]], [propio_id])
+        self.assertEqual(len(inicial["historial"]), 1)
+
+        self.envios[0].delete()
+        propio.delete()
+        datos = self.sincronizar(inicial["cursor"])
+        self.assertEqual([e["id"] for e in datos["eliminados"]], [propio_id])
+
+    def test_cursor_invalido_o_caducado(self):
+        """Probar el rechazo de cursores inválidos y el reinicio de los
+        anteriores a la retención de borrados"""
+        response = self.client.get(
+            "/api/envios/sync/", {"since": "nada"}, HTTP_X_TENANT_SLUG="sync"
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        antiguo = timezone.now() - timedelta(days=31)
+        cursor = codificar_cursor(
+            {flujo: (antiguo, None) for flujo in ("envios", "historial")}
+            | {"eliminados": (antiguo, 7)}
+        )
+        self.assertEqual(self.sincronizar(cursor), {"reiniciar": True})
+
+    def test_subir_altas_idempotentes_y_cambios(self):
+        """Probar altas sin conexión, reenvíos y cambios encadenados sobre
+        un envío creado en el mismo lote"""
+        operaciones = [
+            {
+                "id_local": "pwa-1",
+                "tipo": "crear",
+                "datos": fila_envio(),
+            },
+            {
+                "id_local": "pwa-2",
+                "tipo": "cambiar_estado",
+                "id_cliente": "pwa-1",
+                "estado": Estado.EN_TRANSITO,
+            },
+            {
+                "id_local": "pwa-3",
+                "tipo": "crear",
+                "datos": fila_envio(peso="-1"),
+            },
+        ]
+        response = self.subir(operaciones)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        creado, cambio, error = response.data["resultados"]
+        self.assertEqual(creado["estado"], "creado")
+        self.assertEqual(creado["envio"]["id_cliente"], "pwa-1")
+        self.assertEqual(cambio["estado"], "aplicado")
+        self.assertEqual(cambio["envio"]["estado_actual"], Estado.EN_TRANSITO)
+        self.assertEqual(error["estado"], "error")
+        self.assertIn("peso", error["errores"])
+
+        # Reenvío del mismo lote (p. ej. se perdió la respuesta)
+        response = self.subir(operaciones[:2])
+        creado, cambio = response.data["resultados"]
+        self.assertEqual(creado["estado"], "duplicado")
+        self.assertEqual(cambio["estado"], "sin_cambios")
+        self.assertEqual(Envio.objects.filter(id_cliente="pwa-1").count(), 1)
+
+    def test_subir_detecta_conflictos(self):
+        """Probar que un cambio hecho sobre una versión antigua no se
+        aplica y devuelve el envío del servidor"""
+        envio = self.envios[0]
+        version = envio.ultima_actualizacion
+        self.client.post(
+            f"/api/envios/{envio.id}/cambiar_estado/",
+            {"estado": Estado.EN_TRANSITO},
+            format="json",
+            HTTP_X_TENANT_SLUG="sync",
+        )
+
+        response = self.subir(
+            [
+                {
+                    "id_local": "pwa-1",
+                    "tipo": "cambiar_estado",
+                    "numero_guia": envio.numero_guia,
+                    "estado": Estado.DEVUELTO,
+                    "version": version.isoformat(),
+                },
+                {
+                    "id_local": "pwa-2",
+                    "tipo": "cambiar_estado",
+                    "id": envio.id,
+                    "estado": Estado.EN_REPARTO,
+                },
+            ]
+        )
+        conflicto, aplicado = response.data["resultados"]
+        self.assertEqual(conflicto["estado"], "conflicto")
+        self.assertEqual(
+            conflicto["envio"]["estado_actual"], Estado.EN_TRANSITO
+        )
+        self.assertEqual(aplicado["estado"], "aplicado")
+
+        response = self.subir([{"id_local": "x", "tipo": "cambiar_estado"}])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        self.client.force_authenticate(self.remitente)
+        response = self.subir(
+            [{"id_local": "x", "tipo": "crear", "datos": fila_envio()}]
+        )
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_purgar_eliminados(self):
+        """Probar que la purga solo borra marcas anteriores a la retención"""
+        antiguo, reciente = (envio.id for envio in self.envios[:2])
+        self.envios[0].delete()
+        self.envios[1].delete()
+        EnvioEliminado.objects.filter(envio_id=antiguo).update(
+            fecha=timezone.now() - timedelta(days=40)
+        )
+
+        call_command("purgar_eliminados", stdout=open("/dev/null", "w"))
+        self.assertEqual(
+            list(EnvioEliminado.objects.values_list("envio_id", flat=True)),
+            [reciente],
+        )
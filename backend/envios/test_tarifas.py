@@ -0,0 +1,183 @@
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.test import TestCase, override_settings
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from empresas.models import Empresa, PerfilUsuario
+from empresas.tenancy import tenant_registry
+from envios.importacion import importar_envios
+from envios.models import Envio
+from envios.tarifas import Tarifa, obtener_tarifa
+from envios.test_importacion import fila_envio
+
+Usuario = get_user_model()
+
+
+class TarifaTest(TestCase):
+    def setUp(self):
+        self.tarifa = Tarifa()
+
+    def test_tramos_por_peso(self):
+        """Probar el precio base por tramo y por kg adicional"""
+        casos = {
+            "0.5": "8.50",
+            "1": "8.50",
+            "1.01": "15.00",
+            "20": "85.00",
+            "25": "107.50",
+        }
+        for peso, esperado in casos.items():
+            self.assertEqual(
+                self.tarifa.precio_base(Decimal(peso)), Decimal(esperado)
+            )
+
+    def test_cotizar_con_volumetrico_seguro_y_moneda(self):
+        """Probar peso volumétrico, recargos y conversión de moneda"""
+        cotizacion = self.tarifa.cotizar(
+            Decimal("1"),
+            largo=Decimal("50"),
+            ancho=Decimal("40"),
+            alto=Decimal("30"),
+            seguro=True,
+        )
+        self.assertEqual(cotizacion["peso_facturable"], Decimal("12.00"))
+        self.assertEqual(cotizacion["base"], Decimal("85.00"))
+        self.assertEqual(cotizacion["manejo"], Decimal("12.75"))
+        self.assertEqual(cotizacion["seguro"], Decimal("4.25"))
+        self.assertEqual(cotizacion["total"], Decimal("102.00"))
+
+        cotizacion = self.tarifa.cotizar(Decimal("0.5"), moneda="CUP")
+        self.assertEqual(cotizacion["base"], Decimal("2720.00"))
+        self.assertEqual(cotizacion["total"], Decimal("3128.00"))
+
+        with self.assertRaises(ValueError):
+            self.tarifa.cotizar(Decimal("1"), moneda="JPY")
+
+    def test_configuracion_invalida(self):
+        """Probar que una tarifa mal configurada se rechaza al compilar"""
+        for configuracion in (
+            {"tramos": []},
+            {"tramos": [{"hasta": 1}]},
+            {"precio_kg_adicional": "gratis"},
+            {"divisor_volumetrico": 0},
+        ):
+            with self.assertRaises(ImproperlyConfigured):
+                Tarifa(configuracion)
+
+
+@override_settings(NOTIFICACIONES_DESPACHO_EN_COMMIT=False)
+class CotizacionAPITest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.empresa = Empresa.objects.create(
+            nombre="Empresa Tarifas",
+            slug="tarifas",
+            configuracion={
+                "tarifas": {
+                    "tramos": [
+                        {"hasta": 2, "precio": "10.00"},
+                        {"hasta": 10, "precio": "30.00"},
+                    ],
+                    "precio_kg_adicional": "2.00",
+                    "manejo_porcentaje": "10",
+                }
+            },
+        )
+        self.usuario = Usuario.objects.create_user(
+            email="operador@example.com", password="password123"
+        )
+        PerfilUsuario.objects.create(
+            usuario=self.usuario,
+            empresa=self.empresa,
+            rol=PerfilUsuario.RolChoices.OPERADOR_MIAMI,
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+
+    def cotizar(self, datos):
+        return self.client.post(
+            "/api/envios/cotizar/",
+            datos,
+            format="json",
+            HTTP_X_TENANT_SLUG="tarifas",
+        )
+
+    def test_cotizar_lote(self):
+        """Probar la cotización de varios paquetes con la tarifa propia"""
+        response = self.cotizar(
+            {
+                "paquetes": [
+                    {"ref": "A", "peso": "1.5"},
+                    {"ref": "B", "peso": "12", "seguro": True},
+                ]
+            }
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["moneda"], "USD")
+        a, b = response.data["cotizaciones"]
+        self.assertEqual((a["ref"], a["total"]), ("A", "11.00"))
+        # 30 + 2 kg × 2.00 = 34; manejo 10 %, seguro 5 %
+        self.assertEqual((b["ref"], b["base"]), ("B", "34.00"))
+        self.assertEqual(b["total"], "39.10")
+        self.assertEqual(response.data["total"], "50.10")
+
+    def test_cotizar_errores(self):
+        """Probar moneda no soportada, paquetes inválidos y exceso de
+        paquetes"""
+        response = self.cotizar({"paquetes": [{"peso": "1"}], "moneda": "jpy"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("moneda", response.data)
+
+        response = self.cotizar({"paquetes": [{"peso": "0"}]})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.cotizar({"paquetes": [{"peso": "1"}] * 1001})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_precio_al_crear_e_importar(self):
+        """Probar que los envíos guardan el precio de la tarifa"""
+        response = self.client.post(
+            "/api/envios/",
+            fila_envio(peso="1.00"),
+            format="json",
+            HTTP_X_TENANT_SLUG="tarifas",
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data["precio"], "11.00")
+
+        response = self.client.patch(
+            f"/api/envios/{response.data['id']}/",
+            {"peso": "5.00"},
+            format="json",
+            HTTP_X_TENANT_SLUG="tarifas",
+        )
+        self.assertEqual(response.data["precio"], "33.00")
+
+        importar_envios(
+            [fila_envio(peso="3.00")],
+            self.empresa,
+            self.usuario,
+            notificar=False,
+        )
+        self.assertEqual(
+            Envio.objects.order_by("-id").first().precio, Decimal("33.00")
+        )
+
+    def test_tarifa_se_recompila_al_cambiar_la_empresa(self):
+        """Probar que la tarifa compilada se renueva al guardar la empresa"""
+        empresa = tenant_registry.get_by_slug("tarifas")
+        tarifa = obtener_tarifa(empresa)
+        self.assertIs(obtener_tarifa(empresa), tarifa)
+
+        self.empresa.configuracion["tarifas"]["tramos"][0]["precio"] = "12"
+        self.empresa.save()
+
+        empresa = tenant_registry.get_by_slug("tarifas")
+        self.assertEqual(
+            obtener_tarifa(empresa).precio_base(Decimal("1")), Decimal("12")
+        )
@@ -0,0 +1,174 @@
+from types import SimpleNamespace
+from unittest import mock
+
+from django.core.cache import cache
+from django.http import QueryDict
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from core.throttling import PublicoIPThrottle
+from empresas.models import Empresa
+from envios.models import Envio
+from envios.test_importacion import fila_envio
+
+TASAS = {
+    "publico_ip": "100/hour",
+    "publico_ip_rafaga": "3/min",
+    "rastreo_guia": "5/min",
+}
+
+
+@override_settings(
+    REST_FRAMEWORK={
+        "DEFAULT_THROTTLE_RATES": TASAS,
+        "NUM_PROXIES": 0,
+        "DEFAULT_PAGINATION_CLASS": "rest_framework.pagination.PageNumberPagination",
+        "PAGE_SIZE": 10,
+    }
+)
+class ThrottlingPublicoTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        empresa = Empresa.objects.create(
+            nombre="Empresa Rastreo", slug="rastreo"
+        )
+        self.envio = Envio.objects.create(
+            empresa=empresa, **fila_envio(peso=1)
+        )
+
+    def rastrear(self, ip, numero_guia=None):
+        return APIClient().get(
+            "/api/envios/rastrear/",
+            {"numero_guia": numero_guia or self.envio.numero_guia},
+            REMOTE_ADDR=ip,
+        )
+
+    def test_limite_de_rafaga_por_ip(self):
+        """Probar que una IP que supera la ráfaga recibe 429"""
+        for _ in range(3):
+            self.assertEqual(self.rastrear("10.0.0.1").status_code, 200)
+
+        response = self.rastrear("10.0.0.1")
+        self.assertEqual(response.status_code, 429)
+        self.assertIn("Retry-After", response)
+
+        # Otra IP no se ve afectada
+        self.assertEqual(self.rastrear("10.0.0.2").status_code, 200)
+
+    def test_x_forwarded_for_falsificado(self):
+        """Probar que cambiar X-Forwarded-For no da un límite nuevo: sin
+        proxies de confianza cuenta REMOTE_ADDR y, con nginx delante, solo
+        la dirección que añade el proxy"""
+        client = APIClient()
+        respuestas = [
+            client.get(
+                "/api/envios/buscar_por_remitente/",
+                {"nombre": "Remitente"},
+                REMOTE_ADDR="10.0.6.1",
+                HTTP_X_FORWARDED_FOR=f"192.168.0.{i}",
+            ).status_code
+            for i in range(4)
+        ]
+        self.assertEqual(respuestas, [200, 200, 200, 429])
+
+        cache.clear()
+        with self.settings(
+            REST_FRAMEWORK={"DEFAULT_THROTTLE_RATES": TASAS, "NUM_PROXIES": 1}
+        ):
+            respuestas = [
+                client.get(
+                    "/api/envios/buscar_por_remitente/",
+                    {"nombre": "Remitente"},
+                    REMOTE_ADDR="172.18.0.5",
+                    HTTP_X_FORWARDED_FOR=f"192.168.0.{i}, 203.0.113.7",
+                ).status_code
+                for i in range(4)
+            ]
+        self.assertEqual(respuestas, [200, 200, 200, 429])
+
+    def test_limite_por_guia(self):
+        """Probar el límite por número de guía desde IPs distintas"""
+        for i in range(5):
+            self.assertEqual(self.rastrear(f"10.0.1.{i}").status_code, 200)
+
+        self.assertEqual(self.rastrear("10.0.1.99").status_code, 429)
+        # Otra guía sigue disponible
+        self.assertEqual(
+            self.rastrear("10.0.1.99", "NOEXISTE").status_code, 404
+        )
+
+    def test_rechazadas_no_consumen_limite_de_guia(self):
+        """Probar que las peticiones que rechaza el límite por IP no agotan
+        el límite de la guía para otras IPs"""
+        for _ in range(10):
+            self.rastrear("10.0.7.1")
+
+        # 3 de 5 consultas de la guía consumidas por 10.0.7.1
+        for i in range(2):
+            self.assertEqual(self.rastrear(f"10.0.7.{i + 2}").status_code, 200)
+        self.assertEqual(self.rastrear("10.0.7.9").status_code, 429)
+
+    def test_lote_cuenta_cada_guia(self):
+        """Probar que el rastreo en lote consume una unidad por guía de los
+        mismos límites que el rastreo individual"""
+        otro = Envio.objects.create(
+            empresa=self.envio.empresa, **fila_envio(peso=1)
+        )
+        guias = f"{self.envio.numero_guia},{otro.numero_guia}"
+        client = APIClient()
+
+        response = client.get(
+            "/api/envios/rastrear_lote/",
+            {"numeros_guia": guias},
+            REMOTE_ADDR="10.0.4.1",
+        )
+        self.assertEqual(response.status_code, 200)
+        # 2 de 3 unidades de ráfaga consumidas: queda una consulta
+        self.assertEqual(self.rastrear("10.0.4.1").status_code, 200)
+        self.assertEqual(self.rastrear("10.0.4.1").status_code, 429)
+
+        # El límite por guía se comparte con el rastreo individual
+        for i in range(3):
+            self.rastrear(f"10.0.5.{i}")
+        response = client.get(
+            "/api/envios/rastrear_lote/",
+            {"numeros_guia": guias},
+            REMOTE_ADDR="10.0.5.99",
+        )
+        self.assertEqual(response.status_code, 429)
+
+    def test_busqueda_publica_limitada(self):
+        """Probar que las búsquedas públicas comparten el límite por IP"""
+        client = APIClient()
+        for _ in range(3):
+            client.get(
+                "/api/envios/buscar_por_remitente/",
+                {"nombre": "Remitente"},
+                REMOTE_ADDR="10.0.2.1",
+            )
+
+        response = client.get(
+            "/api/envios/buscar_por_destinatario/",
+            {"nombre": "Destinatario"},
+            REMOTE_ADDR="10.0.2.1",
+        )
+        self.assertEqual(response.status_code, 429)
+
+    def test_ventana_deslizante(self):
+        """Probar que la ventana anterior pondera según el tiempo pasado"""
+        throttle = PublicoIPThrottle()
+        request = SimpleNamespace(
+            META={"REMOTE_ADDR": "10.0.3.1"}, query_params=QueryDict()
+        )
+        limite = throttle.num_requests
+
+        with mock.patch.object(throttle, "timer", return_value=3600 * 10):
+            for _ in range(limite):
+                self.assertTrue(throttle.allow_request(request, None))
+
+        # A mitad de la ventana siguiente solo cuenta la mitad de la anterior
+        with mock.patch.object(throttle, "timer", return_value=3600 * 11.5):
+            for _ in range(limite // 2):
+                self.assertTrue(throttle.allow_request(request, None))
+            self.assertFalse(throttle.allow_request(request, None))
+            self.assertGreater(throttle.wait(), 0)
@@ -1,10 +1,19 @@
-from django.test import TestCase
+from unittest import mock
+from django.test import TestCase, override_settings
 from django.core import mail
 from django.contrib.auth import get_user_model
-from envios.models import Envio, HistorialEstado
-from envios.notifications import enviar_notificacion_estado
+from envios.models import Envio, HistorialEstado, NotificacionEmail
+from envios.notifications import (
+    despachar_notificaciones,
+    encolar_notificacion_estado,
+    enviar_notificacion_estado,
+)
 from django.utils import timezone
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from datetime import timedelta
+from empresas.models import Empresa
+from envios.guias import asignar_numeros_guia
 
 Usuario = get_user_model()
 
@@ -88,3 +97,134 @@ class NotificacionesTest(TestCase):
         # Verificar que no se envió ninguna notificación
         self.assertFalse(resultado)
         self.assertEqual(len(mail.outbox), 0)
+
+
+class NumerosGuiaTest(TestCase):
+    def setUp(self):
+        self.empresa = Empresa.objects.create(
+            nombre='Empresa Guías',
+            slug='guias',
+            configuracion={'prefijo_guia': 'HAV'}
+        )
+
+    def crear_envio(self, empresa):
+        return Envio.objects.create(
+            empresa=empresa,
+            descripcion='Envío de prueba para guías',
+            peso=1.0,
+            remitente_nombre='Remitente Prueba',
+            remitente_direccion='Dirección Remitente',
+            remitente_telefono='+13055551234',
+            destinatario_nombre='Destinatario Prueba',
+            destinatario_direccion='Dirección Destinatario',
+            destinatario_telefono='+5355654321',
+        )
+
+    def test_numeros_unicos_con_prefijo_empresa(self):
+        """Probar que cada envío recibe un número distinto con su prefijo"""
+        otra_empresa = Empresa.objects.create(nombre='Empresa Sin Prefijo')
+
+        primero = self.crear_envio(self.empresa)
+        segundo = self.crear_envio(otra_empresa)
+
+        self.assertTrue(primero.numero_guia.startswith('HAV'))
+        self.assertTrue(segundo.numero_guia.startswith('PKF'))
+        self.assertEqual(
+            int(segundo.numero_guia[-8:]), int(primero.numero_guia[-8:]) + 1
+        )
+
+    def test_reserva_de_bloques(self):
+        """Probar la pre-asignación de un rango para importaciones masivas"""
+        bloque = asignar_numeros_guia(5, self.empresa)
+        envio = self.crear_envio(self.empresa)
+
+        self.assertEqual(len(set(bloque)), 5)
+        self.assertNotIn(envio.numero_guia, bloque)
+        self.assertEqual(int(envio.numero_guia[-8:]), int(bloque[-1][-8:]) + 1)
+
+    def test_sin_consulta_al_ultimo_envio(self):
+        """Probar que asignar la guía no lee la tabla de envíos"""
+        with CaptureQueriesContext(connection) as contexto:
+            self.crear_envio(self.empresa)
+
+        self.assertFalse(
+            any('FROM "envios_envio"' in q['sql'] for q in contexto.captured_queries)
+        )
+
+
+@override_settings(NOTIFICACIONES_DESPACHO_EN_COMMIT=False)
+class BandejaSalidaTest(TestCase):
+    def setUp(self):
+        self.empresa = Empresa.objects.create(nombre='Empresa Outbox')
+        self.envio = Envio.objects.create(
+            empresa=self.empresa,
+            descripcion='Envío de prueba para la bandeja de salida',
+            peso=5.0,
+            remitente_nombre='Remitente Prueba',
+            remitente_direccion='Dirección Remitente',
+            remitente_telefono='+13055551234',
+            remitente_email='remitente@example.com',
+            destinatario_nombre='Destinatario Prueba',
+            destinatario_direccion='Dirección Destinatario',
+            destinatario_telefono='+5355654321',
+            destinatario_email='destinatario@example.com',
+        )
+        mail.outbox = []
+
+    def test_encolar_no_envia_emails(self):
+        """Probar que encolar solo escribe en la bandeja de salida"""
+        creadas = encolar_notificacion_estado(self.envio)
+
+        self.assertEqual(creadas, 2)
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(
+            NotificacionEmail.objects.filter(
+                estado=NotificacionEmail.EstadoChoices.PENDIENTE
+            ).count(),
+            2
+        )
+
+    def test_despachar_lote(self):
+        """Probar que el despacho envía y marca las notificaciones"""
+        encolar_notificacion_estado(self.envio)
+
+        resultado = despachar_notificaciones()
+
+        self.assertEqual(resultado['enviadas'], 2)
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertFalse(
+            NotificacionEmail.objects.exclude(
+                estado=NotificacionEmail.EstadoChoices.ENVIADA
+            ).exists()
+        )
+        # Nada pendiente en una segunda pasada
+        self.assertEqual(despachar_notificaciones()['enviadas'], 0)
+
+    def test_reintento_con_backoff(self):
+        """Probar que un fallo de SMTP programa un reintento"""
+        encolar_notificacion_estado(self.envio)
+
+        with mock.patch(
+            'django.core.mail.backends.locmem.EmailBackend.send_messages',
+            side_effect=OSError('SMTP caído'),
+        ):
+            resultado = despachar_notificaciones()
+
+        self.assertEqual(resultado['reintentos'], 2)
+        notificacion = NotificacionEmail.objects.first()
+        self.assertEqual(notificacion.intentos, 1)
+        self.assertEqual(notificacion.estado, NotificacionEmail.EstadoChoices.PENDIENTE)
+        self.assertGreater(notificacion.proximo_intento, timezone.now())
+        self.assertIn('SMTP caído', notificacion.ultimo_error)
+
+    def test_encolado_despachado_tras_commit(self):
+        """Probar que el despacho se programa para después del commit"""
+        with override_settings(NOTIFICACIONES_DESPACHO_EN_COMMIT=True):
+            with mock.patch(
+                'envios.notifications.despachar_en_segundo_plano'
+            ) as despachar:
+                with self.captureOnCommitCallbacks(execute=True):
+                    encolar_notificacion_estado(self.envio)
+                    despachar.assert_not_called()
+
+        despachar.assert_called_once()
@@ -1,17 +1,69 @@
+import csv
+import hashlib
+from decimal import Decimal
+
+from core.campos import campo_incluido
+from core.pagination import KeysetPagination
+from core.throttling import (
+    PublicoIPRafagaThrottle,
+    PublicoIPThrottle,
+    RastreoGuiaThrottle,
+    guias_rastreo,
+    max_guias_lote,
+)
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
 from django.db import transaction
+from django.db.models import Prefetch
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.cache import (
+    get_conditional_response,
+    patch_cache_control,
+    patch_vary_headers,
+    quote_etag,
+)
+from django.utils.http import http_date
 from empresas.permissions import TenantPermission, require_rol
 from rest_framework import filters, permissions, status, viewsets
 from rest_framework.decorators import action, permission_classes
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
 from usuarios.permissions import EsAdministrador, EsCreadorOAdministrador
+from usuarios.serializers import prefetch_perfiles_activos
 
-from .models import Envio, HistorialEstado
-from .notifications import enviar_notificacion_estado
+from .busqueda import (
+    PESO_DESTINATARIO,
+    PESO_REMITENTE,
+    EnvioSearchFilter,
+    buscar_envios,
+)
+from .estados import cambiar_estado_lote
+from .etiquetas import DISENOS, pdf_etiquetas, png_etiqueta, png_qr
+from .eventos import publicar_cambios_estado
+from .exportacion import FORMATOS, exportar, iterar_async
+from .importacion import importar_envios, leer_csv
+from .models import Envio, EnvioEliminado, HistorialEstado
+from .pagination import HistorialPagination
+from .rastreo import obtener_snapshot, obtener_snapshots
+from .sse import crear_ticket
+from .sincronizacion import (
+    aplicar_operaciones,
+    cambios_desde,
+    cursor_caducado,
+    leer_cursor,
+)
+from .tarifas import obtener_tarifa, precio_envio
+from .notifications import encolar_notificacion_estado
 from .serializers import (
+    CambioEstadoLoteSerializer,
     CambioEstadoSerializer,
+    CotizacionLoteSerializer,
+    EnvioListSerializer,
     EnvioSerializer,
+    EtiquetasLoteSerializer,
     HistorialEstadoSerializer,
+    SincronizacionSerializer,
 )
 
 
@@ -24,14 +76,9 @@ class EnvioViewSet(viewsets.ModelViewSet):
         Envio.objects.all()
     )  # Queryset base (será filtrado por get_queryset)
     serializer_class = EnvioSerializer
-    filter_backends = [filters.SearchFilter, filters.OrderingFilter]
-    search_fields = [
-        "numero_guia",
-        "estado_actual",
-        "remitente_nombre",
-        "destinatario_nombre",
-        "descripcion",
-    ]
+    pagination_class = KeysetPagination
+    # ?search= usa la búsqueda full-text (campos en CAMPOS_POR_PESO)
+    filter_backends = [EnvioSearchFilter, filters.OrderingFilter]
     ordering_fields = [
         "fecha_creacion",
         "fecha_estimada_entrega",
@@ -50,56 +97,115 @@ class EnvioViewSet(viewsets.ModelViewSet):
         if not hasattr(self.request, "tenant") or not self.request.tenant:
             return Envio.objects.none()
 
-        # Queryset base filtrado por empresa
-        queryset = Envio.objects.filter(empresa=self.request.tenant)
+        perfil = getattr(self.request, "perfil_usuario", None)
+        return self._precargar_relaciones(
+            Envio.objects.para_perfil(perfil, empresa=self.request.tenant)
+        )
 
-        # Si no hay perfil de usuario, usar queryset base
-        if (
-            not hasattr(self.request, "perfil_usuario")
-            or not self.request.perfil_usuario
-        ):
+    def _precargar_relaciones(self, queryset):
+        """
+        Precarga las relaciones que serializa la acción actual para que el
+        número de consultas no dependa del tamaño de la página:
+        - Usuarios creador/actualizador y sus perfiles activos
+        - Historial con su usuario (en las vistas de detalle, o en el
+          listado con ?expand=historial)
+        Las relaciones que ?fields=/?omit= dejan fuera no se precargan.
+
+        El cambio de estado en lote (también el de la sincronización)
+        bloquea las filas y la exportación lee solo columnas del envío, así
+        que usan el queryset sin precargas. Las etiquetas solo necesitan la
+        empresa.
+        """
+        if self.action in [
+            "cambiar_estado_lote",
+            "exportar",
+            "subir_cambios",
+        ]:
             return queryset
+        if self.action in ["qr", "etiqueta", "etiquetas"]:
+            return queryset.select_related("empresa")
 
-        perfil = self.request.perfil_usuario
+        for usuario in ["creado_por", "actualizado_por"]:
+            if campo_incluido(self.request, usuario):
+                queryset = queryset.select_related(usuario).prefetch_related(
+                    prefetch_perfiles_activos(f"{usuario}__perfiles_empresa")
+                )
 
-        # Filtrado según el rol del usuario
-        if perfil.es_dueno or perfil.puede_gestionar_envios:
-            # Dueño y operadores ven todos los envíos de la empresa
-            return queryset
-        elif perfil.rol == "remitente":
-            # Remitentes solo ven envíos que han enviado
-            return queryset.filter(remitente_telefono=perfil.telefono)
-        elif perfil.rol == "destinatario":
-            # Destinatarios solo ven envíos dirigidos a ellos
-            return queryset.filter(destinatario_telefono=perfil.telefono)
-        else:
-            # Por defecto, todos los envíos (para roles no específicos)
-            return queryset
+        detalle = self.action in [
+            "retrieve",
+            "update",
+            "partial_update",
+            "buscar_por_guia",
+        ]
+        if campo_incluido(self.request, "historial", por_defecto=detalle):
+            queryset = queryset.prefetch_related(
+                Prefetch(
+                    "historial",
+                    queryset=HistorialEstado.objects.select_related(
+                        "registrado_por"
+                    ).prefetch_related(
+                        prefetch_perfiles_activos(
+                            "registrado_por__perfiles_empresa"
+                        )
+                    ),
+                )
+            )
+
+        return queryset
+
+    def get_serializer_class(self):
+        """
+        Los listados usan una representación ligera sin historial
+        """
+        if self.action == "list":
+            return EnvioListSerializer
+        return EnvioSerializer
 
     def get_permissions(self):
         """
         Personalización de permisos multi-tenant con restricciones por rol:
         - Endpoints públicos: Rastreo sin autenticación
-        - Lectura (list, retrieve): Según rol del usuario
+        - Lectura (list, retrieve, exportar, qr, etiqueta, sync): Según rol
+        - Cotización: Todos los usuarios de la empresa
+        - Etiquetas en lote y subida de cambios sin conexión: Solo
+          operadores y dueño
         - Escritura (create, update, delete): Solo operadores y dueño
         - Cambio de estado: Solo operadores y dueño
         """
         if self.action in [
             "rastrear",
+            "rastrear_lote",
             "buscar_por_remitente",
             "buscar_por_destinatario",
         ]:
             # Endpoints públicos sin autenticación
             permission_classes = [AllowAny]
-        elif self.action in ["list", "retrieve", "buscar_por_guia"]:
+        elif self.action in [
+            "list",
+            "retrieve",
+            "buscar_por_guia",
+            "exportar",
+            "cotizar",
+            "qr",
+            "etiqueta",
+            "sincronizar",
+        ]:
             # Lectura: Todos los usuarios autenticados con tenant
             permission_classes = [TenantPermission]
-        elif self.action in ["create"]:
+        elif self.action in ["create", "importar"]:
             # Crear envíos: Solo operadores de Miami y dueño
             from empresas.permissions import EmpresaOperatorPermission
 
             permission_classes = [TenantPermission, EmpresaOperatorPermission]
-        elif self.action in ["update", "partial_update", "cambiar_estado"]:
+        elif self.action in [
+            "update",
+            "partial_update",
+            "cambiar_estado",
+            "cambiar_estado_lote",
+            "etiquetas",
+            "subir_cambios",
+            "eventos_ticket",
+        ]:
             # Actualizar/cambiar estado: Solo operadores y dueño
             from empresas.permissions import EmpresaOperatorPermission
 
@@ -113,19 +219,7 @@ class EnvioViewSet(viewsets.ModelViewSet):
             permission_classes = [TenantPermission]
         return [permission() for permission in permission_classes]
 
-    def get_client_ip(self, request):
-        """
-        Obtiene la dirección IP real del cliente, considerando proxies
-        """
-        x_forwarded_for = request.META.get("HTTP_X_FORWARDED_FOR")
-        if x_forwarded_for:
-            # Tomar la primera IP en la cadena de proxies
-            ip = x_forwarded_for.split(",")[0].strip()
-        else:
-            ip = request.META.get("REMOTE_ADDR")
-        return ip
-
-    def perform_create(self, serializer):
+    def perform_create(self, serializer, **extra):
         """
         Al crear un envío, registramos el usuario que lo creó y
         asignamos la empresa del contexto actual
@@ -136,6 +230,10 @@ class EnvioViewSet(viewsets.ModelViewSet):
                 creado_por=self.request.user,
                 actualizado_por=self.request.user,
                 empresa=self.request.tenant,  # Asignar empresa del contexto
+                precio=precio_envio(
+                    self.request.tenant, serializer.validated_data["peso"]
+                ),
+                **extra,
             )
 
             # Crear el primer registro en el historial
@@ -146,14 +244,23 @@ class EnvioViewSet(viewsets.ModelViewSet):
                 registrado_por=self.request.user,
             )
 
-            # Enviar notificación de creación
-            enviar_notificacion_estado(envio)
+            # Encolar notificación de creación (se envía tras el commit)
+            encolar_notificacion_estado(envio)
+
+            # Publicar el evento para los clientes SSE
+            publicar_cambios_estado([(envio, None)])
 
     def perform_update(self, serializer):
         """
         Al actualizar un envío, registramos el usuario que lo actualizó
+        y recalculamos el precio si cambia el peso
         """
-        serializer.save(actualizado_por=self.request.user)
+        extra = {}
+        if "peso" in serializer.validated_data:
+            extra["precio"] = precio_envio(
+                serializer.instance.empresa, serializer.validated_data["peso"]
+            )
+        serializer.save(actualizado_por=self.request.user, **extra)
 
     @action(detail=True, methods=["post"])
     def cambiar_estado(self, request, pk=None):
@@ -162,35 +269,403 @@ class EnvioViewSet(viewsets.ModelViewSet):
         """
         envio = self.get_object()
         serializer = CambioEstadoSerializer(data=request.data)
-        if serializer.is_valid():
-            estado = serializer.validated_data["estado"]
-            comentario = serializer.validated_data.get("comentario", "")
-            ubicacion = serializer.validated_data.get("ubicacion", "")
-
-            # Guardar el estado anterior para las notificaciones
-            estado_anterior = envio.estado_actual
-
-            with transaction.atomic():
-                # Actualizar el estado del envío
-                envio.estado_actual = estado
-                envio.actualizado_por = request.user
-                envio.save()
-
-                # Crear registro en el historial
-                HistorialEstado.objects.create(
-                    envio=envio,
-                    estado=estado,
-                    comentario=comentario,
-                    ubicacion=ubicacion,
-                    registrado_por=request.user,
+        if not serializer.is_valid():
+            return Response(
+                serializer.errors, status=status.HTTP_400_BAD_REQUEST
+            )
+
+        # Mismas reglas de transición, historial, notificaciones y eventos
+        # que el cambio en lote
+        datos = serializer.validated_data
+        resultado = cambiar_estado_lote(
+            self.get_queryset(),
+            datos["estado"],
+            ids=[envio.id],
+            comentario=datos.get("comentario", ""),
+            ubicacion=datos.get("ubicacion", ""),
+            usuario=request.user,
+        )["resultados"][0]
+        if "error" in resultado:
+            return Response(
+                {"error": resultado["error"]},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        # Devolver el envío actualizado
+        return Response(EnvioSerializer(self.get_object()).data)
+
+    @action(detail=False, methods=["post"])
+    def cambiar_estado_lote(self, request):
+        """
+        Endpoint para aplicar un mismo cambio de estado a muchos envíos.
+        Los envíos se identifican por 'numeros_guia' y/o 'ids'; la respuesta
+        incluye el resultado (o el error) de cada uno.
+        """
+        serializer = CambioEstadoLoteSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(
+                serializer.errors, status=status.HTTP_400_BAD_REQUEST
+            )
+
+        datos = serializer.validated_data
+        resultado = cambiar_estado_lote(
+            self.get_queryset(),
+            datos["estado"],
+            numeros_guia=datos.get("numeros_guia", []),
+            ids=datos.get("ids", []),
+            comentario=datos.get("comentario", ""),
+            ubicacion=datos.get("ubicacion", ""),
+            usuario=request.user,
+        )
+        return Response(resultado)
+
+    @action(detail=False, methods=["post"])
+    def importar(self, request):
+        """
+        Endpoint para importar un manifiesto de envíos en bloque.
+        Acepta un array JSON de envíos o un archivo CSV en el campo 'archivo'.
+        Devuelve los envíos creados y los errores por fila.
+        """
+        archivo = request.FILES.get("archivo")
+        if archivo:
+            try:
+                filas = leer_csv(archivo)
+            except UnicodeDecodeError:
+                return Response(
+                    {"error": "El archivo CSV debe estar codificado en UTF-8"},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+            except csv.Error as e:
+                return Response(
+                    {
+                        "error": f"El archivo CSV no tiene un formato válido: {e}"
+                    },
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+        elif isinstance(request.data, list):
+            filas = request.data
+        else:
+            return Response(
+                {
+                    "error": "Se requiere un array JSON de envíos o un archivo CSV en 'archivo'"
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        max_filas = getattr(settings, "ENVIOS_IMPORTACION_MAX_FILAS", 10000)
+        if not filas:
+            return Response(
+                {"error": "El manifiesto no contiene envíos"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if len(filas) > max_filas:
+            return Response(
+                {
+                    "error": f"El manifiesto excede el máximo de {max_filas} envíos"
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        resultado = importar_envios(
+            filas, empresa=request.tenant, usuario=request.user
+        )
+
+        if not resultado["creados"]:
+            return Response(resultado, status=status.HTTP_400_BAD_REQUEST)
+        return Response(resultado, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=["post"])
+    def cotizar(self, request):
+        """
+        Endpoint para cotizar uno o varios paquetes con la tarifa de la
+        empresa. Recibe {"paquetes": [{"peso", "largo", "ancho", "alto",
+        "seguro", "ref"}, ...], "moneda"} y devuelve el desglose de cada
+        paquete y el total.
+        """
+        serializer = CotizacionLoteSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(
+                serializer.errors, status=status.HTTP_400_BAD_REQUEST
+            )
+
+        datos = serializer.validated_data
+        tarifa = obtener_tarifa(request.tenant)
+        moneda = datos.get("moneda") or tarifa.moneda
+        if moneda not in tarifa.tasas_cambio:
+            return Response(
+                {"moneda": [f"Moneda no soportada: {moneda}"]},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        cotizaciones = []
+        for paquete in datos["paquetes"]:
+            cotizacion = tarifa.cotizar(
+                paquete["peso"],
+                largo=paquete.get("largo"),
+                ancho=paquete.get("ancho"),
+                alto=paquete.get("alto"),
+                seguro=paquete["seguro"],
+                moneda=moneda,
+            )
+            if "ref" in paquete:
+                cotizacion = {"ref": paquete["ref"], **cotizacion}
+            cotizaciones.append(cotizacion)
+
+        # Importes como cadenas, igual que los DecimalField de DRF
+        return Response(
+            {
+                "moneda": moneda,
+                "cotizaciones": [
+                    {
+                        clave: (
+                            str(valor) if isinstance(valor, Decimal) else valor
+                        )
+                        for clave, valor in cotizacion.items()
+                    }
+                    for cotizacion in cotizaciones
+                ],
+                "total": str(sum(c["total"] for c in cotizaciones)),
+            }
+        )
+
+    @action(detail=False, methods=["get"])
+    def exportar(self, request):
+        """
+        Endpoint para descargar los envíos visibles para el usuario en CSV
+        (por defecto) o XLSX (?formato=xlsx). Respeta ?search= y ?ordering=
+        y se genera por streaming, sin límite de filas.
+        """
+        formato = request.query_params.get("formato", "csv")
+        if formato not in FORMATOS:
+            return Response(
+                {"error": f"Formato no soportado: {formato}"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        queryset = self.filter_queryset(
+            self.get_queryset().order_by("-fecha_creacion", "-id")
+        )
+        content_type, extension = FORMATOS[formato]
+        nombre = (
+            f"envios-{request.tenant.slug}-"
+            f"{timezone.localtime():%Y%m%d-%H%M}.{extension}"
+        )
+
+        contenido = exportar(queryset, formato)
+        if isinstance(request._request, ASGIRequest):
+            # Bajo ASGI un iterador síncrono se cargaría entero en memoria
+            contenido = iterar_async(contenido)
+        response = StreamingHttpResponse(contenido, content_type=content_type)
+        response["Content-Disposition"] = f'attachment; filename="{nombre}"'
+        # Enviar cada bloque en cuanto se genera (sin buffering de nginx)
+        response["X-Accel-Buffering"] = "no"
+        return response
+
+    @action(detail=False, methods=["post"])
+    def eventos_ticket(self, request):
+        """
+        Endpoint para obtener un ticket de un solo uso con el que abrir el
+        stream SSE de la empresa (/api/eventos/empresa/?ticket=), ya que
+        EventSource no puede enviar la cabecera Authorization.
+        """
+        ticket = crear_ticket(request.user, request.tenant)
+        return Response(
+            {
+                "ticket": ticket,
+                "url": f"/api/eventos/empresa/?ticket={ticket}",
+                "expira_en": getattr(settings, "EVENTOS_TICKET_SEGUNDOS", 30),
+            }
+        )
+
+    @action(detail=True, methods=["get"])
+    def qr(self, request, pk=None):
+        """
+        Endpoint para obtener el código QR del envío en PNG
+        (?tamano= en píxeles, por defecto 300).
+        """
+        try:
+            tamano = int(request.query_params.get("tamano", 300))
+        except ValueError:
+            tamano = 0
+        if not 50 <= tamano <= 1000:
+            return Response(
+                {"error": "El tamaño debe estar entre 50 y 1000 píxeles"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        envio = self.get_object()
+        return HttpResponse(png_qr(envio, tamano), content_type="image/png")
+
+    @action(detail=True, methods=["get"])
+    def etiqueta(self, request, pk=None):
+        """
+        Endpoint para descargar la etiqueta imprimible del envío en PNG
+        (por defecto) o PDF (?formato=pdf), con ?diseno=etiqueta|a4.
+        """
+        formato = request.query_params.get("formato", "png")
+        diseno = request.query_params.get("diseno", "etiqueta")
+        if formato not in ["png", "pdf"] or diseno not in DISENOS:
+            return Response(
+                {"error": "Formato o diseño no soportado"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        envio = self.get_object()
+        if formato == "pdf":
+            response = HttpResponse(
+                pdf_etiquetas([envio], diseno), content_type="application/pdf"
+            )
+        else:
+            response = HttpResponse(
+                png_etiqueta(envio, diseno), content_type="image/png"
+            )
+        response["Content-Disposition"] = (
+            f'inline; filename="etiqueta-{envio.numero_guia}.{formato}"'
+        )
+        return response
+
+    @action(detail=False, methods=["post"])
+    def etiquetas(self, request):
+        """
+        Endpoint para imprimir las etiquetas de un manifiesto en un solo PDF.
+        Los envíos se identifican por 'numeros_guia' y/o 'ids' y se imprimen
+        en el orden recibido; si alguno no existe no se genera el PDF.
+        """
+        serializer = EtiquetasLoteSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(
+                serializer.errors, status=status.HTTP_400_BAD_REQUEST
+            )
+
+        datos = serializer.validated_data
+        numeros_guia = datos.get("numeros_guia", [])
+        ids = datos.get("ids", [])
+        queryset = self.get_queryset()
+        por_guia = {
+            envio.numero_guia: envio
+            for envio in queryset.filter(numero_guia__in=numeros_guia)
+        }
+        por_id = {envio.id: envio for envio in queryset.filter(id__in=ids)}
+
+        no_encontrados = [g for g in numeros_guia if g not in por_guia] + [
+            i for i in ids if i not in por_id
+        ]
+        if no_encontrados:
+            return Response(
+                {
+                    "error": "Envíos no encontrados",
+                    "no_encontrados": no_encontrados,
+                },
+                status=status.HTTP_404_NOT_FOUND,
+            )
+
+        envios = [por_guia[g] for g in numeros_guia] + [por_id[i] for i in ids]
+        response = HttpResponse(
+            pdf_etiquetas(envios, datos["diseno"]),
+            content_type="application/pdf",
+        )
+        nombre = f"etiquetas-{timezone.localtime():%Y%m%d-%H%M}.pdf"
+        response["Content-Disposition"] = f'attachment; filename="{nombre}"'
+        return response
+
+    @action(detail=False, methods=["get"], url_path="sync")
+    def sincronizar(self, request):
+        """
+        Endpoint de sincronización incremental para la PWA. Devuelve los
+        envíos modificados, el historial nuevo y los envíos eliminados
+        desde ?since=<cursor> (todo, sin cursor), junto con el cursor para
+        la siguiente llamada. Con hay_mas=true hay que volver a llamar
+        enseguida; con reiniciar=true el cliente debe descartar su copia y
+        sincronizar sin cursor.
+        """
+        try:
+            posiciones = leer_cursor(request.query_params.get("since"))
+        except ValueError:
+            return Response(
+                {"error": "Cursor inválido"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if posiciones is not None and cursor_caducado(posiciones):
+            return Response({"reiniciar": True})
+
+        perfil = getattr(request, "perfil_usuario", None)
+        cambios = cambios_desde(
+            {
+                "envios": self.get_queryset(),
+                "historial": Envio.objects.historial_para_perfil(
+                    perfil, empresa=request.tenant
                 )
+                .select_related("registrado_por")
+                .prefetch_related(
+                    prefetch_perfiles_activos(
+                        "registrado_por__perfiles_empresa"
+                    )
+                ),
+                "eliminados": EnvioEliminado.objects.para_perfil(
+                    perfil, empresa=request.tenant
+                ),
+            },
+            posiciones,
+        )
+        return Response(
+            {
+                "cursor": cambios["cursor"],
+                "hay_mas": cambios["hay_mas"],
+                "reiniciar": False,
+                "envios": EnvioListSerializer(
+                    cambios["envios"], many=True
+                ).data,
+                "historial": HistorialEstadoSerializer(
+                    cambios["historial"], many=True
+                ).data,
+                "eliminados": [
+                    {
+                        "id": eliminado.envio_id,
+                        "numero_guia": eliminado.numero_guia,
+                        "fecha": eliminado.fecha,
+                    }
+                    for eliminado in cambios["eliminados"]
+                ],
+            }
+        )
 
-                # Enviar notificaciones por email
-                enviar_notificacion_estado(envio, estado_anterior)
+    @sincronizar.mapping.post
+    def subir_cambios(self, request):
+        """
+        Endpoint para subir las operaciones hechas sin conexión
+        ({"operaciones": [...]}). Se aplican en orden y la respuesta trae,
+        por operación, su resultado y el envío tal como queda en el
+        servidor (también en caso de conflicto).
+        """
+        serializer = SincronizacionSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(
+                serializer.errors, status=status.HTTP_400_BAD_REQUEST
+            )
 
-            # Devolver el envío actualizado
-            return Response(EnvioSerializer(envio).data)
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        def crear(datos, id_cliente):
+            serializer = EnvioSerializer(data=datos)
+            serializer.is_valid(raise_exception=True)
+            self.perform_create(serializer, id_cliente=id_cliente)
+            return serializer.instance
+
+        resultados = aplicar_operaciones(
+            self.get_queryset(),
+            serializer.validated_data["operaciones"],
+            crear,
+            usuario=request.user,
+        )
+        return Response(
+            {
+                "resultados": [
+                    {
+                        **resultado,
+                        "envio": envio and EnvioListSerializer(envio).data,
+                    }
+                    for resultado, envio in resultados
+                ]
+            }
+        )
 
     @action(detail=False, methods=["get"])
     def buscar_por_guia(self, request):
@@ -218,18 +693,28 @@ class EnvioViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_404_NOT_FOUND,
             )
 
-    @action(detail=False, methods=["get"], permission_classes=[AllowAny])
+    def _etag_rastreo(self, request, valor):
+        """
+        ETag del rastreo para el renderer negociado: JSON y MessagePack
+        son cuerpos distintos y no pueden compartir un ETag fuerte.
+        """
+        return quote_etag(f"{valor}-{request.accepted_renderer.format}")
+
+    @action(
+        detail=False,
+        methods=["get"],
+        permission_classes=[AllowAny],
+        throttle_classes=[
+            PublicoIPRafagaThrottle,
+            PublicoIPThrottle,
+            RastreoGuiaThrottle,
+        ],
+    )
     def rastrear(self, request):
         """
         Endpoint público para rastrear un envío por su número de guía
-        Se implementa rate limiting para prevenir abusos
+        Rate limiting por IP (sostenido y ráfaga) y por número de guía
         """
-        # Verificar si hay demasiadas peticiones desde la misma IP
-        ip = self.get_client_ip(request)
-
-        # En una implementación real usaríamos un sistema de caché como Redis
-        # para limitar las peticiones por IP
-
         numero_guia = request.query_params.get("numero_guia", None)
 
         if not numero_guia:
@@ -241,29 +726,10 @@ class EnvioViewSet(viewsets.ModelViewSet):
         # Sanitizar la entrada para evitar posibles inyecciones
         numero_guia = numero_guia.strip()[:50]  # Limitar longitud
 
-        try:
-            # Para el rastreo público, buscar en todas las empresas
-            envio = Envio.objects.get(numero_guia=numero_guia)
-            # Usar un serializer simplificado que solo incluye la información pública
-            data = {
-                "numero_guia": envio.numero_guia,
-                "estado": envio.estado_actual,
-                "estado_display": envio.get_estado_actual_display(),
-                "remitente_nombre": envio.remitente_nombre,
-                "destinatario_nombre": envio.destinatario_nombre,
-                "fecha_actualizacion": envio.ultima_actualizacion,
-                "historial": [
-                    {
-                        "estado": h.estado,
-                        "fecha": h.fecha,
-                        "comentario": h.comentario,
-                        "ubicacion": h.ubicacion,
-                    }
-                    for h in envio.historial.all().order_by("-fecha")
-                ],
-            }
-            return Response(data)
-        except Envio.DoesNotExist:
+        # Snapshot ya serializado (caché + tabla): una sola búsqueda por
+        # clave, y las peticiones condicionales se responden con 304
+        snapshot = obtener_snapshot(numero_guia)
+        if snapshot is None:
             return Response(
                 {
                     "error": "No se encontró ningún envío con ese número de guía"
@@ -271,7 +737,118 @@ class EnvioViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_404_NOT_FOUND,
             )
 
-    @action(detail=False, methods=["get"], permission_classes=[AllowAny])
+        etag = self._etag_rastreo(request, snapshot["etag"])
+        last_modified = int(snapshot["last_modified"])
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if response is None:
+            response = Response(snapshot["datos"])
+
+        # Cabeceras para caché en el cliente y en nginx
+        response["ETag"] = etag
+        response["Last-Modified"] = http_date(last_modified)
+        patch_vary_headers(response, ("Accept",))
+        patch_cache_control(
+            response,
+            public=True,
+            max_age=getattr(settings, "RASTREO_CACHE_MAX_AGE", 30),
+        )
+        return response
+
+    @action(
+        detail=False,
+        methods=["get"],
+        permission_classes=[AllowAny],
+        throttle_classes=[
+            PublicoIPRafagaThrottle,
+            PublicoIPThrottle,
+            RastreoGuiaThrottle,
+        ],
+    )
+    def rastrear_lote(self, request):
+        """
+        Endpoint público para rastrear varios envíos en una sola petición
+        (?numeros_guia=A,B,C). Devuelve un resultado por guía, en el orden
+        pedido, con encontrado=False para las que no existen.
+        Cada guía cuenta para los mismos límites que el rastreo individual
+        """
+        numeros_guia = guias_rastreo(request)
+        maximo = max_guias_lote()
+
+        if not numeros_guia:
+            return Response(
+                {"error": "Se requiere el parámetro numeros_guia"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if len(numeros_guia) > maximo:
+            return Response(
+                {
+                    "error": f"No se pueden rastrear más de {maximo} guías a la vez"
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        snapshots = obtener_snapshots(numeros_guia)
+        resultados = []
+        for numero_guia in numeros_guia:
+            snapshot = snapshots.get(numero_guia)
+            if snapshot is None:
+                resultados.append(
+                    {
+                        "numero_guia": numero_guia,
+                        "encontrado": False,
+                        "error": "No se encontró ningún envío con ese número de guía",
+                    }
+                )
+            else:
+                resultados.append({**snapshot["datos"], "encontrado": True})
+
+        # ETag del conjunto: cambia si cambia cualquiera de las guías
+        etag = self._etag_rastreo(
+            request,
+            hashlib.md5(
+                "|".join(
+                    (
+                        f"{numero}:{snapshots[numero]['etag']}"
+                        if numero in snapshots
+                        else f"{numero}:-"
+                    )
+                    for numero in numeros_guia
+                ).encode("utf-8")
+            ).hexdigest(),
+        )
+        # Sin Last-Modified si falta alguna guía: su alta no lo cambiaría
+        last_modified = None
+        if len(snapshots) == len(numeros_guia):
+            last_modified = int(
+                max(s["last_modified"] for s in snapshots.values())
+            )
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if response is None:
+            response = Response(
+                {"encontrados": len(snapshots), "resultados": resultados}
+            )
+
+        response["ETag"] = etag
+        if last_modified:
+            response["Last-Modified"] = http_date(last_modified)
+        patch_vary_headers(response, ("Accept",))
+        patch_cache_control(
+            response,
+            public=True,
+            max_age=getattr(settings, "RASTREO_CACHE_MAX_AGE", 30),
+        )
+        return response
+
+    @action(
+        detail=False,
+        methods=["get"],
+        permission_classes=[AllowAny],
+        throttle_classes=[PublicoIPRafagaThrottle, PublicoIPThrottle],
+    )
     def buscar_por_remitente(self, request):
         """
         Endpoint público para buscar envíos por nombre del remitente
@@ -290,10 +867,10 @@ class EnvioViewSet(viewsets.ModelViewSet):
         nombre_remitente = nombre_remitente.strip()[:100]
 
         try:
-            # Buscar envíos que contengan el nombre del remitente (búsqueda parcial)
-            envios = Envio.objects.filter(
-                remitente_nombre__icontains=nombre_remitente
-            ).order_by("-fecha_creacion")[
+            # Buscar envíos por nombre del remitente (full-text por prefijo)
+            envios = buscar_envios(
+                Envio.objects.all(), nombre_remitente, pesos=PESO_REMITENTE
+            )[
                 :10
             ]  # Limitar a 10 resultados
 
@@ -327,7 +904,12 @@ class EnvioViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR,
             )
 
-    @action(detail=False, methods=["get"], permission_classes=[AllowAny])
+    @action(
+        detail=False,
+        methods=["get"],
+        permission_classes=[AllowAny],
+        throttle_classes=[PublicoIPRafagaThrottle, PublicoIPThrottle],
+    )
     def buscar_por_destinatario(self, request):
         """
         Endpoint público para buscar envíos por nombre del destinatario
@@ -346,10 +928,12 @@ class EnvioViewSet(viewsets.ModelViewSet):
         nombre_destinatario = nombre_destinatario.strip()[:100]
 
         try:
-            # Buscar envíos que contengan el nombre del destinatario (búsqueda parcial)
-            envios = Envio.objects.filter(
-                destinatario_nombre__icontains=nombre_destinatario
-            ).order_by("-fecha_creacion")[
+            # Buscar envíos por nombre del destinatario (full-text por prefijo)
+            envios = buscar_envios(
+                Envio.objects.all(),
+                nombre_destinatario,
+                pesos=PESO_DESTINATARIO,
+            )[
                 :10
             ]  # Limitar a 10 resultados
 
@@ -393,6 +977,7 @@ class HistorialEstadoViewSet(viewsets.ReadOnlyModelViewSet):
         HistorialEstado.objects.all()
     )  # Queryset base (será filtrado por get_queryset)
     serializer_class = HistorialEstadoSerializer
+    pagination_class = HistorialPagination
 
     def get_permissions(self):
         """
@@ -412,31 +997,18 @@ class HistorialEstadoViewSet(viewsets.ReadOnlyModelViewSet):
         if not hasattr(self.request, "tenant") or not self.request.tenant:
             return HistorialEstado.objects.none()
 
-        # Filtrar historial de envíos de la empresa actual
-        queryset = HistorialEstado.objects.filter(
-            envio__empresa=self.request.tenant
+        # Historial de la empresa actual visible para el rol del usuario
+        # (mismas restricciones que EnvioViewSet)
+        perfil = getattr(self.request, "perfil_usuario", None)
+        queryset = Envio.objects.historial_para_perfil(
+            perfil, empresa=self.request.tenant
         )
-
-        # Aplicar filtrado por rol del usuario (igual que en EnvioViewSet)
-        if (
-            hasattr(self.request, "perfil_usuario")
-            and self.request.perfil_usuario
-        ):
-            perfil = self.request.perfil_usuario
-
-            if perfil.es_dueno or perfil.puede_gestionar_envios:
-                # Dueño y operadores ven todo el historial
-                pass
-            elif perfil.rol == "remitente":
-                # Remitentes solo ven historial de envíos que han enviado
-                queryset = queryset.filter(
-                    envio__remitente_telefono=perfil.telefono
-                )
-            elif perfil.rol == "destinatario":
-                # Destinatarios solo ven historial de envíos dirigidos a ellos
-                queryset = queryset.filter(
-                    envio__destinatario_telefono=perfil.telefono
-                )
+        if campo_incluido(self.request, "registrado_por"):
+            queryset = queryset.select_related(
+                "registrado_por"
+            ).prefetch_related(
+                prefetch_perfiles_activos("registrado_por__perfiles_empresa")
+            )
 
         # Permitir filtrar por envío específico
         envio_id = self.request.query_params.get("envio", None)
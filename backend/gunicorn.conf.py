@@ -0,0 +1,35 @@
+"""
+Configuración de gunicorn (se carga sola desde el directorio de trabajo).
+
+Sirve config.asgi:application con workers de uvicorn: los streams SSE de
+/api/eventos/ (envios.sse) solo funcionan en ASGI.
+
+Activa el modo multiproceso de prometheus_client: cada worker escribe sus
+métricas en PROMETHEUS_MULTIPROC_DIR y /api/metrics agrega las de todos.
+El directorio se vacía al arrancar para no mezclar datos de ejecuciones
+anteriores.
+"""
+
+import os
+import shutil
+import tempfile
+
+worker_class = "uvicorn.workers.UvicornWorker"
+
+DIRECTORIO_METRICAS = os.environ.setdefault(
+    "PROMETHEUS_MULTIPROC_DIR",
+    os.path.join(tempfile.gettempdir(), "packfy-metricas"),
+)
+
+
+def on_starting(server):
+    shutil.rmtree(DIRECTORIO_METRICAS, ignore_errors=True)
+    os.makedirs(DIRECTORIO_METRICAS, exist_ok=True)
+
+
+def child_exit(server, worker):
+    try:
+        from prometheus_client import multiprocess
+    except ImportError:
+        return
+    multiprocess.mark_process_dead(worker.pid)
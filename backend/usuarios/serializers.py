@@ -1,8 +1,29 @@
+from core.campos import CamposDinamicosMixin
+from django.db.models import Prefetch
 from rest_framework import serializers
 
 from .models import Usuario
 
 
+def prefetch_perfiles_activos(lookup="perfiles_empresa"):
+    """
+    Prefetch de los perfiles activos que consume UsuarioSerializer.
+
+    Uso: queryset.prefetch_related(
+        prefetch_perfiles_activos("creado_por__perfiles_empresa")
+    )
+    """
+    from empresas.models import PerfilUsuario
+
+    return Prefetch(
+        lookup,
+        queryset=PerfilUsuario.objects.filter(
+            activo=True, empresa__activo=True
+        ).select_related("empresa"),
+        to_attr="perfiles_activos",
+    )
+
+
 class EmpresaBasicaSerializer(serializers.Serializer):
     """Serializer simplificado para empresas en el contexto de usuario"""
 
@@ -94,7 +115,7 @@ class PerfilEmpresaSerializer(serializers.Serializer):
     activo = serializers.BooleanField()
 
 
-class UsuarioSerializer(serializers.ModelSerializer):
+class UsuarioSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     """
     Serializer para el modelo de Usuario
     """
@@ -132,9 +153,12 @@ class UsuarioSerializer(serializers.ModelSerializer):
 
     def get_empresas(self, obj):
         """Obtener todas las empresas del usuario con su rol"""
-        perfiles = obj.perfiles_empresa.filter(
-            activo=True, empresa__activo=True
-        ).select_related("empresa")
+        # Usar los perfiles precargados con prefetch_perfiles_activos
+        perfiles = getattr(obj, "perfiles_activos", None)
+        if perfiles is None:
+            perfiles = obj.perfiles_empresa.filter(
+                activo=True, empresa__activo=True
+            ).select_related("empresa")
         return [
             {
                 "id": perfil.empresa.id,
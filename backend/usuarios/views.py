@@ -1,3 +1,4 @@
+from core.campos import campo_incluido
 from empresas.models import PerfilUsuario
 from empresas.permissions import TenantPermission
 from rest_framework import permissions, viewsets
@@ -6,7 +7,11 @@ from rest_framework.response import Response
 
 from .models import Usuario
 from .permissions import EsAdministrador, EsCreadorOAdministrador
-from .serializers import UsuarioMeSerializer, UsuarioSerializer
+from .serializers import (
+    UsuarioMeSerializer,
+    UsuarioSerializer,
+    prefetch_perfiles_activos,
+)
 
 
 class UsuarioViewSet(viewsets.ModelViewSet):
@@ -50,6 +55,7 @@ class UsuarioViewSet(viewsets.ModelViewSet):
         """
         Filtra los usuarios por empresa actual (multi-tenant):
         - Solo muestra usuarios que pertenecen a la empresa del contexto
+        - Precarga sus perfiles si la respuesta incluye 'empresas'
         """
         # Si no hay empresa en el contexto, devolver queryset vacío
         if not hasattr(self.request, "tenant") or not self.request.tenant:
@@ -60,7 +66,10 @@ class UsuarioViewSet(viewsets.ModelViewSet):
             empresa=self.request.tenant, activo=True
         ).values_list("usuario_id", flat=True)
 
-        return Usuario.objects.filter(id__in=usuarios_empresa)
+        queryset = Usuario.objects.filter(id__in=usuarios_empresa)
+        if campo_incluido(self.request, "empresas"):
+            queryset = queryset.prefetch_related(prefetch_perfiles_activos())
+        return queryset
 
     @action(detail=False, methods=["get"])
     def me(self, request):
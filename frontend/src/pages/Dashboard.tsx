@@ -29,8 +29,10 @@ const formatearFechaSafe = (fecha: string | null | undefined): string => {
   }
 };
 
+// Con ?page= la API pagina por número de página e incluye 'count'; sin él
+// usa cursores (next/previous) y solo lo incluye con ?count=exacto
 interface PaginatedResponse {
-  count: number;
+  count?: number;
   next: string | null;
   previous: string | null;
   results: Envio[];
@@ -162,8 +164,9 @@ const Dashboard: React.FC = () => {
         }
 
         setEnvios(data.results);
-        setTotalItems(data.count);
-        setTotalPages(Math.ceil(data.count / pageSize));
+        const total = data.count ?? data.results.length;
+        setTotalItems(total);
+        setTotalPages(Math.ceil(total / pageSize));
       } catch (fetchError: any) {
         clearTimeout(timeout);
         throw fetchError;
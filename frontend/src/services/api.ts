@@ -181,6 +181,7 @@ class PackfyApiClient {
 
   // Métodos de envíos
   async getEnvios(page = 1, pageSize = 10, filters?: any) {
+    // ?page= mantiene la paginación por número de página con 'count'
     let url = `/envios/?page=${page}&page_size=${pageSize}`;
     if (filters) {
       const queryParams = new URLSearchParams(filters).toString();